@@ -0,0 +1,364 @@
+"""
+End-to-end load and latency benchmark for the simulator -> ingestor -> Redis -> API pipeline.
+
+Starts the simulator, the ingestor (in simulation mode) and the API as local processes,
+connects N concurrent SSE clients, replays a feed through the simulator once and reports:
+
+- feed and delivery throughput,
+- p50/p90/p99 latency from the ingestor publishing an event to a client receiving it,
+  measured with the event id, which is the publish time in milliseconds,
+- Redis commands per second over the run,
+- API resident memory, at idle and per connected client.
+
+Without --log, the feed is the simulator's output.log if present, or else a synthetic
+session generated from --seed, so runs with the same arguments replay the same feed.
+The clients share one event loop, so with many clients compare runs on the same machine
+and the same arguments only.
+
+Requires a Redis server at --redis-url. The benchmark deletes the ingestor's live keys in it.
+
+Usage: python benchmarks/pipeline_load.py [--log path/to/output.log] [--clients N]
+                                          [--speed X|max] [--json report.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+import redis
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+SERVICES_DIR = BACKEND_DIR / "services"
+DEFAULT_LOG = SERVICES_DIR / "simulator" / "output.log"
+
+# The live session pointer and the live keys of every session, see common/sessions.py.
+INGESTOR_KEY_PATTERNS = ["CurrentSession", "session:*"]
+SIMULATION_FINISHED = "Simulator: Finished sending all data"
+DRIVER_NUMBERS = ["1", "4", "10", "11", "14", "16", "18", "20", "22", "23", "24", "27", "31", "44", "55", "63", "77", "81", "2", "3"]
+
+
+def generate_feed(path: Path, messages: int, seed: int):
+    """Writes a synthetic session: the initial state, then timing, heartbeat and weather updates."""
+    rng = random.Random(seed)
+    lines = {
+        number: {"NumberOfLaps": 0, "Position": str(i + 1), "GapToLeader": "", "InPit": False,
+                 "Sectors": [{"Value": ""}, {"Value": ""}, {"Value": ""}], "LastLapTime": {"Value": ""}}
+        for i, number in enumerate(DRIVER_NUMBERS)
+    }
+    initial = {
+        "DriverList": {number: {"RacingNumber": number, "Tla": f"D{number:0>2}", "TeamName": "Team"} for number in DRIVER_NUMBERS},
+        "TimingData": {"Lines": lines},
+        "LapCount": {"CurrentLap": 1, "TotalLaps": 70},
+        "TrackStatus": {"Status": "1", "Message": "AllClear"},
+        "SessionInfo": {"Meeting": {"Name": "Benchmark Grand Prix"}, "Type": "Race"},
+        "WeatherData": {"AirTemp": "24.0", "TrackTemp": "38.0", "Rainfall": "0"},
+    }
+
+    sectors = {number: 0 for number in DRIVER_NUMBERS}
+    laps = {number: 0 for number in DRIVER_NUMBERS}
+    # One message every 10ms of recorded time.
+    with open(path, "w") as f:
+        f.write(json.dumps({"R": initial}) + "\n")
+        for i in range(messages - 1):
+            timestamp = f"2024-05-26T13:{i // 6000 % 60:02d}:{i // 100 % 60:02d}.{i % 100:02d}0Z"
+            if i % 50 == 0:
+                update = ["Heartbeat", {"Utc": timestamp}]
+            elif i % 200 == 1:
+                update = ["WeatherData", {"TrackTemp": f"{rng.uniform(35, 45):.1f}"}]
+            else:
+                number = rng.choice(DRIVER_NUMBERS)
+                sector = sectors[number]
+                sectors[number] = (sector + 1) % 3
+                driver = {"Sectors": {str(sector): {"Value": f"{rng.uniform(25, 35):.3f}"}},
+                          "GapToLeader": f"+{rng.uniform(0, 60):.3f}"}
+                if sector == 2:
+                    laps[number] += 1
+                    driver["NumberOfLaps"] = laps[number]
+                    driver["LastLapTime"] = {"Value": f"1:{rng.uniform(30, 35):06.3f}"}
+                update = ["TimingData", {"Lines": {number: driver}}]
+            f.write(json.dumps({"M": [{"H": "Streaming", "M": "feed", "A": [*update, timestamp]}]}) + "\n")
+
+
+def count_messages(path: Path) -> int:
+    with open(path, "r") as f:
+        return sum(1 for line in f if line.strip())
+
+
+def rss_bytes(pid: int) -> int | None:
+    """The resident memory of a process, on Linux."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def percentile(values: list[float], p: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * p / 100), len(values) - 1)]
+
+
+async def start_process(args, cwd: Path, env: dict, capture=False):
+    return await asyncio.create_subprocess_exec(
+        *args, cwd=cwd, env={**os.environ, "PYTHONUNBUFFERED": "1", **env},
+        stdout=subprocess.PIPE if capture else subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+async def stop_process(process):
+    if process.returncode is None:
+        process.terminate()
+        try:
+            await asyncio.wait_for(process.wait(), 10)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+
+
+async def wait_until_ready(url: str, timeout: float = 20):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not start within {timeout}s")
+
+
+class Clients:
+    """N concurrent SSE clients, recording the delivery latency of every event published after `since_ms`."""
+
+    def __init__(self, url: str, count: int, since_ms: int):
+        self._url = url
+        self._count = count
+        self._since_ms = since_ms
+        self.latencies: list[float] = []
+        self.delivered = 0
+        self.event_ids: set[str] = set()
+        self.errors = 0
+        self.connected = 0
+        self.last_received = time.monotonic()
+        self._all_connected = asyncio.Event()
+        self._tasks = []
+
+    async def start(self):
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(None, connect=10),
+            limits=httpx.Limits(max_connections=self._count + 10, max_keepalive_connections=0),
+        )
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self._count)]
+        await asyncio.wait_for(self._all_connected.wait(), 60)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self._client.aclose()
+
+    async def _run(self):
+        try:
+            async with self._client.stream("GET", self._url) as response:
+                self.connected += 1
+                if self.connected == self._count:
+                    self._all_connected.set()
+                async for line in response.aiter_lines():
+                    if not line.startswith("id: "):
+                        continue
+                    received_ms = time.time() * 1000
+                    event_id = line[4:]
+                    published_ms = int(event_id.partition("-")[0])
+                    if published_ms < self._since_ms:
+                        continue
+                    self.latencies.append(received_ms - published_ms)
+                    self.delivered += 1
+                    self.event_ids.add(event_id)
+                    self.last_received = time.monotonic()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.errors += 1
+            print(f"SSE client error: {e!r}")
+
+
+def redis_commands(client) -> int | None:
+    """The number of commands the server has processed, if it reports its stats."""
+    try:
+        return int(client.info("stats")["total_commands_processed"])
+    except (redis.ResponseError, KeyError):
+        return None
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args, log: Path, seed: int | None) -> dict:
+    redis_client = redis.Redis.from_url(args.redis_url)
+    redis_client.ping()
+    for pattern in INGESTOR_KEY_PATTERNS:
+        for key in redis_client.scan_iter(match=pattern):
+            redis_client.delete(key)
+
+    env = {"REDIS_URL": args.redis_url}
+    python = sys.executable
+    api = await start_process(
+        [python, "-m", "uvicorn", "main:app", "--port", str(args.api_port), "--log-level", "warning"],
+        SERVICES_DIR / "api", env,
+    )
+    simulator = await start_process(
+        [python, "-m", "uvicorn", "main:app", "--port", str(args.simulator_port), "--log-level", "warning"],
+        SERVICES_DIR / "simulator",
+        {"SIMULATOR_DATA_FILE": str(log), "SIMULATOR_SPEED": args.speed},
+        capture=True,
+    )
+    ingestor = None
+    clients = None
+    try:
+        api_url = f"http://127.0.0.1:{args.api_port}"
+        await wait_until_ready(f"{api_url}/snapshot")
+        await wait_until_ready(f"http://127.0.0.1:{args.simulator_port}/docs")
+
+        rss_idle = rss_bytes(api.pid)
+        clients = Clients(f"{api_url}/f1-stream/", args.clients, int(time.time() * 1000))
+        await clients.start()
+        await asyncio.sleep(1)
+        rss_connected = rss_bytes(api.pid)
+        print(f"{args.clients} SSE clients connected.")
+
+        commands_before = redis_commands(redis_client)
+        started = time.monotonic()
+        ingestor = await start_process(
+            [python, "live.py"], SERVICES_DIR / "ingestor",
+            {**env, "SIMULATION": "true", "F1_SIMULATOR_WEBSOCKET_URL": f"ws://127.0.0.1:{args.simulator_port}/ws/f1-data"},
+        )
+
+        async def simulation_finished():
+            async for line in simulator.stdout:
+                if line.decode("utf-8", "replace").startswith(SIMULATION_FINISHED):
+                    return
+
+        try:
+            await asyncio.wait_for(simulation_finished(), args.timeout)
+        except asyncio.TimeoutError:
+            print(f"Feed not finished after {args.timeout}s, reporting what was delivered so far.")
+        feed_finished = time.monotonic()
+        # Stop the simulator so the ingestor cannot reconnect and replay the feed again,
+        # then let it work through its backlog.
+        await stop_process(simulator)
+        while time.monotonic() - clients.last_received < args.idle:
+            await asyncio.sleep(0.1)
+        elapsed = clients.last_received - started
+        drain = max(clients.last_received - feed_finished, 0)
+        commands_after = redis_commands(redis_client)
+        commands = commands_after - commands_before if commands_before is not None and commands_after is not None else None
+    finally:
+        if clients:
+            await clients.stop()
+        for process in (ingestor, simulator, api):
+            if process:
+                await stop_process(process)
+        redis_client.close()
+
+    latencies = clients.latencies
+    return {
+        "revision": git_revision(),
+        "config": {
+            "log": str(log), "clients": args.clients, "speed": args.speed,
+            "seed": seed,
+            "ingestor_env": {key: os.environ[key] for key in sorted(os.environ) if key in (
+                "COALESCE_WINDOW_MS", "KEYFRAME_INTERVAL", "CHECKPOINT_INTERVAL", "STORAGE_CODEC", "JSON_CODEC")},
+        },
+        "feed_messages": count_messages(log),
+        "events_published": len(clients.event_ids),
+        "events_delivered": clients.delivered,
+        "client_errors": clients.errors,
+        "duration_s": elapsed,
+        # Time from the simulator sending its last message to the last delivery, which grows
+        # when the ingestor or the API falls behind the feed.
+        "drain_s": drain,
+        "events_per_s": len(clients.event_ids) / elapsed if elapsed > 0 else None,
+        "deliveries_per_s": clients.delivered / elapsed if elapsed > 0 else None,
+        "latency_ms": {
+            "p50": percentile(latencies, 50), "p90": percentile(latencies, 90),
+            "p99": percentile(latencies, 99), "max": max(latencies) if latencies else None,
+            "mean": statistics.fmean(latencies) if latencies else None,
+        },
+        "redis_ops_per_s": commands / elapsed if commands is not None and elapsed > 0 else None,
+        "api_rss_idle_bytes": rss_idle,
+        "api_rss_per_client_bytes": (rss_connected - rss_idle) / args.clients if rss_idle and rss_connected else None,
+    }
+
+
+def print_report(report: dict):
+    def number(value, fmt):
+        return "n/a" if value is None else format(value, fmt)
+
+    latency = report["latency_ms"]
+    expected = report["events_published"] * report["config"]["clients"]
+    print(f"Revision:            {report['revision'] or 'unknown'}")
+    print(f"Feed:                {report['feed_messages']} messages, replayed at speed {report['config']['speed']}")
+    print(f"Events published:    {report['events_published']} ({number(report['events_per_s'], ',.0f')}/s)")
+    print(f"Events delivered:    {report['events_delivered']} of {expected} ({number(report['deliveries_per_s'], ',.0f')}/s)")
+    print(f"Duration:            {report['duration_s']:.1f}s, {report['drain_s']:.2f}s after the feed finished")
+    print(f"Client errors:       {report['client_errors']}")
+    print(f"Latency (ms):        p50 {number(latency['p50'], '.1f')}, p90 {number(latency['p90'], '.1f')}, "
+          f"p99 {number(latency['p99'], '.1f')}, max {number(latency['max'], '.1f')}")
+    print(f"Redis:               {number(report['redis_ops_per_s'], ',.0f')} commands/s")
+    idle, per_client = report["api_rss_idle_bytes"], report["api_rss_per_client_bytes"]
+    print(f"API memory:          {number(idle and idle / 1e6, '.1f')} MB idle, "
+          f"{number(per_client and per_client / 1e3, '.1f')} KB per client")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--log", type=Path, help="recorded feed to replay (default: output.log, or a synthetic feed)")
+    parser.add_argument("--messages", type=int, default=5000, help="length of the synthetic feed")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--speed", default="2", help="replay speed, a multiplier of the recorded timing or 'max'")
+    parser.add_argument("--redis-url", default=os.getenv("REDIS_URL", "redis://localhost:6379"))
+    parser.add_argument("--api-port", type=int, default=18000)
+    parser.add_argument("--simulator-port", type=int, default=18001)
+    parser.add_argument("--timeout", type=float, default=600, help="maximum seconds to wait for the feed to finish")
+    parser.add_argument("--idle", type=float, default=2, help="seconds without events after which delivery is complete")
+    parser.add_argument("--json", type=Path, help="also write the report to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log, seed = args.log, None
+        if log is None:
+            if DEFAULT_LOG.exists():
+                log = DEFAULT_LOG
+            else:
+                log, seed = Path(tmp) / "synthetic.log", args.seed
+                generate_feed(log, args.messages, seed)
+                print(f"No recorded feed at {DEFAULT_LOG}, generated {args.messages} messages with seed {seed}.")
+        report = asyncio.run(run(args, log, seed))
+
+    print_report(report)
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Correctness and throughput benchmark for the SignalR message decoder.
+
+Decodes a recorded feed (the simulator's output.log by default) with both the legacy
+fix_json + json.loads approach and signalr_json.loads, reports where they disagree and
+how fast each one is. A handful of built-in edge cases is always included.
+
+Recorded logs use Python literal syntax, which the decoder rewrites as JSON before decoding
+it. Most literal messages are rewritten with a few string operations and decode faster than
+with the legacy approach, but those with double-quoted strings or escapes take a Python call
+per string: on the built-in edge cases alone, where they are common, both decode at about the
+same rate. Pass --json to re-encode the corpus as JSON first, as the live feed delivers it.
+
+Usage: python benchmarks/signalr_decode.py [path/to/output.log] [--repeat N] [--json]
+"""
+import argparse
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR / "services" / "ingestor"))
+
+import signalr_json  # noqa: E402
+
+DEFAULT_LOG = BACKEND_DIR / "services" / "simulator" / "output.log"
+
+# Messages that the legacy approach decodes incorrectly or not at all.
+EDGE_CASES = [
+    """{'M': [{'A': ['RaceControlMessages', {'Messages': {'12': {'Message': "CAR 5 (O'WARD) TIME 1:12.345 DELETED", 'Category': 'Other'}}}, '2024-05-26T13:01:02.000Z']}]}""",
+    """{'M': [{'A': ['DriverList', {'5': {'FullName': 'Trueman FALSEY', 'Tla': 'TRU'}}, '2024-05-26T13:01:02.000Z']}]}""",
+    """{'M': [{'A': ['TimingData', {'Lines': {'1': {'InPit': False, 'PitOut': True, 'GapToLeader': '+1.234'}}}, '2024-05-26T13:01:02.000Z']}]}""",
+    """{"M": [{"A": ["RaceControlMessages", {"Messages": {"3": {"Message": "DRIVER'S LAP TIME DELETED"}}}, "2024-05-26T13:01:02.000Z"]}]}""",
+    """{'R': {'SessionInfo': {'Meeting': {'Name': 'Grand Prix de Monaco', 'Location': 'Monte-Carlo'}, 'Type': 'Race', 'Number': None}}}""",
+]
+
+
+def fix_json(elem):
+    """The ingestor's previous clean-up of non-compliant messages, kept for comparison."""
+    elem = elem.replace("'", '"').replace('True', 'true').replace('False', 'false')
+    elem = re.sub(r'(\w)"(\w)', r'\1\\"\2', elem)
+    return elem
+
+
+def legacy_loads(message):
+    return json.loads(fix_json(message))
+
+
+def load_corpus(path: Path) -> list[str]:
+    corpus = list(EDGE_CASES)
+    if path.exists():
+        with open(path, "r") as f:
+            corpus.extend(line.strip() for line in f if line.strip())
+    else:
+        print(f"No recorded feed at {path}, using the built-in edge cases only.")
+    return corpus
+
+
+def decode_all(decoder, corpus):
+    results = []
+    for message in corpus:
+        try:
+            results.append(decoder(message))
+        except ValueError as e:
+            results.append(e)
+    return results
+
+
+def time_decoder(decoder, corpus, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        decode_all(decoder, corpus)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("log", nargs="?", type=Path, default=DEFAULT_LOG)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="re-encode the corpus as JSON before decoding")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.log)
+    if args.json:
+        corpus = [json.dumps(signalr_json.loads(message)) for message in corpus]
+    total_bytes = sum(len(message.encode("utf-8")) for message in corpus)
+    print(f"Corpus: {len(corpus)} messages, {total_bytes / 1e6:.2f} MB")
+
+    legacy_results = decode_all(legacy_loads, corpus)
+    new_results = decode_all(signalr_json.loads, corpus)
+
+    legacy_failures = sum(isinstance(r, ValueError) for r in legacy_results)
+    new_failures = sum(isinstance(r, ValueError) for r in new_results)
+    differences = [
+        (message, legacy, new) for message, legacy, new in zip(corpus, legacy_results, new_results)
+        if not isinstance(legacy, ValueError) and not isinstance(new, ValueError) and legacy != new
+    ]
+
+    print(f"Decode failures: legacy {legacy_failures}, signalr_json {new_failures}")
+    print(f"Messages decoded differently: {len(differences)}")
+    for message, legacy, new in differences[:5]:
+        print(f"  message: {message[:160]}")
+        print(f"    legacy:       {str(legacy)[:160]}")
+        print(f"    signalr_json: {str(new)[:160]}")
+
+    for name, decoder in (("legacy", legacy_loads), ("signalr_json", signalr_json.loads)):
+        elapsed = time_decoder(decoder, corpus, args.repeat)
+        messages_per_second = len(corpus) * args.repeat / elapsed
+        megabytes_per_second = total_bytes * args.repeat / elapsed / 1e6
+        print(f"{name:>12}: {messages_per_second:,.0f} msg/s, {megabytes_per_second:.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
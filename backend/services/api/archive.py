@@ -0,0 +1,91 @@
+import asyncio
+import bisect
+import gzip
+from collections import OrderedDict
+from functools import cached_property
+
+from common import codec, sessions
+
+
+class Archive:
+    """
+    A finished session as stored by the ingestor. The tables are decompressed once, on first use.
+    """
+
+    def __init__(self, session_id: str, fields: dict[bytes, bytes]):
+        self.id = session_id
+        self.raw_meta = fields[b"meta"]
+        self.meta = codec.loads(self.raw_meta)
+        self.etag = f'"{session_id}-{self.meta["version"]}"'
+        self.gzip_snapshot = fields[b"snapshot"]
+        self._gzip_laps = fields[b"laps"]
+        self._gzip_timing = fields[b"timing"]
+
+    @cached_property
+    def snapshot(self) -> bytes:
+        return gzip.decompress(self.gzip_snapshot)
+
+    @cached_property
+    def laps(self) -> dict[str, list]:
+        return codec.loads(gzip.decompress(self._gzip_laps))
+
+    @cached_property
+    def timing(self) -> dict[str, list]:
+        return codec.loads(gzip.decompress(self._gzip_timing))
+
+    @cached_property
+    def _lap_numbers(self) -> list[int]:
+        # The table is sorted with missing lap numbers as 0, and they are stored as None.
+        return [lap_number or 0 for lap_number in self.laps["LapNumber"]]
+
+    def lap_range(self, from_lap: int | None, to_lap: int | None, drivers: set[str] | None) -> dict[str, list]:
+        """The rows of the lap table within the lap range, optionally only those of some drivers."""
+        lap_numbers = self._lap_numbers
+        start = bisect.bisect_left(lap_numbers, from_lap) if from_lap is not None else 0
+        end = bisect.bisect_right(lap_numbers, to_lap) if to_lap is not None else len(lap_numbers)
+        rows = range(start, end)
+        if drivers:
+            racing_numbers = self.laps["RacingNumber"]
+            rows = [i for i in rows if racing_numbers[i] in drivers]
+        return {column: [values[i] for i in rows] for column, values in self.laps.items()}
+
+
+class ArchiveCache:
+    """
+    Keeps the most recently used archives in memory. An archive is only reloaded when its
+    metadata changed, i.e. when the session was archived again.
+    """
+
+    def __init__(self, redis_client, size: int):
+        self._redis_client = redis_client
+        self._size = size
+        self._archives: OrderedDict[str, Archive] = OrderedDict()
+        self._lock = asyncio.Lock()
+
+    async def get(self, session_id: str) -> Archive | None:
+        async with self._lock:
+            meta = await self._redis_client.hget(sessions.archive_key(session_id), "meta")
+            if meta is None:
+                self._archives.pop(session_id, None)
+                return None
+            archive = self._archives.get(session_id)
+            if archive is None or archive.raw_meta != meta:
+                fields = await self._redis_client.hgetall(sessions.archive_key(session_id))
+                if not fields:
+                    return None
+                archive = self._archives[session_id] = Archive(session_id, fields)
+                if len(self._archives) > self._size:
+                    self._archives.popitem(last=False)
+            self._archives.move_to_end(session_id)
+            return archive
+
+    async def list(self) -> list[dict]:
+        """The metadata of every archived session, the most recently archived first."""
+        session_ids = [session_id.decode('utf-8') for session_id in await self._redis_client.zrevrange(sessions.SESSIONS_KEY, 0, -1)]
+        if not session_ids:
+            return []
+        async with self._redis_client.pipeline(transaction=False) as pipe:
+            for session_id in session_ids:
+                pipe.hget(sessions.archive_key(session_id), "meta")
+            metas = await pipe.execute()
+        return [codec.loads(meta) for meta in metas if meta]
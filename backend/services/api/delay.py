@@ -0,0 +1,195 @@
+import asyncio
+import time
+from collections import deque
+
+from common import codec
+from hub import Event, Subscription, message_topic
+from snapshot import apply_messages
+
+
+class DelayedFeed:
+    """
+    Replays the shared buffer to every client with the same delay, through a single read
+    cursor that trails live by `delay` seconds.
+    """
+
+    def __init__(self, buffer: "DelayBuffer", delay: int, queue_size: int, conflate_at: int):
+        self._buffer = buffer
+        self.delay = delay
+        self._queue_size = queue_size
+        self._conflate_at = conflate_at
+        self._subscriptions: set[Subscription] = set()
+        # Buffer position of the last event sent, see DelayBuffer.position_at.
+        self.cursor = buffer.position_at(time.monotonic() - delay)
+        self._task = asyncio.create_task(self._run())
+
+    @property
+    def client_count(self) -> int:
+        return len(self._subscriptions)
+
+    def subscribe(self, topics: frozenset[str] | None = None, max_rate: float = 0) -> Subscription:
+        subscription = Subscription(self._queue_size, topics, self._conflate_at, max_rate)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscriptions.discard(subscription)
+        if not self._subscriptions:
+            self._buffer.remove_feed(self)
+            self._task.cancel()
+
+    def close(self):
+        self._task.cancel()
+        for subscription in list(self._subscriptions):
+            subscription.close()
+        self._subscriptions.clear()
+
+    async def _run(self):
+        while True:
+            entry = self._buffer.entry_after(self.cursor)
+            if entry is None:
+                await self._buffer.wait_for_event()
+                continue
+
+            received_at, event = entry
+            wait = received_at + self.delay - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            self.cursor += 1
+            for subscription in list(self._subscriptions):
+                if subscription.topics is not None and event.topic not in subscription.topics:
+                    continue
+                try:
+                    subscription.put(event)
+                except asyncio.QueueFull:
+                    print(f"(Delay {self.delay}s) Client queue full, disconnecting slow client.")
+                    self._subscriptions.discard(subscription)
+                    subscription.drop()
+
+
+class DelayBuffer:
+    """
+    A time-indexed ring buffer of the events of the last `max_delay` seconds, plus the
+    snapshots taken over that period, shared by all delayed clients.
+    """
+
+    def __init__(self, snapshot_cache, max_delay: int, snapshot_interval: int, queue_size: int, conflate_at: int = 0):
+        self._snapshot_cache = snapshot_cache
+        self.max_delay = max_delay
+        self._snapshot_interval = snapshot_interval
+        self._queue_size = queue_size
+        self._conflate_at = conflate_at
+        self._events: deque[tuple[float, Event]] = deque()
+        # Position of the first buffered event since the buffer was created.
+        self._first_position = 0
+        self._snapshots: deque = deque()
+        self._feeds: dict[int, DelayedFeed] = {}
+        self._new_event = asyncio.Event()
+        self._task = None
+
+    @property
+    def client_count(self) -> int:
+        return sum(feed.client_count for feed in self._feeds.values())
+
+    def start(self):
+        self._task = asyncio.create_task(self._record_snapshots())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        for feed in list(self._feeds.values()):
+            feed.close()
+        self._feeds.clear()
+
+    def on_event(self, event: Event | None):
+        """Hub listener: buffers every live event and trims those older than the maximum delay."""
+        if event is None:
+            return
+        now = time.monotonic()
+        self._events.append((now, event))
+        retention = self.max_delay + self._snapshot_interval
+        while self._events and self._events[0][0] < now - retention:
+            self._events.popleft()
+            self._first_position += 1
+        self._new_event.set()
+
+    async def wait_for_event(self):
+        self._new_event.clear()
+        await self._new_event.wait()
+
+    def position_at(self, timestamp: float) -> int:
+        """Returns the position of the last event received at or before timestamp."""
+        position = self._first_position - 1
+        for received_at, _ in self._events:
+            if received_at > timestamp:
+                break
+            position += 1
+        return position
+
+    def entry_after(self, position: int):
+        index = max(position + 1 - self._first_position, 0)
+        return self._events[index] if index < len(self._events) else None
+
+    def events_between(self, after_id: tuple[int, int], position: int) -> list[Event]:
+        """Returns the buffered events newer than after_id, up to and including position."""
+        end = position + 1 - self._first_position
+        return [event for i, (_, event) in enumerate(self._events) if i < end and event.id > after_id]
+
+    def remove_feed(self, feed: DelayedFeed):
+        if self._feeds.get(feed.delay) is feed:
+            del self._feeds[feed.delay]
+
+    async def join(self, delay: int, topics: frozenset[str] | None = None, max_rate: float = 0):
+        """
+        Subscribes a client to the feed for its delay. Returns the snapshot to start from,
+        the time at which to send it, the buffered events that follow it and the subscription.
+        """
+        snapshot = await self._snapshot_before(time.monotonic() - delay)
+
+        feed = self._feeds.get(delay)
+        if feed is None:
+            feed = self._feeds[delay] = DelayedFeed(self, delay, self._queue_size, self._conflate_at)
+        subscription = feed.subscribe(topics, max_rate)
+
+        catch_up = self.events_between(snapshot.event_id, feed.cursor)
+        return snapshot, snapshot.built_at + delay, catch_up, feed, subscription
+
+    async def _snapshot_before(self, target: float):
+        """
+        The newest snapshot from before `target`, or if the buffer does not go back that far
+        yet, the oldest one.
+        """
+        current = await self._snapshot_cache.get()
+        candidates = list(self._snapshots)
+        if not candidates or candidates[-1] is not current:
+            candidates.append(current)
+        return next((candidate for candidate in reversed(candidates) if candidate.built_at <= target), candidates[0])
+
+    async def rankings_at(self, delay: int) -> dict | None:
+        """The payload of the Rankings topic as delayed clients see it, `delay` seconds ago."""
+        target = time.monotonic() - delay
+        snapshot = await self._snapshot_before(target)
+        events = self.events_between(snapshot.event_id, self.position_at(target))
+        messages = [
+            codec.loads(message) for message in
+            [*(message for message in snapshot.messages if message_topic(message) == "Rankings"),
+             *(event.data for event in events if event.topic == "Rankings")]
+        ]
+        return apply_messages(messages[0], messages[1:])["payload"] if messages else None
+
+    async def _record_snapshots(self):
+        while True:
+            try:
+                snapshot = await self._snapshot_cache.get()
+                if not self._snapshots or self._snapshots[-1] is not snapshot:
+                    self._snapshots.append(snapshot)
+                retention = self.max_delay + self._snapshot_interval
+                while len(self._snapshots) > 1 and self._snapshots[1].built_at < time.monotonic() - retention:
+                    self._snapshots.popleft()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"(Delay) Error recording snapshot: {e}")
+            await asyncio.sleep(self._snapshot_interval)
@@ -0,0 +1,305 @@
+import asyncio
+import time
+from functools import cached_property
+
+from redis import exceptions
+
+from common import codec
+from common.patches import merge
+from instruments import CONFLATED_EVENTS, DROPPED_CLIENTS, DROPPED_EVENTS, EVENTS_RECEIVED
+
+MAX_RESUBSCRIBE_DELAY = 30
+# Queued to wake a consumer waiting for its queue when an update is conflated instead.
+_WAKE = object()
+
+
+def parse_event_id(event_id: str) -> tuple[int, int]:
+    """Parses a Redis Stream entry id ("<ms>-<n>") into a comparable tuple."""
+    ms, _, n = event_id.partition("-")
+    return int(ms), int(n or 0)
+
+
+def encode_event(event_id: str, data: str) -> bytes:
+    return f"id: {event_id}\ndata: {data}\n\n".encode('utf-8')
+
+
+def message_topic(data: str | bytes) -> str:
+    """Returns the type of an encoded message."""
+    # Messages are encoded with the type first, so this rarely needs to decode them.
+    prefix = b'{"type":"' if isinstance(data, bytes) else '{"type":"'
+    if data.startswith(prefix):
+        topic = data[len(prefix):data.index(prefix[-1:], len(prefix))]
+        return topic.decode('utf-8') if isinstance(topic, bytes) else topic
+    return codec.loads(data).get("type", "unknown")
+
+
+class Event:
+    """
+    A published message, encoded once per transport and shared by every client.
+    """
+
+    def __init__(self, event_id: str, data: str):
+        self.id = parse_event_id(event_id)
+        self.data = data
+        self.sse = encode_event(event_id, data)
+        self.received_at = time.monotonic()
+
+    @cached_property
+    def topic(self) -> str:
+        return message_topic(self.data)
+
+    @cached_property
+    def msgpack(self) -> bytes:
+        return codec.msgpack_dumps(codec.loads(self.data))
+
+
+def conflate(older: Event, newer: Event) -> Event:
+    """
+    Combines two consecutive updates of a topic into one with the effect of both. Deltas
+    are merged, and a delta combining several carries the sequence number it applies to
+    as "base". Laps are concatenated.
+    """
+    message = codec.loads(newer.data)
+    if message.get("delta") or message["type"] == "LapData":
+        previous = codec.loads(older.data)
+        if message["type"] == "LapData":
+            message["payload"] = previous["payload"] + message["payload"]
+        else:
+            message["payload"] = merge(previous["payload"], message["payload"])
+            if previous.get("delta"):
+                message["base"] = previous.get("base", previous["seq"] - 1)
+            else:
+                # A delta onto a keyframe is a keyframe.
+                del message["delta"]
+    event = Event(f"{newer.id[0]}-{newer.id[1]}", codec.dumps(message).decode('utf-8'))
+    event.received_at = older.received_at
+    return event
+
+
+class Subscription:
+    """
+    A single client's view of the hub: a bounded queue of events, of every topic or only
+    of `topics`. A None event signals that the stream should be closed.
+
+    Once `conflate_at` events are waiting, further updates are conflated instead of queued:
+    the updates of a topic are combined into one, sent once the queue has drained. With a
+    `max_rate`, the updates of each topic are conflated so that at most `max_rate` per
+    second are sent. Either way a client holds at most one pending update per topic.
+    """
+
+    def __init__(self, maxsize: int, topics: frozenset[str] | None = None, conflate_at: int = 0, max_rate: float = 0):
+        self.queue: asyncio.Queue[Event | None] = asyncio.Queue(maxsize)
+        self.topics = topics
+        self.closed = False
+        self._conflate_at = conflate_at
+        self._interval = 1 / max_rate if max_rate else 0
+        self._conflating = False
+        # Conflated updates by topic, and when each topic was last queued or sent.
+        self._pending: dict[str, Event] = {}
+        self._last_sent: dict[str, float] = {}
+
+    def put(self, event: Event):
+        """Queues or conflates an event. Raises asyncio.QueueFull when the client cannot keep up."""
+        if self.closed:
+            return
+        topic = event.topic
+        now = time.monotonic()
+        if self._conflate_at and self.queue.qsize() >= self._conflate_at:
+            self._conflating = True
+        if (
+            self._conflating
+            or topic in self._pending
+            or (self._interval and now - self._last_sent.get(topic, float("-inf")) < self._interval)
+        ):
+            pending = self._pending.get(topic)
+            if pending is None:
+                self._pending[topic] = event
+                if self.queue.empty():
+                    self.queue.put_nowait(_WAKE)
+            else:
+                self._pending[topic] = conflate(pending, event)
+                CONFLATED_EVENTS.inc(topic)
+            return
+        self.queue.put_nowait(event)
+        self._last_sent[topic] = now
+
+    async def get(self) -> Event | None:
+        """Waits for the next event to send: queued events first, then the conflated updates once due."""
+        while True:
+            if self.queue.empty() and self._pending:
+                self._conflating = False
+                topic = min(self._pending, key=lambda topic: self._last_sent.get(topic, 0))
+                wait = self._last_sent.get(topic, 0) + self._interval - time.monotonic()
+                if wait <= 0:
+                    self._last_sent[topic] = time.monotonic()
+                    return self._pending.pop(topic)
+                try:
+                    event = await asyncio.wait_for(self.queue.get(), wait)
+                except asyncio.TimeoutError:
+                    continue
+            else:
+                event = await self.queue.get()
+            if event is not _WAKE:
+                return event
+
+    def drop(self):
+        """Disconnects a client that cannot keep up, counting the events it will not receive."""
+        DROPPED_CLIENTS.inc()
+        # The waiting events, plus the one that did not fit.
+        DROPPED_EVENTS.inc(amount=self.queue.qsize() + len(self._pending) + 1)
+        self.close()
+
+    def close(self):
+        """Discards waiting events and wakes the consumer so it can end the stream."""
+        if self.closed:
+            return
+        self.closed = True
+        self._pending.clear()
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+class BroadcastHub:
+    """
+    Holds a Redis pub/sub subscription to the topic channels ("<channel>:<topic>") and the
+    channel itself, and fans every message out to the connected clients of its topic,
+    encoding each message only once.
+
+    When the API runs several workers, only one of them subscribes to Redis, and the others
+    are handed its messages through dispatch() and resync(), see relay.Relay.
+    """
+
+    def __init__(self, redis_client, channel: str, stopword: str, queue_size: int, conflate_at: int = 0, listeners=()):
+        self._redis_client = redis_client
+        # Called with every event before it is queued for clients, or with None after
+        # resubscribing, when messages may have been missed.
+        self._listeners = list(listeners)
+        self._channel = channel
+        self._stopword = stopword
+        self._queue_size = queue_size
+        self._conflate_at = conflate_at
+        self._subscriptions: set[Subscription] = set()
+        # Clients of every topic, and of some topics, by topic.
+        self._unfiltered: set[Subscription] = set()
+        self._by_topic: dict[str, set[Subscription]] = {}
+        # Called with every raw message read from Redis, or with None after resubscribing.
+        self._taps = []
+        self._task = None
+
+    @property
+    def client_count(self) -> int:
+        return len(self._subscriptions)
+
+    def subscribe(self, topics: frozenset[str] | None = None, max_rate: float = 0) -> Subscription:
+        subscription = Subscription(self._queue_size, topics, self._conflate_at, max_rate)
+        self._subscriptions.add(subscription)
+        if topics is None:
+            self._unfiltered.add(subscription)
+        else:
+            for topic in topics:
+                self._by_topic.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscriptions.discard(subscription)
+        if subscription.topics is None:
+            self._unfiltered.discard(subscription)
+            return
+        for topic in subscription.topics:
+            subscribers = self._by_topic.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._by_topic[topic]
+
+    def tap(self, callback):
+        """Registers a callback for every raw message read from Redis, and None on resubscribing."""
+        self._taps.append(callback)
+
+    def untap(self, callback):
+        self._taps.remove(callback)
+
+    def start(self):
+        """Starts reading the Redis channels."""
+        self._task = asyncio.create_task(self._reader())
+
+    async def stop_reading(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def stop(self):
+        await self.stop_reading()
+        for subscription in list(self._subscriptions):
+            subscription.close()
+        self._subscriptions.clear()
+        self._unfiltered.clear()
+        self._by_topic.clear()
+
+    def publish(self, event: Event):
+        """Queues an event for the clients of its topic, disconnecting clients whose queue is full."""
+        for subscription in [*self._unfiltered, *self._by_topic.get(event.topic, ())]:
+            try:
+                subscription.put(event)
+            except asyncio.QueueFull:
+                print("(Hub) Client queue full, disconnecting slow client.")
+                self.unsubscribe(subscription)
+                subscription.drop()
+
+    def resync(self):
+        """Signals the listeners that messages may have been missed."""
+        for listener in self._listeners:
+            listener(None)
+
+    def dispatch(self, message: str):
+        """Handles a message of the channel: "<event id> <message json>", or the stop word."""
+        if message == self._stopword:
+            print("(Hub) STOPWORD received, closing client streams.")
+            for subscription in list(self._subscriptions):
+                self.unsubscribe(subscription)
+                subscription.close()
+            return
+        event_id, _, data = message.partition(" ")
+        event = Event(event_id, data)
+        EVENTS_RECEIVED.inc(event.topic)
+        for listener in self._listeners:
+            listener(event)
+        self.publish(event)
+
+    async def _reader(self):
+        """Reads the Redis channel and broadcasts its messages, resubscribing on connection errors."""
+        delay = 1
+        while True:
+            pubsub = self._redis_client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self._channel)
+                await pubsub.psubscribe(f"{self._channel}:*")
+                print(f"(Hub) Subscribed to Redis channels: {self._channel}, {self._channel}:*")
+                for tap in self._taps:
+                    tap(None)
+                self.resync()
+                delay = 1
+                async for message in pubsub.listen():
+                    if message.get("type") not in ("message", "pmessage"):
+                        continue
+                    message_data_str = message["data"].decode('utf-8')
+                    for tap in self._taps:
+                        tap(message_data_str)
+                    self.dispatch(message_data_str)
+            except asyncio.CancelledError:
+                raise
+            except exceptions.ConnectionError as e:
+                print(f"(Hub) Redis connection error: {e}. Resubscribing in {delay}s...")
+            except Exception as e:
+                print(f"(Hub) Error reading from Redis: {e}. Resubscribing in {delay}s...")
+            finally:
+                try:
+                    await pubsub.unsubscribe(self._channel)
+                    await pubsub.punsubscribe(f"{self._channel}:*")
+                    await pubsub.aclose()
+                except Exception as e:
+                    print(f"(Hub) Error closing Redis PubSub instance: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RESUBSCRIBE_DELAY)
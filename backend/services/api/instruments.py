@@ -0,0 +1,11 @@
+from common import metrics
+
+# Set to a function returning the number of connected clients once the hub is running.
+STREAM_CLIENTS = metrics.Gauge("api_stream_clients", "Connected SSE and WebSocket clients.")
+EVENTS_RECEIVED = metrics.Counter("api_events_received_total", "Events received from the Redis channel, per topic.", ["topic"])
+SEND_LAG = metrics.Histogram("api_send_lag_seconds", "Time from an event reaching the hub to it being sent, per transport.", ["transport"])
+BYTES_SENT = metrics.Counter("api_bytes_sent_total", "Event bytes sent to clients, per topic and transport.", ["topic", "transport"])
+DROPPED_CLIENTS = metrics.Counter("api_dropped_clients_total", "Clients disconnected because their queue was full.")
+DROPPED_EVENTS = metrics.Counter("api_dropped_events_total", "Events discarded with the queues of disconnected slow clients.")
+CONFLATED_EVENTS = metrics.Counter("api_conflated_events_total", "Updates combined into a client's pending update of the same topic, per topic.", ["topic"])
+REDIS_SECONDS = metrics.Histogram("api_redis_seconds", "Redis round-trip time, per operation.", ["operation"])
@@ -1,17 +1,56 @@
 import asyncio
 import os
+import sys
+import time
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from datetime import datetime
+from pathlib import Path
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 
 from redis import asyncio as aioredis, exceptions
 
-from fastapi.responses import StreamingResponse
-from fastapi import Request, Depends
-import json
+from fastapi.responses import StreamingResponse, Response
+from fastapi import Request, Depends, HTTPException, Header, Query
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common import codec, metrics, rankings, sessions, storage
+from hub import BroadcastHub, encode_event, message_topic, parse_event_id
+from snapshot import COMPRESSORS, SnapshotCache, read_keyframe
+from delay import DelayBuffer
+from archive import ArchiveCache
+from series import SeriesStore
+from relay import Relay
+from instruments import BYTES_SENT, REDIS_SECONDS, SEND_LAG, STREAM_CLIENTS
 
 STOPWORD = "STOP"
 REDIS_CHANNEL_NAME = "channel:1"
+EVENT_STREAM_KEY = "Events"
+SSE_CLIENT_QUEUE_SIZE = int(os.getenv("SSE_CLIENT_QUEUE_SIZE", "1000"))
+# Number of events waiting for a client at which its updates start to be conflated, see
+# hub.Subscription. 0 disables conflation, and clients are disconnected when their queue is full.
+CONFLATE_THRESHOLD = int(os.getenv("CONFLATE_THRESHOLD", "100"))
+# Maximum updates per second and topic of each client tier, as "<tier>:<rate>", 0 meaning
+# unlimited. Clients choose with ?tier=, the first tier is the default.
+CLIENT_TIERS = {
+    name.strip(): float(rate)
+    for name, _, rate in (tier.partition(":") for tier in os.getenv("CLIENT_TIERS", "realtime:0,standard:4,low:1").split(","))
+}
+DEFAULT_TIER = next(iter(CLIENT_TIERS))
+MAX_STREAM_DELAY = int(os.getenv("MAX_STREAM_DELAY", "300"))
+DELAY_SNAPSHOT_INTERVAL = int(os.getenv("DELAY_SNAPSHOT_INTERVAL", "5"))
+# Number of archived sessions kept decoded in memory.
+ARCHIVE_CACHE_SIZE = int(os.getenv("ARCHIVE_CACHE_SIZE", "8"))
+# Number of worker processes, read by uvicorn too. With more than one, a single worker
+# subscribes to Redis and relays its messages and snapshot to the others, see relay.Relay.
+WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))
+# Unix socket the leading worker relays on, shared by the workers of one host.
+RELAY_SOCKET = os.getenv("RELAY_SOCKET", "/tmp/f1-api-relay.sock")
+# Most points per driver or per weather field a series request can ask for.
+MAX_SERIES_POINTS = int(os.getenv("MAX_SERIES_POINTS", "2000"))
+TOPICS = ["DriverList", "SessionInfo", "LapCount", "TrackStatus", "RaceControlMessages", "TimingData", "WeatherData", "Heartbeat", "WeatherDataSeries", "TyreStintSeries", "Rankings", "StrategyModel"]
+# The topics a stream can be limited to.
+STREAM_TOPICS = frozenset([*TOPICS, "LapData"])
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -22,11 +61,39 @@ async def lifespan(app: FastAPI):
     redis_client = aioredis.from_url(redis_url)
     app.state.redis = redis_client
 
+    snapshot_cache = SnapshotCache(redis_client, TOPICS)
+    app.state.snapshot_cache = snapshot_cache
+    app.state.archive_cache = ArchiveCache(redis_client, ARCHIVE_CACHE_SIZE)
+    series_store = SeriesStore(redis_client)
+    app.state.series_store = series_store
+
+    delay_buffer = DelayBuffer(snapshot_cache, MAX_STREAM_DELAY, DELAY_SNAPSHOT_INTERVAL, SSE_CLIENT_QUEUE_SIZE, CONFLATE_THRESHOLD)
+    delay_buffer.start()
+    app.state.delay_buffer = delay_buffer
+
+    hub = BroadcastHub(
+        redis_client, REDIS_CHANNEL_NAME, STOPWORD, SSE_CLIENT_QUEUE_SIZE, CONFLATE_THRESHOLD,
+        listeners=[snapshot_cache.invalidate, delay_buffer.on_event, series_store.on_event],
+    )
+    if WORKERS > 1:
+        relay = Relay(hub, snapshot_cache, RELAY_SOCKET)
+        relay.start()
+    else:
+        relay = None
+        hub.start()
+    app.state.relay = relay
+    app.state.hub = hub
+    STREAM_CLIENTS.callback = lambda: hub.client_count + delay_buffer.client_count
+
     print("Application startup complete.")
     yield
     # ===== Shutdown Logic =====
     print("Application shutdown: Cleaning up resources...")
 
+    if app.state.relay:
+        await app.state.relay.stop()
+    await app.state.hub.stop()
+    await app.state.delay_buffer.stop()
     await app.state.redis.aclose()
     
     print("Application shutdown complete.")
@@ -40,62 +107,139 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def parse_topics(topics: str | None = None) -> frozenset[str] | None:
+    """Parses a comma-separated list of topics, None meaning every topic."""
+    if not topics:
+        return None
+    requested = frozenset(topic.strip() for topic in topics.split(",") if topic.strip())
+    unknown = requested - STREAM_TOPICS
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown topics: {', '.join(sorted(unknown))}")
+    return requested
+
+def parse_tier(tier: str = DEFAULT_TIER) -> float:
+    """Returns the maximum update rate of a client tier."""
+    if tier not in CLIENT_TIERS:
+        raise HTTPException(status_code=400, detail=f"Unknown tier: {tier}, expected one of {', '.join(CLIENT_TIERS)}")
+    return CLIENT_TIERS[tier]
+
+async def read_events_since(redis_client, last_event_id: str):
+    """
+    Returns the event stream entries after last_event_id, or None when entries after it
+    may already have been trimmed and the client needs a full resync.
+    """
+    try:
+        last = parse_event_id(last_event_id)
+    except ValueError:
+        return None
+
+    session = await redis_client.get(sessions.CURRENT_SESSION_KEY)
+    if not session:
+        return None
+    event_stream_key = sessions.session_key(session.decode('utf-8'), EVENT_STREAM_KEY)
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.xrange(event_stream_key, count=1)
+        pipe.xrange(event_stream_key, min=f"({last[0]}-{last[1]}")
+        with REDIS_SECONDS.time("replay"):
+            first, entries = await pipe.execute()
+
+    if not first or parse_event_id(first[0][0].decode('utf-8')) > last:
+        return None
+    return [(entry_id.decode('utf-8'), fields[b"data"].decode('utf-8')) for entry_id, fields in entries]
+
+async def delayed_event_generator(request: Request, delay: int, topics: frozenset[str] | None, max_rate: float):
+    """
+    Streams the state as it was `delay` seconds ago, then the events that followed it, each
+    sent `delay` seconds after it was received.
+    """
+    buffer = request.app.state.delay_buffer
+    snapshot, send_at, catch_up, feed, subscription = await buffer.join(delay, topics, max_rate)
+    print(f"SSE client connected with a {delay}s delay.")
+    try:
+        wait = send_at - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        yield snapshot.events_for(topics)
+        for event in catch_up:
+            if topics is None or event.topic in topics:
+                yield event.sse
+
+        while True:
+            event = await subscription.get()
+            if event is None:
+                print("(SSE Stream) Delayed stream closed.")
+                break
+            if event.id <= snapshot.event_id:
+                continue
+            BYTES_SENT.inc(event.topic, "sse", amount=len(event.sse))
+            yield event.sse
+
+    except asyncio.CancelledError:
+        print("Delayed SSE stream cancelled on server side.")
+    except Exception as e:
+        print(f"Error in delayed SSE event_generator: {e}")
+        yield f"event: error\ndata: Internal server error: {str(e)}\n\n"
+    finally:
+        feed.unsubscribe(subscription)
+        print("Delayed SSE Stream closed.")
+
 @app.get("/f1-stream/", response_model=None)
 async def stream_f1_data(
     request: Request,
+    version: int | None = None,
+    delay: int = 0,
+    topics: frozenset[str] | None = Depends(parse_topics),
+    max_rate: float = Depends(parse_tier),
+    last_event_id: str | None = Header(default=None),
 ):
+    """
+    Streams the initial state followed by live updates. Clients that already hold the
+    current snapshot (from /snapshot) can pass its version to skip the initial state, and
+    reconnecting clients only receive the events after their Last-Event-ID.
+    With a delay (in seconds), the stream trails live by that much, to line up with a TV broadcast.
+    With ?topics=TimingData,LapCount, both the initial state and the updates are limited to those topics.
+    ?tier= caps the updates per second and topic (see CLIENT_TIERS). Clients that fall behind, or
+    exceed their tier, receive the updates of a topic combined into one.
+    """
+    if not 0 <= delay <= MAX_STREAM_DELAY:
+        raise HTTPException(status_code=400, detail=f"delay must be between 0 and {MAX_STREAM_DELAY} seconds")
+    if delay:
+        return StreamingResponse(delayed_event_generator(request, delay, topics, max_rate), media_type="text/event-stream")
+
     async def event_generator():
-        redis_client = None
-        pubsub = None
+        hub = request.app.state.hub
+        # Subscribe before reading the initial data so no update is missed in between.
+        subscription = hub.subscribe(topics, max_rate)
+        print(f"SSE client connected, {hub.client_count} clients.")
         try:
-            redis_client = request.app.state.redis
-
-            initial_data_keys = ["DriverList", "SessionInfo", "LapCount", "TrackStatus", "RaceControlMessages", "TimingData", "WeatherData", "Heartbeat", "WeatherDataSeries", "TyreStintSeries"]
-            for key in initial_data_keys:
-                try:
-                    message_data_bytes = await redis_client.get(key)
-                    if message_data_bytes:
-                        message_data_str = message_data_bytes.decode('utf-8')
-                        yield f"data: {message_data_str}\n\n"
-                        await asyncio.sleep(0.01)
-                    else:
-                        print(f"(SSE Stream) No initial data found for {key}")
-                except Exception as e:
-                    print(f"Error retrieving initial data for {key} from Redis: {e}")
-                    yield f"event: error\ndata: Error fetching initial {key}: {str(e)}\n\n"
-            
-            laps = await redis_client.lrange("LapData", 0, -1)
-            if laps:
-                laps = [el.decode('utf-8') for el in laps]
-                laps = [json.loads(lap) for lap in laps]
-                chunk_size = 50  # Send 50 laps at a time
-                for i in range(0, len(laps), chunk_size):
-                    laps_chunk = laps[i:i + chunk_size]
-                    laps_json = json.dumps({"type": "LapData", "payload": laps_chunk})
-                    yield f"data: {laps_json}\n\n"
-                    await asyncio.sleep(0.01)
-
-            pubsub = redis_client.pubsub()
-            await pubsub.subscribe(REDIS_CHANNEL_NAME)
-            print(f"SSE stream subscribed to Redis channel: {REDIS_CHANNEL_NAME}")
+            replay = None
+            if last_event_id:
+                replay = await read_events_since(request.app.state.redis, last_event_id)
+
+            if replay is not None:
+                print(f"(SSE Stream) Resuming after {last_event_id}, replaying {len(replay)} events.")
+                last_sent = parse_event_id(last_event_id)
+                for event_id, data in replay:
+                    if topics is None or message_topic(data) in topics:
+                        yield encode_event(event_id, data)
+                    last_sent = parse_event_id(event_id)
+            else:
+                snapshot = await request.app.state.snapshot_cache.get()
+                if snapshot.version != version:
+                    yield snapshot.events_for(topics)
+                last_sent = parse_event_id(snapshot.last_event_id) if snapshot.last_event_id else (0, 0)
 
             while True:
-                if await request.is_disconnected():
-                    print("Client disconnected from SSE stream (Redis).")
+                event = await subscription.get()
+                if event is None:
+                    print("(SSE Stream) Stream closed by hub.")
                     break
-
-                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
-                
-                if message is not None and message.get("type") == "message":
-                    message_data_bytes = message["data"]
-                    message_data_str = message_data_bytes.decode('utf-8')
-
-                    if message_data_str == STOPWORD:
-                        print("(SSE Stream) STOPWORD received, closing stream.")
-                        # yield f"event: stop\ndata: Server stopping stream\n\n"
-                        break
-                    
-                    yield f"data: {message_data_str}\n\n"
+                # Already sent as part of the snapshot or the replay.
+                if event.id <= last_sent:
+                    continue
+                SEND_LAG.observe(time.monotonic() - event.received_at, "sse")
+                BYTES_SENT.inc(event.topic, "sse", amount=len(event.sse))
+                yield event.sse
 
         except asyncio.CancelledError:
             print("SSE stream cancelled on server side (Redis).")
@@ -106,19 +250,263 @@ async def stream_f1_data(
             print(f"Error in SSE event_generator (Redis): {e}")
             yield f"event: error\ndata: Internal server error: {str(e)}\n\n"
         finally:
-            # print("SSE Stream closing (Redis)...")
-            # if pubsub:
-            #     try:
-            #         await pubsub.unsubscribe(REDIS_CHANNEL_NAME)
-            #         print(f"Unsubscribed from Redis channel: {REDIS_CHANNEL_NAME}")
-            #     except Exception as e:
-            #         print(f"Error unsubscribing from Redis channel: {e}")
-            #     finally:
-            #         try:
-            #             await pubsub.close() # Close the pubsub instance itself
-            #             print("Redis PubSub instance closed.")
-            #         except Exception as e:
-            #             print(f"Error closing Redis PubSub instance: {e}")
-            print("SSE Stream closed (Redis).")
+            hub.unsubscribe(subscription)
+            print(f"SSE Stream closed (Redis), {hub.client_count} clients.")
             
     return StreamingResponse(event_generator(), media_type="text/event-stream")
+
+@app.get("/snapshot", response_model=None)
+async def get_snapshot(request: Request):
+    """
+    Returns the current state of every topic and the lap list as one versioned, precompressed document.
+    """
+    snapshot = await request.app.state.snapshot_cache.get()
+    headers = {"ETag": snapshot.etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+
+    if request.headers.get("if-none-match") == snapshot.etag:
+        return Response(status_code=304, headers=headers)
+
+    accept_encoding = request.headers.get("accept-encoding", "")
+    for encoding in ("br", "gzip"):
+        if encoding in COMPRESSORS and encoding in accept_encoding:
+            body = await snapshot.compressed(encoding)
+            return Response(content=body, media_type="application/json", headers={**headers, "Content-Encoding": encoding})
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
+
+@app.get("/keyframe/{topic}", response_model=None)
+async def get_keyframe(topic: str, request: Request):
+    """
+    Returns the full merged state of a topic, used by clients to resync after missing a delta.
+    """
+    redis_client = request.app.state.redis
+    session = await redis_client.get(sessions.CURRENT_SESSION_KEY)
+    if not session:
+        raise HTTPException(status_code=404, detail="No live session")
+    session = session.decode('utf-8')
+
+    if topic == "LapData":
+        laps = [codec.stored_to_json(lap) for lap in await redis_client.lrange(sessions.session_key(session, "LapData"), 0, -1)]
+        content = b'{"type":"LapData","payload":[%s],"seq":%d}' % (b",".join(laps), len(laps))
+        return Response(content=content, media_type="application/json")
+
+    if topic not in TOPICS:
+        raise HTTPException(status_code=404, detail=f"Unknown topic: {topic}")
+
+    keyframe = await read_keyframe(redis_client, session, topic)
+    if not keyframe:
+        raise HTTPException(status_code=404, detail=f"No data for topic: {topic}")
+
+    return Response(content=keyframe, media_type="application/json")
+
+async def read_live_path(redis_client, topic: str, path) -> list:
+    """The values at a path in the live state of a topic, see storage.read_path."""
+    session = await redis_client.get(sessions.CURRENT_SESSION_KEY)
+    if not session:
+        raise HTTPException(status_code=404, detail="No live session")
+    return await storage.read_path(redis_client, sessions.session_key(session.decode('utf-8'), topic), ("payload", *path))
+
+@app.get("/timing/{racing_number}")
+async def get_driver_timing(racing_number: str, request: Request):
+    """
+    Returns the live TimingData line of a single driver (by racing number).
+    """
+    lines = await read_live_path(request.app.state.redis, "TimingData", ("Lines", racing_number))
+    if not lines:
+        raise HTTPException(status_code=404, detail=f"No timing for driver: {racing_number}")
+    return lines[0]
+
+@app.get("/race-control-messages")
+async def get_race_control_messages(request: Request, last: int = Query(default=20, ge=1, le=1000)):
+    """
+    Returns the last race control messages of the live session, the most recent last.
+    """
+    return await read_live_path(request.app.state.redis, "RaceControlMessages", ("Messages", slice(-last, None)))
+
+@app.get("/pit-simulation")
+async def simulate_pit_stop(
+    request: Request,
+    driver: str,
+    penalty: float = 0,
+    pit_loss: float | None = None,
+    delay: int = Query(default=0, ge=0, le=MAX_STREAM_DELAY),
+):
+    """
+    Projects where a driver (by racing number) rejoins after pitting now and serving a
+    penalty in seconds, from the live Rankings, or with a delay (in seconds) from the
+    Rankings a stream with that delay shows. The pit loss defaults to the circuit's under
+    the current track status.
+    """
+    if delay:
+        current = await request.app.state.delay_buffer.rankings_at(delay)
+    else:
+        current = (await request.app.state.snapshot_cache.get()).rankings
+    if current is None:
+        raise HTTPException(status_code=404, detail="No live rankings")
+    result = rankings.simulate_pit(current, driver, penalty, pit_loss)
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"Unknown driver: {driver}")
+    return result
+
+@app.get("/series/laps")
+async def get_lap_series(
+    request: Request,
+    from_lap: int | None = None,
+    to_lap: int | None = None,
+    driver: list[str] | None = Query(default=None),
+    points: int | None = Query(default=None, ge=2, le=MAX_SERIES_POINTS),
+):
+    """
+    Returns the lap times in seconds of the live session per driver, optionally limited to
+    a range of lap numbers and to some drivers (by racing number, repeatable), and
+    downsampled to at most `points` laps per driver.
+    """
+    return await request.app.state.series_store.laps(from_lap, to_lap, set(driver) if driver else None, points)
+
+@app.get("/series/weather")
+async def get_weather_series(
+    request: Request,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    points: int | None = Query(default=None, ge=1, le=MAX_SERIES_POINTS),
+):
+    """
+    Returns the weather samples of the live session as columns, optionally limited to a
+    time range (ISO 8601), and averaged down to at most `points` samples.
+    """
+    return await request.app.state.series_store.weather(start, end, points)
+
+@app.get("/sessions")
+async def list_sessions(request: Request):
+    """
+    Lists the archived sessions, the most recent first, and the id of the live session.
+    """
+    live = await request.app.state.redis.get(sessions.CURRENT_SESSION_KEY)
+    return {
+        "live": live.decode('utf-8') if live else None,
+        "sessions": await request.app.state.archive_cache.list(),
+    }
+
+async def get_archive(session_id: str, request: Request):
+    archive = await request.app.state.archive_cache.get(session_id)
+    if archive is None:
+        raise HTTPException(status_code=404, detail=f"No archived session: {session_id}")
+    return archive
+
+@app.get("/sessions/{session_id}/snapshot", response_model=None)
+async def get_session_snapshot(request: Request, archive=Depends(get_archive)):
+    """
+    Returns the final state of an archived session, in the format of /snapshot.
+    """
+    headers = {"ETag": archive.etag, "Cache-Control": "public, max-age=3600", "Vary": "Accept-Encoding"}
+    if request.headers.get("if-none-match") == archive.etag:
+        return Response(status_code=304, headers=headers)
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        # Stored compressed, so it is served as it is.
+        return Response(content=archive.gzip_snapshot, media_type="application/json", headers={**headers, "Content-Encoding": "gzip"})
+    return Response(content=archive.snapshot, media_type="application/json", headers=headers)
+
+@app.get("/sessions/{session_id}/laps")
+async def get_session_laps(
+    from_lap: int | None = None,
+    to_lap: int | None = None,
+    driver: list[str] | None = Query(default=None),
+    archive=Depends(get_archive),
+):
+    """
+    Returns the laps of an archived session as columns, optionally limited to a range of
+    lap numbers and to some drivers (by racing number, repeatable).
+    """
+    return archive.lap_range(from_lap, to_lap, set(driver) if driver else None)
+
+@app.get("/sessions/{session_id}/timing")
+async def get_session_timing(archive=Depends(get_archive)):
+    """
+    Returns the final timing of an archived session as columns, one row per driver.
+    """
+    return archive.timing
+
+@app.get("/metrics", response_model=None)
+async def get_metrics():
+    """
+    Returns the API's metrics in the Prometheus text format.
+    """
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.post("/debug/profile/{action}", response_model=None)
+async def profile(action: str, request: Request):
+    """
+    Starts (?interval=seconds) or stops the sampling profiler, if PROFILER_ENABLED is set.
+    Stopping returns the collapsed stacks.
+    """
+    query = {key: [value] for key, value in request.query_params.items()}
+    status, body = await asyncio.to_thread(metrics.profile_command, f"/debug/profile/{action}", query)
+    return Response(content=body, status_code=status, media_type="text/plain")
+
+@app.websocket("/f1-ws/")
+async def websocket_f1_data(websocket: WebSocket, format: str = "json", topics: str | None = None, tier: str = DEFAULT_TIER):
+    """
+    Sends the snapshot followed by live updates over a WebSocket, as JSON text frames
+    or, with ?format=msgpack, as MessagePack binary frames. ?topics= and ?tier= work
+    as on /f1-stream/.
+    """
+    binary = format == "msgpack"
+    hub = websocket.app.state.hub
+    try:
+        topics = parse_topics(topics)
+        max_rate = parse_tier(tier)
+    except HTTPException as e:
+        await websocket.close(code=1008, reason=e.detail)
+        return
+    if format not in ("json", "msgpack"):
+        await websocket.close(code=1008, reason=f"Unknown format: {format}, expected json or msgpack")
+        return
+    if binary and codec.msgpack is None:
+        # Unsupported data: rejected up front rather than failing on the first frame.
+        await websocket.close(code=1003, reason="MessagePack is not available on this server")
+        return
+    await websocket.accept()
+    subscription = hub.subscribe(topics, max_rate)
+
+    async def watch_disconnect():
+        try:
+            while True:
+                await websocket.receive_text()
+        except (WebSocketDisconnect, RuntimeError):
+            subscription.close()
+
+    watcher = asyncio.create_task(watch_disconnect())
+    try:
+        snapshot = await websocket.app.state.snapshot_cache.get()
+        for i, message in enumerate(snapshot.messages):
+            if topics is not None and message_topic(message) not in topics:
+                continue
+            if binary:
+                await websocket.send_bytes(snapshot.msgpack_messages[i])
+            else:
+                await websocket.send_text(message.decode('utf-8'))
+        last_sent = parse_event_id(snapshot.last_event_id) if snapshot.last_event_id else (0, 0)
+
+        while True:
+            event = await subscription.get()
+            if event is None:
+                break
+            if event.id <= last_sent:
+                continue
+            SEND_LAG.observe(time.monotonic() - event.received_at, "websocket")
+            if binary:
+                await websocket.send_bytes(event.msgpack)
+                BYTES_SENT.inc(event.topic, "websocket", amount=len(event.msgpack))
+            else:
+                await websocket.send_text(event.data)
+                BYTES_SENT.inc(event.topic, "websocket", amount=len(event.data))
+
+        if not watcher.done():
+            await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        print(f"Error in WebSocket stream: {e}")
+    finally:
+        watcher.cancel()
+        hub.unsubscribe(subscription)
+        print(f"WebSocket stream closed, {hub.client_count} clients.")
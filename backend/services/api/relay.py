@@ -0,0 +1,209 @@
+"""
+Sharing of one Redis subscription and one snapshot between the worker processes of the API.
+
+With several workers (WEB_CONCURRENCY > 1), each would otherwise subscribe to Redis and
+rebuild the snapshot after every message on its own. Instead, the worker holding the lock
+file next to the relay socket leads: its hub reads Redis, and it forwards every message to
+the other workers over a Unix socket, and serves them its snapshot on request. The other
+workers follow: their hubs are fed the forwarded messages, and their snapshot caches fetch
+the leader's snapshot instead of reading Redis. When the leader exits, its lock is released
+and the first follower to take it leads in its place.
+
+Frames on the socket are a kind byte and a 4-byte length, followed by the payload.
+"""
+import asyncio
+import fcntl
+import os
+import struct
+from collections import deque
+
+from common import codec
+from snapshot import Snapshot
+
+# Seconds between attempts to connect to the leader, or to take its place.
+FOLLOW_RETRY_DELAY = 0.5
+# Bytes a follower may fall behind by before the leader disconnects it.
+MAX_FOLLOWER_BUFFER = 64 * 1024 * 1024
+
+_HEADER = struct.Struct(">cI")
+_LENGTH = struct.Struct(">I")
+# Leader to followers: a message of the channel, a resubscription, a snapshot.
+_EVENT = b"E"
+_RESYNC = b"R"
+_SNAPSHOT = b"S"
+# Follower to leader.
+_SNAPSHOT_REQUEST = b"s"
+
+
+def _frame(kind: bytes, payload: bytes = b"") -> bytes:
+    return _HEADER.pack(kind, len(payload)) + payload
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> tuple[bytes, bytes]:
+    kind, length = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    return kind, await reader.readexactly(length) if length else b""
+
+
+def encode_snapshot(snapshot: Snapshot) -> bytes:
+    header = codec.dumps({"version": snapshot.version, "last_event_id": snapshot.last_event_id})
+    parts = [_LENGTH.pack(len(header)), header]
+    for message in snapshot.messages:
+        parts.append(_LENGTH.pack(len(message)))
+        parts.append(message)
+    return b"".join(parts)
+
+
+def decode_snapshot(data: bytes) -> Snapshot:
+    messages = []
+    offset = 0
+    while offset < len(data):
+        (length,) = _LENGTH.unpack_from(data, offset)
+        offset += _LENGTH.size
+        messages.append(data[offset:offset + length])
+        offset += length
+    header = codec.loads(messages.pop(0))
+    return Snapshot(header["version"], messages, header["last_event_id"])
+
+
+class Relay:
+    """
+    Runs the hub and the snapshot cache of one worker as the leader or as a follower,
+    switching to leading when the leader goes away.
+    """
+
+    def __init__(self, hub, snapshot_cache, path: str):
+        self._hub = hub
+        self._snapshot_cache = snapshot_cache
+        self._path = path
+        self._lock_file = None
+        self._task = None
+        # As the leader, the connections of the followers.
+        self._followers: set[asyncio.StreamWriter] = set()
+        # As a follower, the connection to the leader and the snapshots requested from it.
+        self._writer: asyncio.StreamWriter | None = None
+        self._pending: deque[asyncio.Future] = deque()
+        self.leading = False
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._lock_file:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _take_lock(self) -> bool:
+        if self._lock_file is None:
+            self._lock_file = open(f"{self._path}.lock", "a")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    async def _run(self):
+        while True:
+            if self._take_lock():
+                await self._lead()
+            try:
+                await self._follow()
+            except (OSError, asyncio.IncompleteReadError) as e:
+                if self._writer is not None:
+                    print(f"(Relay) Lost the connection to the leading worker: {e}")
+            finally:
+                self._disconnect()
+            await asyncio.sleep(FOLLOW_RETRY_DELAY)
+
+    async def _lead(self):
+        """Reads Redis for every worker, until cancelled."""
+        print(f"(Relay) Worker {os.getpid()} leads, relaying Redis messages on {self._path}.")
+        self.leading = True
+        self._snapshot_cache.remote = None
+        self._snapshot_cache.invalidate()
+        if os.path.exists(self._path):
+            # Left by a previous leader: only the holder of the lock listens on it.
+            os.unlink(self._path)
+        server = await asyncio.start_unix_server(self._serve, path=self._path)
+        self._hub.tap(self._forward)
+        self._hub.start()
+        try:
+            await asyncio.Future()
+        finally:
+            self._hub.untap(self._forward)
+            await self._hub.stop_reading()
+            server.close()
+            for writer in self._followers:
+                writer.close()
+            self._followers.clear()
+            self.leading = False
+
+    def _forward(self, message: str | None):
+        """Hub tap: sends a message read from Redis, or a resubscription, to every follower."""
+        frame = _frame(_RESYNC) if message is None else _frame(_EVENT, message.encode('utf-8'))
+        for writer in list(self._followers):
+            if writer.transport.is_closing():
+                self._followers.discard(writer)
+            elif writer.transport.get_write_buffer_size() > MAX_FOLLOWER_BUFFER:
+                print("(Relay) Worker too far behind, disconnecting it.")
+                self._followers.discard(writer)
+                writer.close()
+            else:
+                writer.write(frame)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Answers the snapshot requests of a follower, which also receives every message."""
+        self._followers.add(writer)
+        try:
+            while True:
+                kind, _ = await _read_frame(reader)
+                if kind == _SNAPSHOT_REQUEST:
+                    snapshot = await self._snapshot_cache.get()
+                    writer.write(_frame(_SNAPSHOT, encode_snapshot(snapshot)))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            print(f"(Relay) Error serving a worker: {e}")
+        finally:
+            self._followers.discard(writer)
+            writer.close()
+
+    async def _follow(self):
+        """Receives the leader's messages until the connection is lost."""
+        reader, self._writer = await asyncio.open_unix_connection(self._path)
+        print(f"(Relay) Worker {os.getpid()} follows the leading worker.")
+        self._snapshot_cache.remote = self._fetch_snapshot
+        # Messages may have been missed while not connected.
+        self._hub.resync()
+        while True:
+            kind, payload = await _read_frame(reader)
+            if kind == _EVENT:
+                self._hub.dispatch(payload.decode('utf-8'))
+            elif kind == _RESYNC:
+                self._hub.resync()
+            elif kind == _SNAPSHOT:
+                future = self._pending.popleft()
+                if not future.done():
+                    future.set_result(decode_snapshot(payload))
+
+    def _disconnect(self):
+        # Until connected again, snapshots are built from Redis.
+        self._snapshot_cache.remote = None
+        self._snapshot_cache.invalidate()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        while self._pending:
+            future = self._pending.popleft()
+            if not future.done():
+                future.set_exception(ConnectionError("Lost the connection to the leading worker"))
+
+    async def _fetch_snapshot(self) -> Snapshot:
+        if self._writer is None:
+            raise ConnectionError("Not connected to the leading worker")
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(future)
+        self._writer.write(_frame(_SNAPSHOT_REQUEST))
+        return await future
@@ -0,0 +1,237 @@
+"""
+The lap times of every driver and the weather series of the live session, kept in arrays
+as they are published and downsampled to the number of points a chart can show.
+
+Lap times are decimated with Largest-Triangle-Three-Buckets, which keeps the shape of a
+driver's pace, pit laps and safety car laps included. Weather samples are averaged over
+buckets of consecutive samples, so that the fields of a sample stay aligned.
+"""
+import asyncio
+import bisect
+import math
+from array import array
+from datetime import datetime, timezone
+
+from common import codec, sessions, storage
+from hub import Event
+from instruments import REDIS_SECONDS
+from snapshot import LAP_DATA_KEY
+
+WEATHER_SERIES_KEY = "WeatherDataSeries"
+WEATHER_FIELDS = ["AirTemp", "TrackTemp", "Humidity", "Pressure", "Rainfall", "WindSpeed", "WindDirection"]
+
+
+def _epoch(moment: datetime) -> float:
+    # Times without a timezone are UTC, as in the feed.
+    return (moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)).timestamp()
+
+
+def _parse_timestamp(text: str) -> float:
+    return _epoch(datetime.fromisoformat(text))
+
+
+def _format_timestamp(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def lttb(xs, ys, points: int) -> list[int]:
+    """The indices of the `points` samples of a series that Largest-Triangle-Three-Buckets keeps."""
+    n = len(xs)
+    if points >= n:
+        return list(range(n))
+    if points < 3:
+        return [0, n - 1][:points]
+
+    every = (n - 2) / (points - 2)
+    indices = [0]
+    a = 0
+    for bucket in range(points - 2):
+        start = int(bucket * every) + 1
+        end = int((bucket + 1) * every) + 1
+        # The average of the next bucket, the last sample for the last bucket.
+        next_end = min(int((bucket + 2) * every) + 1, n)
+        count = next_end - end
+        avg_x = sum(xs[end:next_end]) / count
+        avg_y = sum(ys[end:next_end]) / count
+
+        ax, ay = xs[a], ys[a]
+        best, best_area = start, -1.0
+        for i in range(start, end):
+            area = abs((ax - avg_x) * (ys[i] - ay) - (ax - xs[i]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = i, area
+        indices.append(best)
+        a = best
+    indices.append(n - 1)
+    return indices
+
+
+def _mean(values) -> float | None:
+    values = [value for value in values if not math.isnan(value)]
+    return sum(values) / len(values) if values else None
+
+
+def _circular_mean(degrees) -> float | None:
+    radians = [math.radians(value) for value in degrees if not math.isnan(value)]
+    if not radians:
+        return None
+    angle = round(math.degrees(math.atan2(sum(map(math.sin, radians)), sum(map(math.cos, radians)))), 2)
+    return angle % 360
+
+
+class SeriesStore:
+    """
+    Hub listener: the laps and weather samples of every event are appended to the arrays.
+    After a resubscription, or when an event does not follow on from the stored series (a
+    gap, or a new session), the store is reloaded from Redis on next use.
+    """
+
+    def __init__(self, redis_client):
+        self._redis_client = redis_client
+        self._loaded = False
+        self._loading = False
+        # Events received while loading, applied once loaded.
+        self._backlog: list[Event | None] = []
+        self._lock = asyncio.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._lap_count = 0
+        # Lap numbers and lap times in seconds, per racing number, ordered by lap number.
+        self._laps: dict[str, tuple[array, array]] = {}
+        self._weather_times = array("d")
+        self._weather = {field: array("d") for field in WEATHER_FIELDS}
+
+    def on_event(self, event: Event | None):
+        if event is not None and event.topic not in (LAP_DATA_KEY, WEATHER_SERIES_KEY):
+            return
+        if self._loading:
+            self._backlog.append(event)
+        elif self._loaded and not self._apply(event, replayed=False):
+            self._loaded = False
+
+    def _apply(self, event: Event | None, replayed: bool) -> bool:
+        """Adds an event to the series. Returns False when it does not follow on from them."""
+        if event is None:
+            # Messages may have been missed.
+            return False
+        message = codec.loads(event.data)
+        if event.topic == LAP_DATA_KEY:
+            laps = message["payload"]
+            if replayed and message.get("seq", 0) <= self._lap_count:
+                return True
+            if message.get("seq") != self._lap_count + len(laps):
+                return False
+            self._add_laps(laps)
+            return True
+
+        series = (message.get("payload") or {}).get("Series")
+        if not message.get("delta"):
+            self._weather_times = array("d")
+            self._weather = {field: array("d") for field in WEATHER_FIELDS}
+            series = dict(enumerate(series or []))
+        elif isinstance(series, list):
+            series = dict(enumerate(series))
+        for index, entry in sorted(((int(index), entry) for index, entry in (series or {}).items())):
+            if index < len(self._weather_times):
+                # Already stored: samples are only ever appended.
+                continue
+            if index > len(self._weather_times) or "Timestamp" not in entry:
+                return False
+            self._add_weather(entry)
+        return True
+
+    def _add_laps(self, laps: list[dict]):
+        self._lap_count += len(laps)
+        for lap in laps:
+            lap_time = sessions.lap_seconds(lap.get("LapTime"))
+            if lap_time is None or lap.get("LapNumber") is None:
+                continue
+            lap_numbers, lap_times = self._laps.setdefault(lap["RacingNumber"], (array("i"), array("d")))
+            position = bisect.bisect_right(lap_numbers, lap["LapNumber"])
+            lap_numbers.insert(position, lap["LapNumber"])
+            lap_times.insert(position, lap_time)
+
+    def _add_weather(self, entry: dict):
+        self._weather_times.append(_parse_timestamp(entry["Timestamp"]))
+        weather = entry.get("Weather") or {}
+        for field, values in self._weather.items():
+            values.append(_to_float(weather.get(field)))
+
+    async def _ensure_loaded(self):
+        if self._loaded:
+            return
+        async with self._lock:
+            if self._loaded:
+                return
+            self._loading = True
+            try:
+                await self._load()
+                backlog, self._backlog = self._backlog, []
+                self._loaded = all(self._apply(event, replayed=True) for event in backlog)
+            finally:
+                self._loading = False
+                self._backlog = []
+
+    async def _load(self):
+        self._reset()
+        session = await self._redis_client.get(sessions.CURRENT_SESSION_KEY)
+        if not session:
+            return
+        session = session.decode('utf-8')
+        async with self._redis_client.pipeline(transaction=True) as pipe:
+            pipe.lrange(sessions.session_key(session, LAP_DATA_KEY), 0, -1)
+            storage.read_many(pipe, [sessions.session_key(session, WEATHER_SERIES_KEY)])
+            with REDIS_SECONDS.time("series"):
+                laps, (weather,) = await pipe.execute()
+        self._add_laps([codec.unpack(lap) for lap in laps])
+        for entry in ((storage.unpack(weather)["payload"] or {}).get("Series") or []) if weather else []:
+            if "Timestamp" in entry:
+                self._add_weather(entry)
+
+    async def laps(self, from_lap: int | None, to_lap: int | None, drivers: set[str] | None, points: int | None) -> dict[str, dict[str, list]]:
+        """
+        The lap times in seconds of every driver, or only of `drivers`, within the lap range,
+        with at most `points` laps per driver.
+        """
+        await self._ensure_loaded()
+        result = {}
+        for racing_number, (lap_numbers, lap_times) in self._laps.items():
+            if drivers and racing_number not in drivers:
+                continue
+            start = bisect.bisect_left(lap_numbers, from_lap) if from_lap is not None else 0
+            end = bisect.bisect_right(lap_numbers, to_lap) if to_lap is not None else len(lap_numbers)
+            xs, ys = lap_numbers[start:end], lap_times[start:end]
+            rows = lttb(xs, ys, points) if points else range(len(xs))
+            result[racing_number] = {"LapNumber": [xs[i] for i in rows], "LapTime": [ys[i] for i in rows]}
+        return result
+
+    async def weather(self, start: datetime | None, end: datetime | None, points: int | None) -> dict[str, list]:
+        """
+        The weather samples within the time range as columns, averaged over buckets of
+        consecutive samples when there are more than `points`.
+        """
+        await self._ensure_loaded()
+        times = self._weather_times
+        first = bisect.bisect_left(times, _epoch(start)) if start else 0
+        last = bisect.bisect_right(times, _epoch(end)) if end else len(times)
+        count = last - first
+        buckets = min(points, count) if points else count
+
+        result = {"Timestamp": [], **{field: [] for field in WEATHER_FIELDS}}
+        for bucket in range(buckets):
+            lo = first + bucket * count // buckets
+            hi = first + (bucket + 1) * count // buckets
+            result["Timestamp"].append(_format_timestamp(sum(times[lo:hi]) / (hi - lo)))
+            for field, values in self._weather.items():
+                aggregate = _circular_mean if field == "WindDirection" else _mean
+                value = aggregate(values[lo:hi])
+                result[field].append(round(value, 2) if value is not None else None)
+        return result
@@ -0,0 +1,194 @@
+import asyncio
+import gzip
+import time
+from functools import cached_property
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from common import codec, sessions, storage
+from common.patches import merge
+from hub import message_topic, parse_event_id
+from instruments import REDIS_SECONDS
+
+VERSION_KEY = "Version"
+LAP_DATA_KEY = "LapData"
+EVENT_STREAM_KEY = "Events"
+# Set by the ingestor when it checkpoints: the id of the last event the stored state includes.
+CHECKPOINT_ID_KEY = "CheckpointId"
+LAP_CHUNK_SIZE = 50
+# Snapshots are rebuilt after every message during a session, so they are compressed
+# quickly rather than tightly.
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+COMPRESSORS = {"gzip": lambda body: gzip.compress(body, compresslevel=GZIP_LEVEL)}
+if brotli:
+    COMPRESSORS["br"] = lambda body: brotli.compress(body, quality=BROTLI_QUALITY)
+
+
+def apply_messages(message: dict, messages: list[dict]) -> dict:
+    """
+    Applies the messages of a topic published after its stored state `message` to it: deltas
+    are merged, keyframes replace it, and those the state already includes are skipped.
+    """
+    for update in messages:
+        if update.get("seq", 0) <= message.get("seq", 0):
+            continue
+        payload = merge(message.get("payload"), update["payload"]) if update.get("delta") else update["payload"]
+        message = {"type": message["type"], "payload": payload, "seq": update["seq"]}
+    return message
+
+
+async def read_events_after(redis_client, session: str, event_id: bytes | None) -> list[tuple[str, bytes]]:
+    """The events of the session after a checkpoint, which its stored state may be missing."""
+    if not event_id:
+        return []
+    entries = await redis_client.xrange(sessions.session_key(session, EVENT_STREAM_KEY), min=b"(" + event_id)
+    return [(entry_id.decode('utf-8'), fields[b"data"]) for entry_id, fields in entries]
+
+
+async def read_keyframe(redis_client, session: str, topic: str) -> bytes | None:
+    """
+    The full state of a topic as JSON, including the updates published since the last
+    checkpoint, or None when it has none.
+    """
+    async with redis_client.pipeline(transaction=True) as pipe:
+        storage.read_many(pipe, [sessions.session_key(session, topic)])
+        pipe.get(sessions.session_key(session, CHECKPOINT_ID_KEY))
+        with REDIS_SECONDS.time("keyframe"):
+            (value,), checkpoint_id = await pipe.execute()
+
+    replay = await read_events_after(redis_client, session, checkpoint_id)
+    updates = [codec.loads(data) for _, data in replay if message_topic(data) == topic]
+    if not updates:
+        return storage.to_json(value) if value else None
+    message = storage.unpack(value) if value else {"type": topic, "payload": {}, "seq": 0}
+    return codec.dumps(apply_messages(message, updates))
+
+
+class Snapshot:
+    """
+    The stored state of every topic plus the lap list, serialized once in every form it is
+    served in. With checkpoints, the messages published since the last one follow the stored
+    state, clients applying them as they would on the stream.
+    """
+
+    def __init__(self, version: int, messages: list[bytes], last_event_id: str | None):
+        self.version = version
+        self.messages = messages
+        self.last_event_id = last_event_id
+        self.event_id = parse_event_id(last_event_id) if last_event_id else (0, 0)
+        self.built_at = time.monotonic()
+        self.etag = f'"{version}"'
+        self.body = b'{"version":%d,"messages":[%s]}' % (version, b",".join(messages))
+        self._compressed: dict[str, asyncio.Future] = {}
+        self.events = self._encode_events(messages)
+        self._filtered_events: dict[frozenset[str], bytes] = {}
+
+    def _encode_events(self, messages: list[bytes]) -> bytes:
+        events = [b"data: %s\n\n" % message for message in messages]
+        if self.last_event_id:
+            # Lets a client that loses the connection resume from the event stream.
+            last = events.pop() if events else b"\n"
+            events.append(b"id: %s\n%s" % (self.last_event_id.encode('utf-8'), last))
+        return b"".join(events)
+
+    async def compressed(self, encoding: str) -> bytes:
+        """
+        The body compressed with an encoding of COMPRESSORS. It is compressed in a thread,
+        on the first request that accepts the encoding, and shared by every later one.
+        """
+        future = self._compressed.get(encoding)
+        if future is None:
+            future = self._compressed[encoding] = asyncio.ensure_future(asyncio.to_thread(COMPRESSORS[encoding], self.body))
+        # A request going away does not cancel the compression the others wait for.
+        return await asyncio.shield(future)
+
+    def events_for(self, topics: frozenset[str] | None) -> bytes:
+        """The initial events of a stream of only some topics, encoded once per set of topics."""
+        if topics is None:
+            return self.events
+        events = self._filtered_events.get(topics)
+        if events is None:
+            messages = [message for message in self.messages if message_topic(message) in topics]
+            events = self._filtered_events[topics] = self._encode_events(messages)
+        return events
+
+    @cached_property
+    def rankings(self) -> dict | None:
+        """The payload of the Rankings topic, decoded once per snapshot."""
+        messages = [codec.loads(message) for message in self.messages if message_topic(message) == "Rankings"]
+        return apply_messages(messages[0], messages[1:])["payload"] if messages else None
+
+    @cached_property
+    def msgpack_messages(self) -> list[bytes]:
+        return [codec.msgpack_dumps(codec.loads(message)) for message in self.messages]
+
+
+class SnapshotCache:
+    """
+    Builds the snapshot of the current session from Redis in a single transaction, and
+    only rebuilds it after the hub has seen a new message since the last build.
+    """
+
+    def __init__(self, redis_client, topics: list[str]):
+        self._redis_client = redis_client
+        self._topics = topics
+        self._snapshot = None
+        self._dirty = True
+        self._lock = asyncio.Lock()
+        # When set, called to fetch the snapshot from another worker instead of building it
+        # from Redis, see relay.Relay.
+        self.remote = None
+
+    def invalidate(self, event=None):
+        self._dirty = True
+
+    async def get(self) -> Snapshot:
+        if not self._dirty and self._snapshot:
+            return self._snapshot
+        async with self._lock:
+            # Another request may have rebuilt it while we waited for the lock.
+            if self._dirty or not self._snapshot:
+                self._dirty = False
+                try:
+                    self._snapshot = await self._build()
+                except Exception:
+                    self._dirty = True
+                    raise
+        return self._snapshot
+
+    async def _build(self) -> Snapshot:
+        if self.remote is not None:
+            return await self.remote()
+        session = await self._redis_client.get(sessions.CURRENT_SESSION_KEY)
+        if not session:
+            return Snapshot(int(await self._redis_client.get(VERSION_KEY) or 0), [], None)
+        session = session.decode('utf-8')
+
+        async with self._redis_client.pipeline(transaction=True) as pipe:
+            pipe.get(VERSION_KEY)
+            storage.read_many(pipe, [sessions.session_key(session, topic) for topic in self._topics])
+            pipe.lrange(sessions.session_key(session, LAP_DATA_KEY), 0, -1)
+            pipe.xrevrange(sessions.session_key(session, EVENT_STREAM_KEY), count=1)
+            pipe.get(sessions.session_key(session, CHECKPOINT_ID_KEY))
+            with REDIS_SECONDS.time("snapshot"):
+                version, values, laps, last_events, checkpoint_id = await pipe.execute()
+        replay = await read_events_after(self._redis_client, session, checkpoint_id)
+
+        messages = [storage.to_json(value) for value in values if value]
+        laps = [codec.stored_to_json(lap) for lap in laps]
+        for i in range(0, len(laps), LAP_CHUNK_SIZE):
+            laps_chunk = laps[i:i + LAP_CHUNK_SIZE]
+            messages.append(
+                b'{"type":"LapData","payload":[%s],"seq":%d}' % (b",".join(laps_chunk), i + len(laps_chunk))
+            )
+        messages.extend(data for _, data in replay)
+        if replay:
+            last_event_id = replay[-1][0]
+        else:
+            last_event_id = last_events[0][0].decode('utf-8') if last_events else None
+        return Snapshot(int(version or 0), messages, last_event_id)
@@ -0,0 +1,90 @@
+"""
+Serialization shared by the ingestor and the API.
+
+JSON goes through orjson when it is installed and through the stdlib json module
+otherwise; JSON_CODEC=json forces the stdlib. STORAGE_CODEC=msgpack stores topic state
+and laps in Redis as MessagePack instead of JSON. Messages on the pub/sub channel and
+the event stream are always JSON, as they are forwarded to clients as they are.
+
+With CODEC_STATS=true every call is timed, and stats() returns the call count and the
+seconds spent per function.
+"""
+import json
+import os
+import time
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_CODEC = os.getenv("JSON_CODEC", "orjson" if orjson else "json")
+STORAGE_CODEC = os.getenv("STORAGE_CODEC", "json")
+CODEC_STATS = os.getenv("CODEC_STATS", "false").lower() == "true"
+
+if JSON_CODEC == "orjson" and orjson is None:
+    raise ImportError("JSON_CODEC=orjson requires the orjson package.")
+if STORAGE_CODEC == "msgpack" and msgpack is None:
+    raise ImportError("STORAGE_CODEC=msgpack requires the msgpack package.")
+
+# True when stored values are JSON, and can be served to clients without re-encoding.
+STORAGE_IS_JSON = STORAGE_CODEC == "json"
+
+_stats = {}
+
+
+def _json_dumps(obj) -> bytes:
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _msgpack_dumps(obj) -> bytes:
+    if msgpack is None:
+        raise ImportError("MessagePack encoding requires the msgpack package.")
+    return msgpack.packb(obj)
+
+
+def _timed(name, function):
+    if not CODEC_STATS:
+        return function
+
+    entry = _stats[name] = {"calls": 0, "seconds": 0.0}
+
+    def wrapper(value):
+        start = time.perf_counter()
+        try:
+            return function(value)
+        finally:
+            entry["calls"] += 1
+            entry["seconds"] += time.perf_counter() - start
+
+    return wrapper
+
+
+def stats() -> dict:
+    """Returns the number of calls and seconds spent per codec function, when CODEC_STATS is set."""
+    return {name: dict(entry) for name, entry in _stats.items()}
+
+
+_json_dumps_function = orjson.dumps if JSON_CODEC == "orjson" else _json_dumps
+_json_loads_function = orjson.loads if JSON_CODEC == "orjson" else json.loads
+
+# JSON, for everything that reaches clients.
+dumps = _timed("dumps", _json_dumps_function)
+loads = _timed("loads", _json_loads_function)
+
+# Values stored in Redis.
+pack = _timed("pack", _msgpack_dumps if STORAGE_CODEC == "msgpack" else _json_dumps_function)
+unpack = _timed("unpack", msgpack.unpackb if STORAGE_CODEC == "msgpack" else _json_loads_function)
+
+# The binary WebSocket transport.
+msgpack_dumps = _timed("msgpack_dumps", _msgpack_dumps)
+
+
+def stored_to_json(value: bytes) -> bytes:
+    """Converts a value stored in Redis to JSON, without re-encoding when it already is."""
+    return value if STORAGE_IS_JSON else dumps(unpack(value))
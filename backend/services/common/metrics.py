@@ -0,0 +1,185 @@
+"""
+Minimal Prometheus instrumentation shared by the ingestor and the API.
+
+Counters, gauges and histograms register themselves in a module-level registry, and
+render() returns all of them in the Prometheus text exposition format. Gauges can also
+be computed when scraped, from a callback. The API serves render() at /metrics; the
+ingestor, which has no web server, runs serve() on METRICS_PORT.
+
+serve() also exposes the sampling profiler when PROFILER_ENABLED=true:
+/debug/profile/start?interval=0.005 starts sampling and /debug/profile/stop returns the
+collapsed stacks, ready for flamegraph tools.
+"""
+import asyncio
+import bisect
+import os
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from common import profiler
+
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "false").lower() == "true"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{str(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, description: str, labels=()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(labels)
+        self._values = {}
+        _registry.append(self)
+
+    def _samples(self):
+        for label_values, value in list(self._values.items()):
+            yield self.name, _format_labels(self.label_names, label_values), value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{name}{labels} {value}" for name, labels, value in self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labels=()):
+        super().__init__(name, description, labels)
+        if not self.label_names:
+            self._values[()] = 0
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str, labels=(), callback=None):
+        super().__init__(name, description, labels)
+        # Called on every scrape, returns the value or a {label values: value} dict.
+        self.callback = callback
+
+    def set(self, value: float, *labels):
+        self._values[labels] = value
+
+    def _samples(self):
+        if self.callback:
+            value = self.callback()
+            self._values = value if isinstance(value, dict) else {(): value}
+        yield from super()._samples()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels):
+        series = self._values.get(labels)
+        if series is None:
+            # Per-bucket counts (not cumulative), then the sum and the count.
+            series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def time(self, *labels):
+        """Context manager observing the seconds spent in its block."""
+        return _Timer(self, labels)
+
+    def _samples(self):
+        for label_values, (counts, total, count) in list(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                labels = _format_labels((*self.label_names, "le"), (*label_values, bound))
+                yield f"{self.name}_bucket", labels, cumulative
+            labels = _format_labels(self.label_names, label_values)
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels):
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._histogram.observe(time.perf_counter() - self._start, *self._labels)
+
+
+def render() -> bytes:
+    return ("\n".join(metric.render() for metric in _registry) + "\n").encode("utf-8")
+
+
+def profile_command(path: str, query: dict[str, list[str]]) -> tuple[int, bytes]:
+    """
+    Handles /debug/profile/start and /debug/profile/stop, returning the status and body.
+    Stopping waits for the sampling thread, so async callers run it in a thread.
+    """
+    if not PROFILER_ENABLED:
+        return 404, b"Profiling is disabled, set PROFILER_ENABLED=true.\n"
+    if path == "/debug/profile/start":
+        try:
+            interval = float(query.get("interval", ["0.005"])[0])
+        except ValueError:
+            interval = 0.0
+        if not 0 < interval < float("inf"):
+            return 400, b"interval must be a positive number of seconds.\n"
+        if not profiler.start(interval):
+            return 409, b"The profiler is already running.\n"
+        return 200, f"Sampling every {interval}s.\n".encode("utf-8")
+    if path == "/debug/profile/stop":
+        stacks = profiler.stop()
+        if stacks is None:
+            return 409, b"The profiler is not running.\n"
+        return 200, stacks.encode("utf-8")
+    return 404, b"Not found.\n"
+
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = (await reader.readline()).decode("latin-1").split()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        url = urlsplit(request_line[1] if len(request_line) > 1 else "/")
+        content_type = "text/plain; charset=utf-8"
+        if url.path == "/metrics":
+            status, body, content_type = 200, render(), CONTENT_TYPE
+        else:
+            status, body = await asyncio.to_thread(profile_command, url.path, parse_qs(url.query))
+        writer.write(
+            f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
+    except Exception as e:
+        print(f"(Metrics) Error handling request: {e}")
+    finally:
+        writer.close()
+
+
+async def serve(port: int):
+    """Serves /metrics (and the profiler) over plain HTTP until cancelled."""
+    server = await asyncio.start_server(_handle, "0.0.0.0", port)
+    async with server:
+        await server.serve_forever()
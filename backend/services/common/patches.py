@@ -0,0 +1,40 @@
+"""
+Merging of stream patches into topic state, shared by the ingestor and the API.
+
+Merging is also how patches are combined: merging patch B into patch A gives a patch
+with the effect of applying A and then B.
+"""
+import logging
+
+
+def merge(target, source):
+    """
+    Recursively merges a source object into a target object.
+    """
+    if isinstance(target, dict) and isinstance(source, dict):
+        for key, value in source.items():
+            if key in target:
+                target[key] = merge(target[key], value)
+            else:
+                target[key] = value
+        return target
+    elif isinstance(target, list) and isinstance(source, dict):
+        return merge_list_with_dict(target, source)
+    else:
+        return source
+
+def merge_list_with_dict(target_list: list, source_dict: dict) -> list:
+    """
+    Merges a dictionary into a list.
+    """
+    for key, value in source_dict.items():
+        try:
+            index = int(key)
+            if 0 <= index < len(target_list):
+                target_list[index] = merge(target_list[index], value)
+            else:
+                target_list.append(value)
+        except ValueError:
+            logging.warning(f"Key '{key}' is not an integer, appending value.")
+            target_list.append(value)
+    return target_list
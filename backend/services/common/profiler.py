@@ -0,0 +1,58 @@
+"""
+A sampling profiler that can be switched on and off in a running service.
+
+A background thread records the stack of every other thread at a fixed interval, and
+stop() returns the samples as collapsed stacks ("frame;frame;frame count" per line), the
+input format of flamegraph.pl and speedscope. Only one profile runs at a time.
+"""
+import sys
+import threading
+from collections import Counter
+
+_lock = threading.Lock()
+_thread = None
+_stop = threading.Event()
+_samples: Counter = Counter()
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})"
+
+
+def _sample(interval: float):
+    own_id = threading.get_ident()
+    while not _stop.wait(interval):
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            _samples[";".join(reversed(stack))] += 1
+
+
+def start(interval: float = 0.005) -> bool:
+    """Starts sampling every `interval` seconds. Returns False if a profile is already running."""
+    global _thread
+    with _lock:
+        if _thread is not None:
+            return False
+        _samples.clear()
+        _stop.clear()
+        _thread = threading.Thread(target=_sample, args=(interval,), name="profiler", daemon=True)
+        _thread.start()
+        return True
+
+
+def stop() -> str | None:
+    """Stops sampling and returns the collapsed stacks, or None if no profile is running."""
+    global _thread
+    with _lock:
+        if _thread is None:
+            return None
+        _stop.set()
+        _thread.join()
+        _thread = None
+        return "".join(f"{stack} {count}\n" for stack, count in _samples.most_common())
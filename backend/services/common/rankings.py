@@ -0,0 +1,204 @@
+"""
+The Rankings topic, derived by the ingestor from TimingData, LapCount, TrackStatus and
+SessionInfo, and the pit stop simulation the API answers from it.
+
+Rankings holds, per driver, the position and the gap to the leader and the interval to
+the car ahead in seconds, which the feed only sends as text ("+1.234", "1L", "LAP 12").
+A lapped driver has no gap in seconds but the number of laps behind. It also holds the
+time a pit stop costs at the circuit, under green flag and under a safety car or VSC,
+and the one that applies under the current track status.
+
+The ingestor updates Rankings incrementally: a TimingData patch only recomputes the
+drivers it touches, and the Rankings patch it publishes only carries what changed.
+"""
+import re
+
+# Average time lost to a pit stop (green flag, SC/VSC) per circuit short name.
+PIT_LOSS = {
+    "Melbourne": (19.3, 12.8),
+    "Shanghai": (23.0, 15.0),
+    "Suzuka": (22.5, 10.0),
+    "Sakhir": (23.2, 13.0),
+    "Jeddah": (20.0, 11.0),
+    "Miami": (17.0, 9.0),
+    "Imola": (26.5, 16.5),
+    "Monte Carlo": (19.2, 12.0),
+    "Catalunya": (22.5, 12.5),
+    "Montreal": (18.5, 9.5),
+    "Spielberg": (20.0, 9.0),
+    "Silverstone": (20.0, 9.0),
+    "Spa-Francorchamps": (18.5, 11.0),
+    "Hungaroring": (20.5, 11.5),
+    "Zandvoort": (21.5, 15.5),
+    "Monza": (23.0, 15.0),
+    "Baku": (20.5, 11.0),
+    "Singapore": (22.0, 12.0),
+    "Austin": (20.0, 14.0),
+    "Mexico City": (22.0, 12.0),
+    "Interlagos": (21.0, 11.0),
+    "Las Vegas": (21.0, 13.5),
+    "Lusail": (26.5, 15.5),
+    "Yas Marina Circuit": (22.0, 15.0),
+}
+DEFAULT_PIT_LOSS = (20.0, 12.0)
+# Track statuses under which a stop costs less: safety car (4) and virtual safety car (6).
+NEUTRALIZED_STATUSES = {"4", "6"}
+
+_LAPS_BEHIND = re.compile(r"(\d+)\s*L")
+
+
+def parse_gap(text) -> tuple[float | None, int]:
+    """
+    Parses a gap or interval as sent by the feed into seconds, or None when the driver is
+    a lap or more behind, and the number of laps behind.
+    """
+    if not isinstance(text, str) or not text.strip():
+        return None, 0
+    text = text.strip()
+    if text.upper().startswith("LAP"):
+        # Shown for the leader.
+        return 0.0, 0
+    if "L" in text.upper():
+        laps = _LAPS_BEHIND.search(text.upper())
+        return None, int(laps.group(1)) if laps else 1
+    minutes, _, seconds = text.lstrip("+-").rpartition(":")
+    try:
+        return int(minutes or 0) * 60 + float(seconds), 0
+    except ValueError:
+        return None, 0
+
+
+def _value(field):
+    return field.get("Value") if isinstance(field, dict) else field
+
+
+def driver_entry(line: dict, lap_count: dict | None) -> dict:
+    """The Rankings entry of a driver, from their TimingData line."""
+    position = line.get("Position")
+    retired = bool(line.get("Retired"))
+    stopped = bool(line.get("Stopped"))
+    if str(position) == "1":
+        gap, laps_behind = 0.0, 0
+    else:
+        gap, laps_behind = parse_gap(line.get("GapToLeader"))
+    interval, _ = parse_gap(_value(line.get("IntervalToPositionAhead")))
+    if (retired or stopped) and not line.get("GapToLeader"):
+        current_lap = (lap_count or {}).get("CurrentLap")
+        if current_lap:
+            laps_behind = max(current_lap - (line.get("NumberOfLaps") or 0), 0)
+    return {
+        "Position": int(position) if str(position or "").isdigit() else None,
+        "Gap": gap,
+        "LapsBehind": laps_behind,
+        "Interval": interval if str(position) != "1" else None,
+        "Retired": retired,
+        "Stopped": stopped,
+        "InPit": bool(line.get("InPit")),
+    }
+
+
+def _pit_loss(state: dict) -> dict:
+    session_info = state.get("SessionInfo") or {}
+    circuit = ((session_info.get("Meeting") or {}).get("Circuit") or {}).get("ShortName")
+    green_flag, neutralized = PIT_LOSS.get(circuit, DEFAULT_PIT_LOSS)
+    track_status = str((state.get("TrackStatus") or {}).get("Status", ""))
+    return {
+        "GreenFlag": green_flag,
+        "Neutralized": neutralized,
+        "TrackStatus": track_status,
+        "Current": neutralized if track_status in NEUTRALIZED_STATUSES else green_flag,
+    }
+
+
+def derive(state: dict) -> dict:
+    """Builds the Rankings payload from the state of the feed's topics."""
+    lines = (state.get("TimingData") or {}).get("Lines") or {}
+    lap_count = state.get("LapCount")
+    return {
+        "PitLoss": _pit_loss(state),
+        "Lines": {racing_number: driver_entry(line, lap_count) for racing_number, line in lines.items()},
+    }
+
+
+def update(rankings: dict, patches: dict, state: dict) -> dict | None:
+    """
+    Returns the patch to the Rankings payload after `patches` were merged into `state`,
+    or None when nothing changed. Only the drivers the patches can affect are recomputed.
+    """
+    patch = {}
+    if "SessionInfo" in patches or "TrackStatus" in patches:
+        pit_loss = _pit_loss(state)
+        changed = {key: value for key, value in pit_loss.items() if rankings.get("PitLoss", {}).get(key) != value}
+        if changed:
+            patch["PitLoss"] = changed
+
+    drivers = set()
+    timing_lines = (patches.get("TimingData") or {}).get("Lines")
+    if isinstance(timing_lines, dict):
+        drivers.update(timing_lines)
+    entries = rankings.get("Lines", {})
+    if "LapCount" in patches:
+        # Retired drivers are shown as laps behind the current lap.
+        drivers.update(number for number, entry in entries.items() if entry["Retired"] or entry["Stopped"])
+
+    lines = (state.get("TimingData") or {}).get("Lines") or {}
+    lap_count = state.get("LapCount")
+    line_patches = {}
+    for racing_number in drivers:
+        line = lines.get(racing_number)
+        if not isinstance(line, dict):
+            continue
+        entry = driver_entry(line, lap_count)
+        previous = entries.get(racing_number)
+        if previous is None:
+            line_patches[racing_number] = entry
+            continue
+        changed = {key: value for key, value in entry.items() if previous.get(key) != value}
+        if changed:
+            line_patches[racing_number] = changed
+    if line_patches:
+        patch["Lines"] = line_patches
+    return patch or None
+
+
+def simulate_pit(rankings: dict, racing_number: str, penalty: float = 0, pit_loss: float | None = None) -> dict | None:
+    """
+    Projects where a driver rejoins after a pit stop now, serving `penalty` seconds, with
+    the pit loss of the current track status unless given. Returns None for an unknown driver.
+    """
+    entries = rankings.get("Lines") or {}
+    driver = entries.get(racing_number)
+    if driver is None:
+        return None
+    if pit_loss is None:
+        pit_loss = rankings.get("PitLoss", {}).get("Current", DEFAULT_PIT_LOSS[0])
+    running = {
+        number: entry for number, entry in entries.items()
+        if number != racing_number and entry["Gap"] is not None and not entry["Retired"] and not entry["Stopped"]
+    }
+    result = {
+        "RacingNumber": racing_number,
+        "PitLoss": pit_loss,
+        "Penalty": penalty,
+        "Position": driver["Position"],
+        "Gap": None,
+        "Ahead": None,
+        "Behind": None,
+    }
+    if driver["Gap"] is None:
+        # A lapped driver stays behind every driver on the lead lap.
+        return result
+
+    gap = driver["Gap"] + pit_loss + penalty
+    order = sorted(running.items(), key=lambda item: item[1]["Gap"])
+    ahead = [item for item in order if item[1]["Gap"] <= gap]
+    behind = order[len(ahead):]
+    result["Gap"] = round(gap, 3)
+    result["Position"] = len(ahead) + 1
+    if ahead:
+        number, entry = ahead[-1]
+        result["Ahead"] = {"RacingNumber": number, "Interval": round(gap - entry["Gap"], 3)}
+    if behind:
+        number, entry = behind[0]
+        result["Behind"] = {"RacingNumber": number, "Interval": round(entry["Gap"] - gap, 3)}
+    return result
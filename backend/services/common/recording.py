@@ -0,0 +1,247 @@
+"""
+Compressed, indexed recordings of the raw live feed.
+
+A recording is a directory holding a recording.json manifest and numbered segments.
+Every line of a segment is "<seconds since the recording started> <raw message>", with
+the time taken from a monotonic clock. Lines are compressed in blocks, each block an
+independent zstd frame or gzip member, so the segment as a whole is still a regular
+.zst or .gz file. The .idx file next to each segment has one JSON line per block with
+its byte offset and length, the time of its first and last message and the lap it
+starts on. A block is also closed whenever the lap changes, so seeking to a lap or a
+point in time only decompresses a single block.
+
+The recorder compresses and writes from a thread of its own, so record() never blocks
+the event loop. Compression is zstd when the zstandard package is installed and gzip
+otherwise; RECORD_COMPRESSION forces either.
+
+Usage: python services/common/recording.py <recording dir> [--start S | --lap N]
+prints the raw messages from that point on, in the simulator's output.log format.
+"""
+import argparse
+import gzip
+import json
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+RECORD_COMPRESSION = os.getenv("RECORD_COMPRESSION", "zstd" if zstandard else "gzip")
+RECORD_SEGMENT_SECONDS = float(os.getenv("RECORD_SEGMENT_SECONDS", "600"))
+RECORD_BLOCK_SECONDS = float(os.getenv("RECORD_BLOCK_SECONDS", "10"))
+RECORD_BLOCK_BYTES = int(os.getenv("RECORD_BLOCK_BYTES", str(256 * 1024)))
+
+if RECORD_COMPRESSION == "zstd" and zstandard is None:
+    raise ImportError("RECORD_COMPRESSION=zstd requires the zstandard package.")
+
+MANIFEST = "recording.json"
+EXTENSIONS = {"zstd": ".zst", "gzip": ".gz"}
+_CURRENT_LAP = re.compile(r"""["']CurrentLap["']\s*:\s*(\d+)""")
+
+
+def _compressor(compression: str):
+    if compression == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress
+    return lambda data: gzip.compress(data, compresslevel=6)
+
+
+def _decompressor(compression: str):
+    if compression == "zstd":
+        if zstandard is None:
+            raise ImportError("Reading a zstd recording requires the zstandard package.")
+        return zstandard.ZstdDecompressor().decompress
+    return gzip.decompress
+
+
+class Recorder:
+    """Appends raw feed messages to a new recording in `directory`."""
+
+    def __init__(self, directory: Path, compression: str = RECORD_COMPRESSION):
+        started_at = datetime.now(timezone.utc)
+        self.path = Path(directory) / started_at.strftime("%Y%m%d-%H%M%S")
+        self._compression = compression
+        self._compress = _compressor(compression)
+        self._origin = time.monotonic()
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = None
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        manifest = {"started_at": started_at.isoformat(), "compression": compression}
+        (self.path / MANIFEST).write_text(json.dumps(manifest))
+
+        self._segment_number = 0
+        self._segment = None
+        self._index = None
+        self._segment_start = 0.0
+        self._lines = []
+        self._block_bytes = 0
+        self._block_start = None
+        self._block_end = 0.0
+        self._block_lap = None
+        self._lap = None
+        self.messages = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._writer, name="recorder", daemon=True)
+        self._thread.start()
+
+    def record(self, message: str):
+        """Queues a message for writing, timestamped now."""
+        self._queue.put((time.monotonic() - self._origin, message))
+
+    def stop(self):
+        """Writes out every queued message and closes the recording. Blocks until done."""
+        if self._thread:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _writer(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=RECORD_BLOCK_SECONDS)
+            except queue.Empty:
+                # Quiet feed, make what was received so far readable.
+                self._flush_block()
+                continue
+            if item is None:
+                break
+            try:
+                self._write(*item)
+            except Exception as e:
+                print(f"(Recorder) Error writing message: {e}", file=sys.stderr)
+        self._flush_block()
+        self._close_segment()
+
+    def _write(self, elapsed: float, message: str):
+        # The precision it is written with, so the index matches the lines.
+        elapsed = round(elapsed, 3)
+        lap = _CURRENT_LAP.search(message)
+        if lap and int(lap.group(1)) != self._lap:
+            # A lap starts a new block, so it can be found without decompressing the previous one.
+            self._flush_block()
+            self._lap = int(lap.group(1))
+
+        if self._segment is None or elapsed - self._segment_start >= RECORD_SEGMENT_SECONDS:
+            self._flush_block()
+            self._open_segment(elapsed)
+
+        if self._block_start is None:
+            self._block_start = elapsed
+            self._block_lap = self._lap
+        line = f"{elapsed:.3f} {message}\n".encode("utf-8")
+        self._lines.append(line)
+        self._block_bytes += len(line)
+        self._block_end = elapsed
+        self.messages += 1
+
+        if self._block_bytes >= RECORD_BLOCK_BYTES or elapsed - self._block_start >= RECORD_BLOCK_SECONDS:
+            self._flush_block()
+
+    def _open_segment(self, elapsed: float):
+        self._close_segment()
+        self._segment_number += 1
+        name = f"segment-{self._segment_number:05d}{EXTENSIONS[self._compression]}"
+        self._segment = open(self.path / name, "ab")
+        self._index = open(self.path / f"{name}.idx", "a")
+        self._segment_start = elapsed
+
+    def _close_segment(self):
+        if self._segment:
+            self._segment.close()
+            self._index.close()
+            self._segment = self._index = None
+
+    def _flush_block(self):
+        if not self._lines or self._segment is None:
+            return
+        frame = self._compress(b"".join(self._lines))
+        offset = self._segment.tell()
+        self._segment.write(frame)
+        self._segment.flush()
+        entry = {
+            "offset": offset, "length": len(frame), "start": self._block_start, "end": self._block_end,
+            "lap": self._block_lap, "messages": len(self._lines),
+        }
+        # The index is written after the block, so every indexed block is complete.
+        self._index.write(json.dumps(entry) + "\n")
+        self._index.flush()
+        self._lines = []
+        self._block_bytes = 0
+        self._block_start = None
+
+
+def read_index(recording: Path) -> list[tuple[Path, dict]]:
+    """Returns every block of the recording in order, with the segment it is in."""
+    blocks = []
+    for index_path in sorted(Path(recording).glob("segment-*.idx")):
+        segment = index_path.with_suffix("")
+        with open(index_path) as f:
+            blocks.extend((segment, json.loads(line)) for line in f if line.strip())
+    return blocks
+
+
+def read_messages(recording: Path, start: float = 0.0, lap: int | None = None):
+    """
+    Yields (seconds since the recording started, raw message) from `start` seconds, or from
+    the first message of `lap`, to the end of the recording.
+    """
+    recording = Path(recording)
+    manifest = json.loads((recording / MANIFEST).read_text())
+    decompress = _decompressor(manifest["compression"])
+    blocks = read_index(recording)
+
+    if lap is not None:
+        first = next((i for i, (_, block) in enumerate(blocks) if block["lap"] is not None and block["lap"] >= lap), len(blocks))
+        if first < len(blocks):
+            start = blocks[first][1]["start"]
+    else:
+        # The last block that starts at or before `start`.
+        first = 0
+        for i, (_, block) in enumerate(blocks):
+            if block["start"] > start:
+                break
+            first = i
+
+    handles = {}
+    try:
+        for segment, block in blocks[first:]:
+            if segment not in handles:
+                handles[segment] = open(segment, "rb")
+            f = handles[segment]
+            f.seek(block["offset"])
+            # Not splitlines(): messages may contain line separators other than "\n", such
+            # as U+2028, which JSON allows unescaped.
+            for line in decompress(f.read(block["length"])).decode("utf-8").split("\n"):
+                if not line:
+                    continue
+                elapsed, _, message = line.partition(" ")
+                if float(elapsed) >= start:
+                    yield float(elapsed), message
+    finally:
+        for f in handles.values():
+            f.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recording", type=Path)
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--start", type=float, default=0.0, help="seconds since the recording started")
+    group.add_argument("--lap", type=int)
+    args = parser.parse_args()
+
+    for _, message in read_messages(args.recording, args.start, args.lap):
+        sys.stdout.write(message + "\n")
+
+
+if __name__ == "__main__":
+    main()
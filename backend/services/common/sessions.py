@@ -0,0 +1,109 @@
+"""
+Redis layout of sessions, shared by the ingestor and the API.
+
+The live state of a session is kept under keys namespaced by its id
+("session:<id>:TimingData", "session:<id>:LapData", ...), and CurrentSession holds the
+id of the session being served live. When a session ends, it is compacted into a single
+archive hash: the final snapshot, and the laps and the final timing as column tables,
+each stored gzipped. Archived sessions are listed in the Sessions sorted set, scored by
+the time they were archived.
+"""
+import gzip
+import re
+import time
+
+from common import codec
+
+CURRENT_SESSION_KEY = "CurrentSession"
+SESSIONS_KEY = "Sessions"
+# Used until the feed sends a SessionInfo to name the session by.
+UNKNOWN_SESSION = "unknown"
+LAP_COLUMNS = ["LapNumber", "RacingNumber", "LapTime", "Seconds"]
+
+
+def session_key(session_id: str, name: str) -> str:
+    return f"session:{session_id}:{name}"
+
+
+def archive_key(session_id: str) -> str:
+    return f"archive:{session_id}"
+
+
+def session_id(session_info: dict) -> str | None:
+    """
+    Identifies a session by the feed's session key, or by its path or name where the
+    feed (e.g. a recorded or synthetic one) has no key.
+    """
+    if not isinstance(session_info, dict):
+        return None
+    if session_info.get("Key"):
+        return str(session_info["Key"])
+    name = session_info.get("Path")
+    if not name:
+        meeting = session_info.get("Meeting") or {}
+        name = " ".join(str(part) for part in (meeting.get("Name"), session_info.get("Name") or session_info.get("Type")) if part)
+    slug = re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-") if name else ""
+    return slug or None
+
+
+def lap_seconds(lap_time: str) -> float | None:
+    """Converts a lap time such as "1:32.456" to seconds."""
+    try:
+        minutes, _, seconds = lap_time.rpartition(":")
+        return int(minutes or 0) * 60 + float(seconds)
+    except (AttributeError, ValueError):
+        return None
+
+
+def lap_table(laps: list[dict]) -> dict[str, list]:
+    """Turns the lap list into columns, ordered by lap number and then by arrival."""
+    laps = sorted(laps, key=lambda lap: lap.get("LapNumber") or 0)
+    return {
+        "LapNumber": [lap.get("LapNumber") for lap in laps],
+        "RacingNumber": [lap.get("RacingNumber") for lap in laps],
+        "LapTime": [lap.get("LapTime") for lap in laps],
+        "Seconds": [lap_seconds(lap.get("LapTime")) for lap in laps],
+    }
+
+
+def timing_table(timing_data: dict) -> dict[str, list]:
+    """
+    Turns the final timing lines into columns, one row per driver. Scalar fields and the
+    value of {"Value": ...} fields (e.g. BestLapTime) become columns, nested data is dropped.
+    """
+    lines = (timing_data or {}).get("Lines") or {}
+    rows = []
+    for racing_number, line in lines.items():
+        row = {"RacingNumber": racing_number}
+        for field, value in line.items():
+            if isinstance(value, dict) and "Value" in value:
+                value = value["Value"]
+            if value is None or isinstance(value, (str, int, float, bool)):
+                row[field] = value
+        rows.append(row)
+
+    columns = list(dict.fromkeys(field for row in rows for field in row))
+    return {column: [row.get(column) for row in rows] for column in columns}
+
+
+def build_archive(session: str, state: dict, seq: dict, laps: list[dict], version: int) -> dict[str, bytes]:
+    """Returns the fields of the archive hash of a finished session."""
+    messages = [
+        codec.dumps({"type": topic, "payload": payload, "seq": seq.get(topic, 0)})
+        for topic, payload in state.items()
+    ]
+    messages.append(codec.dumps({"type": "LapData", "payload": laps, "seq": len(laps)}))
+    snapshot = b'{"version":%d,"messages":[%s]}' % (version, b",".join(messages))
+    meta = {
+        "id": session,
+        "session_info": state.get("SessionInfo"),
+        "archived_at": time.time(),
+        "laps": len(laps),
+        "version": version,
+    }
+    return {
+        "meta": codec.dumps(meta),
+        "snapshot": gzip.compress(snapshot),
+        "laps": gzip.compress(codec.dumps(lap_table(laps))),
+        "timing": gzip.compress(codec.dumps(timing_table(state.get("TimingData")))),
+    }
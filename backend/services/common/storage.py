@@ -0,0 +1,177 @@
+"""
+Storage of topic state in Redis, shared by the ingestor and the API.
+
+By default the state of a topic is stored as a single value in the STORAGE_CODEC format,
+rewritten whole on every update. With STORAGE_BACKEND=redisjson, topics are stored as
+RedisJSON documents (the module ships with the redis-stack images): an update is applied
+to the stored document at the paths it touches, with JSON.MERGE, JSON.SET and
+JSON.ARRAPPEND, and readers can fetch a part of a topic, such as one driver's timing line,
+without transferring the whole document. Laps are stored the same way with either backend.
+
+A stored topic is the message {"type", "payload", "seq"} of its full state.
+"""
+import os
+
+from common import codec
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "string")
+
+if STORAGE_BACKEND not in ("string", "redisjson"):
+    raise ValueError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+
+REDISJSON = STORAGE_BACKEND == "redisjson"
+
+
+def json_path(path) -> str:
+    """The JSONPath of a path given as keys and list indices (or a slice, last)."""
+    parts = ["$"]
+    for part in path:
+        if isinstance(part, slice):
+            parts.append(f"[{'' if part.start is None else part.start}:{'' if part.stop is None else part.stop}]")
+        elif isinstance(part, int):
+            parts.append(f"[{part}]")
+        else:
+            parts.append(f"[{codec.dumps(str(part)).decode('utf-8')}]")
+    return "".join(parts)
+
+
+def _mergeable(target, source) -> bool:
+    """Whether JSON.MERGE applies `source` to `target` as common.patches.merge does."""
+    if source is None:
+        # merge() stores nulls, JSON.MERGE deletes the key.
+        return False
+    if isinstance(source, dict):
+        if isinstance(target, list):
+            # A list patched by index.
+            return False
+        target = target if isinstance(target, dict) else {}
+        return all(_mergeable(target.get(key), value) for key, value in source.items())
+    return True
+
+
+def _patch_commands(target, source, path) -> list[tuple] | None:
+    if _mergeable(target, source):
+        return [("JSON.MERGE", path, source)]
+
+    if isinstance(target, dict) and isinstance(source, dict):
+        commands, merged = [], {}
+        for key, value in source.items():
+            if _mergeable(target.get(key), value):
+                merged[key] = value
+                continue
+            nested = _patch_commands(target.get(key), value, (*path, key))
+            if nested is None:
+                return None
+            commands.extend(nested)
+        if merged:
+            commands.insert(0, ("JSON.MERGE", path, merged))
+        return commands
+
+    if isinstance(target, list) and isinstance(source, dict):
+        commands, appended = [], []
+        for key, value in source.items():
+            try:
+                index = int(key)
+            except ValueError:
+                index = -1
+            if 0 <= index < len(target):
+                nested = _patch_commands(target[index], value, (*path, index))
+                if nested is None:
+                    return None
+                commands.extend(nested)
+            elif 0 <= index < len(target) + len(appended):
+                # Patches an item appended by the same patch: not worth expressing by path.
+                return None
+            else:
+                appended.append(value)
+        if appended:
+            commands.append(("JSON.ARRAPPEND", path, *appended))
+        return commands
+
+    return [("JSON.SET", path, source)]
+
+
+def patch_commands(key: str, payload, patch, seq: int) -> list[tuple] | None:
+    """
+    The RedisJSON commands that apply a stream patch to the stored document of a topic
+    whose payload is `payload`, before merging, and set its sequence number. Returns None
+    when the patch cannot be applied by path, and the document must be written whole.
+
+    The values are encoded right away, as merging may share the patch's objects with the
+    state and later patches would then modify them.
+    """
+    commands = _patch_commands(payload, patch, ("payload",))
+    if commands is None:
+        return None
+    encoded = [
+        (command, key, json_path(path), *[codec.dumps(value) for value in values])
+        for command, path, *values in commands
+    ]
+    encoded.append(("JSON.SET", key, json_path(("seq",)), b"%d" % seq))
+    return encoded
+
+
+def write(pipe, key: str, message: dict):
+    """Queues writing the whole stored state of a topic."""
+    if REDISJSON:
+        pipe.execute_command("JSON.SET", key, "$", codec.dumps(message))
+    else:
+        pipe.set(key, codec.pack(message))
+
+
+def write_commands(pipe, commands: list[tuple]):
+    """Queues the commands returned by patch_commands."""
+    for command in commands:
+        pipe.execute_command(*command)
+
+
+def read_many(pipe, keys: list[str]):
+    """Queues reading the stored state of topics, None for those with none."""
+    if REDISJSON:
+        # The legacy path "." returns the document itself rather than a list of matches.
+        pipe.execute_command("JSON.MGET", *keys, ".")
+    else:
+        pipe.mget(keys)
+
+
+async def read(redis_client, key: str) -> bytes | None:
+    """The stored state of a topic, see to_json and unpack."""
+    if REDISJSON:
+        return await redis_client.execute_command("JSON.GET", key, ".")
+    return await redis_client.get(key)
+
+
+def to_json(value: bytes) -> bytes:
+    """Converts a stored state to JSON, without re-encoding when it already is."""
+    return value if REDISJSON else codec.stored_to_json(value)
+
+
+def unpack(value: bytes) -> dict:
+    return codec.loads(value) if REDISJSON else codec.unpack(value)
+
+
+def _select(node, path) -> list:
+    if not path:
+        return [node]
+    part, rest = path[0], path[1:]
+    if isinstance(part, slice):
+        items = node[part] if isinstance(node, list) else []
+        return [match for item in items for match in _select(item, rest)]
+    if isinstance(node, dict) and not isinstance(part, int) and part in node:
+        return _select(node[part], rest)
+    if isinstance(node, list) and isinstance(part, int) and -len(node) <= part < len(node):
+        return _select(node[part], rest)
+    return []
+
+
+async def read_path(redis_client, key: str, path) -> list:
+    """
+    The values at a path in the stored state of a topic, given as keys and list indices,
+    and possibly slices: [] when there are none. With RedisJSON only those values are
+    transferred, otherwise the whole state is read and decoded.
+    """
+    if REDISJSON:
+        matches = await redis_client.execute_command("JSON.GET", key, json_path(path))
+        return codec.loads(matches) if matches else []
+    value = await redis_client.get(key)
+    return _select(codec.unpack(value), list(path)) if value else []
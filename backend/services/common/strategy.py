@@ -0,0 +1,205 @@
+"""
+The StrategyModel topic: per driver, the degradation of their current tyres and the window
+in which a pit stop costs the least, derived by the ingestor from the laps it extracts,
+TyreStintSeries, LapCount and the pit loss in Rankings.
+
+Degradation is the slope of a least squares fit of lap time against tyre age over the
+last FIT_WINDOW laps of the stint, after correcting lap times for the fuel burnt. The fit
+is kept as running sums, so each new lap updates it in constant time. The first lap of
+each stint (an out lap, or the start) and laps much slower than the stint's best (in
+laps, safety car laps) are left out.
+
+The pit window assumes a single remaining stop onto tyres degrading like the current
+ones. Stopping after k more laps costs the degradation on the old tyres for k laps and on
+new ones for the rest of the race; the window is the laps at which a stop costs at most
+PIT_WINDOW_MARGIN more than the best one, and there is none when no stop gains more than
+the pit loss.
+"""
+from collections import deque
+
+from common.sessions import lap_seconds
+
+# Laps per stint the degradation is fitted over.
+FIT_WINDOW = 15
+# Fewest laps a stint needs before its degradation is published.
+MIN_FIT_LAPS = 4
+# Lap time gained per lap from burning fuel, in seconds.
+FUEL_EFFECT = 0.055
+# Laps slower than this ratio of the stint's best lap are not fitted.
+SLOW_LAP_RATIO = 1.07
+# Seconds a stop may cost over the best one and still be in the window.
+PIT_WINDOW_MARGIN = 1.0
+
+
+class _Fit:
+    """A least squares line over the last FIT_WINDOW points, kept as running sums."""
+
+    def __init__(self):
+        self.points = deque()
+        self.n = 0
+        self.sx = self.sy = self.sxx = self.sxy = 0.0
+
+    def add(self, x: float, y: float):
+        self.points.append((x, y))
+        self._update(x, y, 1)
+        if len(self.points) > FIT_WINDOW:
+            self._update(*self.points.popleft(), -1)
+
+    def _update(self, x, y, sign):
+        self.n += sign
+        self.sx += sign * x
+        self.sy += sign * y
+        self.sxx += sign * x * x
+        self.sxy += sign * x * y
+
+    def line(self) -> tuple[float, float] | None:
+        """The slope and intercept, or None with too few points."""
+        denominator = self.n * self.sxx - self.sx * self.sx
+        if self.n < MIN_FIT_LAPS or denominator <= 0:
+            return None
+        slope = (self.n * self.sxy - self.sx * self.sy) / denominator
+        return slope, (self.sy - slope * self.sx) / self.n
+
+
+class _Stint:
+    def __init__(self):
+        self.fit = _Fit()
+        self.best = None
+
+
+def _stint_of(stints: list[dict], lap_number: int) -> tuple[int, int] | None:
+    """
+    The index of the stint a lap was driven in and the tyre age at its end, from the
+    stint lengths. Laps past the last stint's known length belong to it, as the feed
+    updates TyreStintSeries after the lap.
+    """
+    start = 0
+    for index, stint in enumerate(stints):
+        start_age = stint.get("StartLaps") or 0
+        length = max((stint.get("TotalLaps") or 0) - start_age, 0)
+        if lap_number <= start + length or index == len(stints) - 1:
+            return index, start_age + lap_number - start
+        start += length
+    return None
+
+
+def _pit_window(slope: float, age: int, last_lap: int, remaining: int, pit_loss: float) -> dict | None:
+    def cost(k):
+        # Degradation over k more laps on the old tyres, then the rest on new ones.
+        return slope * (k * age + k * (k + 1) / 2 + (remaining - k) * (remaining - k + 1) / 2)
+
+    # The driver can stop at the end of the lap they are on at the earliest, and not
+    # stopping is k = remaining.
+    stops = range(1, remaining)
+    if not stops:
+        return None
+    costs = {k: cost(k) for k in (*stops, remaining)}
+    best = min(stops, key=costs.__getitem__)
+    gain = costs[remaining] - costs[best] - pit_loss
+    if gain <= 0:
+        return None
+    window = [k for k in stops if costs[k] <= costs[best] + PIT_WINDOW_MARGIN]
+    return {
+        "Open": last_lap + window[0],
+        "Optimal": last_lap + best,
+        "Close": last_lap + window[-1],
+        "Gain": round(gain, 1),
+    }
+
+
+def _pit_loss(state: dict) -> float:
+    return ((state.get("Rankings") or {}).get("PitLoss") or {}).get("Current", 0)
+
+
+class StrategyModel:
+    """
+    The fits of every driver's stints. add_laps() feeds it the laps as they are extracted,
+    and update() returns the patch to the published StrategyModel payload.
+    """
+
+    def __init__(self):
+        # Per racing number, per stint index.
+        self._stints: dict[str, dict[int, _Stint]] = {}
+        self._last_laps: dict[str, int] = {}
+        # The pit loss of the last update(), Rankings changing it far less often than it
+        # is published.
+        self._pit_loss: float | None = None
+
+    def add_laps(self, laps: list[dict], state: dict):
+        all_stints = ((state.get("TyreStintSeries") or {}).get("Stints") or {})
+        for lap in laps:
+            racing_number, lap_number = lap.get("RacingNumber"), lap.get("LapNumber")
+            lap_time = lap_seconds(lap.get("LapTime"))
+            stints = all_stints.get(racing_number)
+            if lap_time is None or not lap_number or not isinstance(stints, list) or not stints:
+                continue
+            self._last_laps[racing_number] = max(lap_number, self._last_laps.get(racing_number, 0))
+            stint_of = _stint_of(stints, lap_number)
+            if stint_of is None:
+                continue
+            index, age = stint_of
+            stint = self._stints.setdefault(racing_number, {}).setdefault(index, _Stint())
+            if age == (stints[index].get("StartLaps") or 0) + 1:
+                # An out lap, or the start.
+                continue
+            if stint.best is not None and lap_time > stint.best * SLOW_LAP_RATIO:
+                continue
+            stint.best = lap_time if stint.best is None else min(stint.best, lap_time)
+            stint.fit.add(age, lap_time + FUEL_EFFECT * lap_number)
+
+    def _entry(self, racing_number: str, stints: list, remaining_laps: int | None, pit_loss: float) -> dict:
+        index = len(stints) - 1
+        current = stints[index]
+        last_lap = self._last_laps.get(racing_number, 0)
+        stint_of = _stint_of(stints, last_lap) if last_lap else None
+        age = stint_of[1] if stint_of and stint_of[0] == index else current.get("TotalLaps") or 0
+        stint = self._stints.get(racing_number, {}).get(index)
+        line = stint.fit.line() if stint else None
+        entry = {
+            "Stint": index + 1,
+            "Compound": current.get("Compound"),
+            "TyreAge": age,
+            "FittedLaps": stint.fit.n if stint else 0,
+            "Degradation": None,
+            "ProjectedLapTime": None,
+            "PitWindow": None,
+        }
+        if line is None:
+            return entry
+        slope, intercept = line
+        entry["Degradation"] = round(slope, 3)
+        entry["ProjectedLapTime"] = round(intercept + slope * (age + 1) - FUEL_EFFECT * (last_lap + 1), 3)
+        if remaining_laps and remaining_laps > 0 and slope > 0:
+            entry["PitWindow"] = _pit_window(slope, age, last_lap, remaining_laps, pit_loss)
+        return entry
+
+    def pit_loss_changed(self, state: dict) -> bool:
+        """Whether the pit loss in Rankings differs from the one the entries were computed with."""
+        return _pit_loss(state) != self._pit_loss
+
+    def update(self, state: dict) -> dict | None:
+        """
+        Recomputes every driver's entry and returns the patch to the payload, or None when
+        nothing changed. Every entry can change with each lap, as the race gets shorter.
+        """
+        all_stints = ((state.get("TyreStintSeries") or {}).get("Stints") or {})
+        lap_count = state.get("LapCount") or {}
+        total_laps = lap_count.get("TotalLaps")
+        pit_loss = self._pit_loss = _pit_loss(state)
+
+        lines = (state.get("StrategyModel") or {}).get("Lines") or {}
+        patch = {}
+        for racing_number, stints in all_stints.items():
+            if not isinstance(stints, list) or not stints:
+                continue
+            last_lap = self._last_laps.get(racing_number) or lap_count.get("CurrentLap") or 0
+            remaining = total_laps - last_lap if total_laps else None
+            entry = self._entry(racing_number, stints, remaining, pit_loss)
+            previous = lines.get(racing_number)
+            if previous is None:
+                patch[racing_number] = entry
+            else:
+                changed = {key: value for key, value in entry.items() if previous.get(key) != value}
+                if changed:
+                    patch[racing_number] = changed
+        return {"Lines": patch} if patch else None
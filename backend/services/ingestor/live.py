@@ -4,10 +4,18 @@ import websockets
 import json
 import asyncio
 import redis.asyncio as redis
-import re
+from redis.exceptions import WatchError
 import logging
 import signal
+import sys
 import time
+from pathlib import Path
+
+import signalr_json
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common import codec, metrics, rankings, recording, sessions, storage, strategy
+from common.patches import merge
 
 # Setup basic logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -19,45 +27,56 @@ REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:16379")
 INACTIVITY_TIMEOUT = int(os.getenv("INACTIVITY_TIMEOUT", "60"))
 MONITOR_INTERVAL = int(os.getenv("MONITOR_INTERVAL", "10"))
 MAX_RECONNECT_DELAY = int(os.getenv("MAX_RECONNECT_DELAY", "60"))
+# Seconds between state checkpoints to Redis. 0 writes every merged topic through on each message.
+CHECKPOINT_INTERVAL = float(os.getenv("CHECKPOINT_INTERVAL", "0"))
+# Every Nth update of a topic is published as a full keyframe instead of a delta.
+KEYFRAME_INTERVAL = int(os.getenv("KEYFRAME_INTERVAL", "100"))
+# Milliseconds to keep collecting messages after the first one, to merge patches per topic. 0 disables it.
+COALESCE_WINDOW = int(os.getenv("COALESCE_WINDOW_MS", "0")) / 1000
+# Directory to record the raw feed to, one recording per run. Empty disables recording.
+RECORD_DIR = os.getenv("RECORD_DIR", "")
+# Port of the HTTP listener serving /metrics (and the profiler, see common.metrics). 0 disables it.
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
 
+# --- Metrics ---
+QUEUE_DEPTH = metrics.Gauge("ingestor_queue_depth", "Messages received and not yet processed.")
+MESSAGES_RECEIVED = metrics.Counter("ingestor_messages_received_total", "Raw messages received from the feed.")
+PATCHES_RECEIVED = metrics.Counter("ingestor_patches_received_total", "Stream patches received, per topic.", ["topic"])
+UPDATES_PUBLISHED = metrics.Counter("ingestor_updates_published_total", "Updates published, per topic and kind.", ["topic", "kind"])
+LAPS_PUBLISHED = metrics.Counter("ingestor_laps_total", "Completed laps extracted from the timing data.")
+MESSAGE_LATENCY = metrics.Histogram("ingestor_message_latency_seconds", "Time from receiving a message to publishing its updates.")
+BATCH_SECONDS = metrics.Histogram("ingestor_batch_processing_seconds", "Time spent decoding, merging and publishing a batch.")
+REDIS_SECONDS = metrics.Histogram("ingestor_redis_seconds", "Redis round-trip time, per operation.", ["operation"])
+
+# Number of published events kept in the Redis Stream for clients resuming a dropped connection.
+EVENT_STREAM_MAXLEN = int(os.getenv("EVENT_STREAM_MAXLEN", "10000"))
+
+# Every topic is published on a channel of its own, "channel:1:<topic>", so consumers can
+# subscribe to only what they need. Messages are framed as "<event id> <message json>",
+# the id being that of the same message in the event stream.
+REDIS_CHANNEL_NAME = "channel:1"
+# Per session keys, see common.sessions.
+EVENT_STREAM_KEY = "Events"
+LAP_DATA_KEY = "LapData"
+# With checkpoints, the id of the last event the stored state includes. Readers replay the
+# events after it, which the stored state may be missing until the next checkpoint.
+CHECKPOINT_ID_KEY = "CheckpointId"
+# Incremented on every write to the stored state and every published event, so readers can
+# version their snapshots: with checkpoints, a snapshot also changes with the events it
+# replays. Never cleared, so versions stay unique across sessions.
+VERSION_KEY = "Version"
+TOPICS = [
+    "Heartbeat", "RaceControlMessages", "TimingData", "SessionInfo", "LapCount",
+    "TrackStatus", "DriverList", "WeatherData", "WeatherDataSeries", "TyreStintSeries"
+]
+# Topics computed from the feed's topics and published alongside them, see common.rankings
+# and common.strategy.
+RANKINGS_KEY = "Rankings"
+STRATEGY_KEY = "StrategyModel"
+STORED_TOPICS = [*TOPICS, RANKINGS_KEY, STRATEGY_KEY]
+# Topics the strategy model depends on, besides the laps and the pit loss in Rankings.
+STRATEGY_INPUTS = {"TyreStintSeries", "LapCount"}
 
-def fix_json(elem):
-    """Cleans up F1's non-compliant JSON data."""
-    elem = elem.replace("'", '"').replace('True', 'true').replace('False', 'false')
-    elem = re.sub(r'(\w)"(\w)', r'\1\\"\2', elem)
-    return elem
-
-def merge(target, source):
-    """
-    Recursively merges a source object into a target object.
-    """
-    if isinstance(target, dict) and isinstance(source, dict):
-        for key, value in source.items():
-            if key in target:
-                target[key] = merge(target[key], value)
-            else:
-                target[key] = value
-        return target
-    elif isinstance(target, list) and isinstance(source, dict):
-        return merge_list_with_dict(target, source)
-    else:
-        return source
-
-def merge_list_with_dict(target_list: list, source_dict: dict) -> list:
-    """
-    Merges a dictionary into a list.
-    """
-    for key, value in source_dict.items():
-        try:
-            index = int(key)
-            if 0 <= index < len(target_list):
-                target_list[index] = merge(target_list[index], value)
-            else:
-                target_list.append(value)
-        except ValueError:
-            logging.warning(f"Key '{key}' is not an integer, appending value.")
-            target_list.append(value)
-    return target_list
 
 def extract_laps(payload):
     """Extracts lap time events from the payload."""
@@ -82,13 +101,29 @@ def extract_laps(payload):
 
 
 class LiveFeed:
-    def __init__(self):
+    def __init__(self, serve_metrics: bool = True):
+        self._serve_metrics = serve_metrics
+        self._prepared = False
         self._redis_client = redis.from_url(REDIS_URL)
         self._websocket = None
         self._message_queue = asyncio.Queue()
         self._shutdown_event = asyncio.Event()
         self._tasks = []
         self._last_activity_time = None
+        self._state = {}
+        self._seq = {}
+        self._lap_count = 0
+        self._last_event_id = (0, 0)
+        self._session = None
+        self._dirty_topics = set()
+        # With RedisJSON storage, the commands writing the last patch of each topic by path,
+        # and the topics whose stored document may be behind and must be written whole.
+        self._store_commands = {}
+        self._unsynced_topics = set()
+        self._patches_received = 0
+        self._updates_published = 0
+        self._recorder = None
+        self._strategy = strategy.StrategyModel()
 
     async def _negotiate(self):
         """Negotiates with the F1 SignalR server to get a connection token."""
@@ -118,7 +153,7 @@ class LiveFeed:
         await self._websocket.send(json.dumps({
             "H": "Streaming",
             "M": "Subscribe",
-            "A": [["Heartbeat", "RaceControlMessages", "TimingData", "SessionInfo", "LapCount", "TrackStatus", "DriverList", "WeatherData", "WeatherDataSeries", "TyreStintSeries"]],
+            "A": [TOPICS],
             "I": 1
         }))
 
@@ -142,6 +177,8 @@ class LiveFeed:
         delay = 1
         while not self._shutdown_event.is_set():
             try:
+                if not self._state and self._session:
+                    await self._load_state()
                 self._websocket = await self._connect()
                 if not SIMULATION:
                     await self._subscribe_to_topics()
@@ -162,90 +199,417 @@ class LiveFeed:
     async def _receiver(self):
         """Receives messages from the WebSocket and puts them on the queue."""
         async for message in self._websocket:
+            if self._recorder:
+                self._recorder.record(message)
             if message != '{}':
                 self._last_activity_time = time.monotonic()
-            await self._message_queue.put(message)
+            MESSAGES_RECEIVED.inc()
+            await self._message_queue.put((time.monotonic(), message))
 
     async def _processor(self):
-        """Processes messages from the queue."""
+        """Processes messages from the queue, in batches collected over the coalescing window."""
+        loop = asyncio.get_running_loop()
         while not self._shutdown_event.is_set():
             try:
-                message = await self._message_queue.get()
-                await self._on_message(message)
-                self._message_queue.task_done()
+                batch = [await self._message_queue.get()]
+                if COALESCE_WINDOW > 0:
+                    deadline = loop.time() + COALESCE_WINDOW
+                    while (remaining := deadline - loop.time()) > 0:
+                        try:
+                            batch.append(await asyncio.wait_for(self._message_queue.get(), remaining))
+                        except asyncio.TimeoutError:
+                            break
+                with BATCH_SECONDS.time():
+                    await self._on_messages([message for _, message in batch])
+                published_at = time.monotonic()
+                for received_at, _ in batch:
+                    MESSAGE_LATENCY.observe(published_at - received_at)
+                    self._message_queue.task_done()
             except asyncio.CancelledError:
                 break
             except Exception as e:
                 logging.error(f"Error in processor: {e}")
 
-    async def _on_message(self, message):
-        """Parses and handles a single message."""
-        try:
-            message = fix_json(message)
-            data = json.loads(message)
+    async def _on_messages(self, messages):
+        """
+        Parses and handles a batch of messages. Stream patches for the same topic are merged
+        and written and published once per topic.
+        """
+        patches = {}
+        laps = []
+        for message in messages:
+            try:
+                data = signalr_json.loads(message, codec.loads)
 
-            if 'R' in data:
-                for key, payload in data['R'].items():
-                    logging.info(f"Received initial data for {key}")
-                    await self._redis_client.set(key, json.dumps({"type": key, "payload": payload}))
-            
-            if 'M' in data:
-                for msg_item in data.get('M', []):
-                    if len(msg_item.get('A', [])) == 3:
-                        msg_type, payload, _ = msg_item['A']
-                        await self._process_stream_message(msg_type, payload)
-
-        except json.JSONDecodeError as e:
-            logging.warning(f"JSON decode error: {e} - Original: {message}")
-        except Exception as e:
-            logging.error(f"Error processing message: {e}")
-
-    async def _process_stream_message(self, msg_type, payload):
-        """Handles a streaming message of a given type."""
-        existing_json = await self._redis_client.get(msg_type)
-        if existing_json:
-            existing_data = json.loads(existing_json).get("payload", {})
-            new_payload = merge(existing_data, payload)
+                if 'R' in data:
+                    # Initial data replaces the state, so earlier patches must be applied first.
+                    await self._apply_patches(patches, laps)
+                    patches, laps = {}, []
+                    await self._switch_session(data['R'].get('SessionInfo'))
+                    await self._apply_initial(data['R'])
+
+                if 'M' in data:
+                    for msg_item in data.get('M', []):
+                        if len(msg_item.get('A', [])) == 3:
+                            msg_type, payload, _ = msg_item['A']
+                            self._patches_received += 1
+                            PATCHES_RECEIVED.inc(msg_type)
+                            laps.extend(extract_laps(payload))
+                            patches[msg_type] = merge(patches[msg_type], payload) if msg_type in patches else payload
+
+            except json.JSONDecodeError as e:
+                logging.warning(f"JSON decode error: {e} - Original: {message}")
+            except Exception as e:
+                logging.error(f"Error processing message: {e}")
+
+        await self._apply_patches(patches, laps)
+
+    async def _apply_initial(self, initial):
+        """Replaces the state of every topic of the initial data, and writes and publishes them together."""
+        published_messages = {}
+        for key, payload in initial.items():
+            logging.info(f"Received initial data for {key}")
+            self._state[key] = payload
+            self._seq[key] = self._seq.get(key, 0) + 1
+            UPDATES_PUBLISHED.inc(key, "initial")
+            published_messages[key] = self._encode_state(key)
+        self._state[RANKINGS_KEY] = rankings.derive(self._state)
+        self._seq[RANKINGS_KEY] = self._seq.get(RANKINGS_KEY, 0) + 1
+        published_messages[RANKINGS_KEY] = self._encode_state(RANKINGS_KEY)
+        strategy_patch = self._strategy.update(self._state)
+        if strategy_patch:
+            published_messages[STRATEGY_KEY] = self._apply_patch(STRATEGY_KEY, strategy_patch)
+        await self._flush(published_messages)
+
+    async def _apply_patches(self, patches, laps):
+        """Merges one patch per topic into the state, and writes and publishes the results together."""
+        if not patches and not laps:
+            return
+        if self._session is None:
+            await self._switch_session(None)
+
+        published_messages = {}
+        for msg_type, payload in patches.items():
+            published_messages[msg_type] = self._apply_patch(msg_type, payload)
+
+        if RANKINGS_KEY in self._state:
+            rankings_patch = rankings.update(self._state[RANKINGS_KEY], patches, self._state)
         else:
-            new_payload = payload
-        
-        await self._redis_client.publish("channel:1", json.dumps({"type": msg_type, "payload": new_payload}))
+            rankings_patch = rankings.derive(self._state)
+        if rankings_patch:
+            published_messages[RANKINGS_KEY] = self._apply_patch(RANKINGS_KEY, rankings_patch)
+
+        if laps:
+            self._strategy.add_laps(laps, self._state)
+        # Rankings is published with nearly every TimingData patch, the model only depends on
+        # its pit loss.
+        if laps or STRATEGY_INPUTS & published_messages.keys() or self._strategy.pit_loss_changed(self._state):
+            strategy_patch = self._strategy.update(self._state)
+            if strategy_patch:
+                published_messages[STRATEGY_KEY] = self._apply_patch(STRATEGY_KEY, strategy_patch)
+
+        self._updates_published += len(published_messages)
+        await self._flush(published_messages, laps)
+
+    def _apply_patch(self, msg_type, payload):
+        """Merges a patch into the state of a topic, and returns the message to publish for it."""
+        # The patch is encoded before merging, as merge may share its sub-objects with the state.
+        seq = self._seq.get(msg_type, 0) + 1
+        delta_message = codec.dumps({"type": msg_type, "payload": payload, "seq": seq, "delta": True})
+
+        if storage.REDISJSON and CHECKPOINT_INTERVAL <= 0 and msg_type in self._state:
+            self._store_commands[msg_type] = storage.patch_commands(self._key(msg_type), self._state[msg_type], payload, seq)
+
+        if msg_type in self._state:
+            self._state[msg_type] = merge(self._state[msg_type], payload)
+        else:
+            self._state[msg_type] = payload
+        self._seq[msg_type] = seq
+
+        keyframe = seq % KEYFRAME_INTERVAL == 0
+        UPDATES_PUBLISHED.inc(msg_type, "keyframe" if keyframe else "delta")
+        return self._encode_state(msg_type) if keyframe else delta_message
+
+    def _state_message(self, msg_type):
+        """The full merged state of a topic, tagged with its sequence number."""
+        return {"type": msg_type, "payload": self._state[msg_type], "seq": self._seq.get(msg_type, 0)}
+
+    def _encode_state(self, msg_type):
+        """Serializes the state of a topic as JSON, for publishing."""
+        return codec.dumps(self._state_message(msg_type))
+
+    def _store(self, pipe, msg_type):
+        """Queues writing the state of a topic, by path when the storage allows it."""
+        commands = self._store_commands.pop(msg_type, None)
+        if commands is None or msg_type in self._unsynced_topics:
+            storage.write(pipe, self._key(msg_type), self._state_message(msg_type))
+            self._unsynced_topics.discard(msg_type)
+        else:
+            storage.write_commands(pipe, commands)
+
+    def _key(self, name):
+        """The key of `name` in the current session's namespace."""
+        return sessions.session_key(self._session, name)
+
+    def _next_event_id(self):
+        """Returns a stream entry id greater than any issued before, based on the current time."""
+        ms = max(int(time.time() * 1000), self._last_event_id[0])
+        self._last_event_id = (ms, self._last_event_id[1] + 1 if ms == self._last_event_id[0] else 0)
+        return self._event_id_string()
+
+    def _event_id_string(self):
+        return f"{self._last_event_id[0]}-{self._last_event_id[1]}"
 
-        await self._redis_client.set(msg_type, json.dumps({"type": msg_type, "payload": new_payload}))
+    def _publish(self, pipe, topic, message):
+        """Queues a message for both the topic's pub/sub channel and the capped event stream."""
+        event_id = self._next_event_id()
+        pipe.xadd(self._key(EVENT_STREAM_KEY), {"data": message}, id=event_id, maxlen=EVENT_STREAM_MAXLEN, approximate=True)
+        pipe.publish(f"{REDIS_CHANNEL_NAME}:{topic}", b"%s %s" % (event_id.encode(), message))
 
-        if laps := extract_laps(payload):
-            await self._redis_client.publish("channel:1", json.dumps({"type": "LapData", "payload": laps}))
-            for lap in laps:
-                await self._redis_client.rpush("LapData", json.dumps(lap))
+    async def _flush(self, published_messages, laps=None):
+        """
+        Writes topic updates, given as a message to publish per topic, and any new laps
+        to Redis in a single transaction. They are dropped when another feed has taken
+        over the session, see _write_if_current.
+        """
+        def queue(pipe):
+            for msg_type, published_message in published_messages.items():
+                self._publish(pipe, msg_type, published_message)
+                if CHECKPOINT_INTERVAL > 0:
+                    self._dirty_topics.add(msg_type)
+                else:
+                    self._store(pipe, msg_type)
+            if laps:
+                # The LapData sequence number is the length of the lap list after appending.
+                self._lap_count += len(laps)
+                self._publish(pipe, LAP_DATA_KEY, codec.dumps({"type": LAP_DATA_KEY, "payload": laps, "seq": self._lap_count}))
+                pipe.rpush(self._key(LAP_DATA_KEY), *[codec.pack(lap) for lap in laps])
+                LAPS_PUBLISHED.inc(amount=len(laps))
+            pipe.incr(VERSION_KEY)
+
+        with REDIS_SECONDS.time("flush"):
+            try:
+                written = await self._write_if_current(queue)
+            except Exception:
+                self._unsynced_topics.update(published_messages)
+                raise
+        if not written:
+            logging.warning(f"Session {self._session} was handed over, dropping {len(published_messages)} updates.")
+
+    async def _load_state(self):
+        """Loads the last persisted state of every topic from Redis into memory."""
+        async with self._redis_client.pipeline(transaction=True) as pipe:
+            storage.read_many(pipe, [self._key(topic) for topic in STORED_TOPICS])
+            pipe.lrange(self._key(LAP_DATA_KEY), 0, -1)
+            pipe.xrevrange(self._key(EVENT_STREAM_KEY), count=1)
+            with REDIS_SECONDS.time("load"):
+                values, stored_laps, last_events = await pipe.execute()
+        self._lap_count = len(stored_laps)
+        if last_events:
+            ms, n = last_events[0][0].decode().split("-")
+            self._last_event_id = (int(ms), int(n))
+        for key, value in zip(STORED_TOPICS, values):
+            if value:
+                stored = storage.unpack(value)
+                self._state[key] = stored.get("payload", {})
+                self._seq[key] = stored.get("seq", 0)
+        # The stored state is what this feed continues from, so readers need not replay any
+        # event before the next checkpoint.
+        if CHECKPOINT_INTERVAL > 0:
+            await self._redis_client.set(self._key(CHECKPOINT_ID_KEY), self._event_id_string())
+        else:
+            await self._redis_client.delete(self._key(CHECKPOINT_ID_KEY))
+        # The strategy model's fits are not stored, they are rebuilt from the laps.
+        self._strategy = strategy.StrategyModel()
+        self._strategy.add_laps([codec.unpack(lap) for lap in stored_laps], self._state)
+        logging.info(f"Loaded {len(self._state)} topics of session {self._session} from Redis.")
+
+    async def _checkpoint(self):
+        """Persists the in-memory state of all topics changed since the last checkpoint."""
+        if not self._dirty_topics:
+            return
+        topics, self._dirty_topics = self._dirty_topics, set()
+
+        def queue(pipe):
+            for key in topics:
+                storage.write(pipe, self._key(key), self._state_message(key))
+            # The state includes the updates of every event issued so far, even those whose
+            # flush is still in flight.
+            pipe.set(self._key(CHECKPOINT_ID_KEY), self._event_id_string())
+            pipe.incr(VERSION_KEY)
+
+        with REDIS_SECONDS.time("checkpoint"):
+            if not await self._write_if_current(queue):
+                logging.info(f"Session {self._session} was handed over, not checkpointing it.")
+
+    async def _write_if_current(self, queue) -> bool:
+        """
+        Runs the commands queued by `queue(pipe)` in a transaction, unless the current session
+        is no longer this feed's. A feed switching sessions checkpoints and archives the
+        previous one while it is still current, then clears its live keys and sets the new
+        current session in one transaction, see _switch_session. Once that ran, the feed it
+        took over from can neither recreate the cleared keys nor overwrite the archive.
+        Returns whether it ran.
+        """
+        async with self._redis_client.pipeline(transaction=True) as pipe:
+            await pipe.watch(sessions.CURRENT_SESSION_KEY)
+            current = await pipe.get(sessions.CURRENT_SESSION_KEY)
+            if current is None or current.decode('utf-8') != self._session:
+                return False
+            pipe.multi()
+            queue(pipe)
+            try:
+                await pipe.execute()
+            except WatchError:
+                return False
+        return True
+
+    async def _checkpointer(self):
+        """Periodically checkpoints the in-memory state to Redis."""
+        while not self._shutdown_event.is_set():
+            await asyncio.sleep(CHECKPOINT_INTERVAL)
+            try:
+                await self._checkpoint()
+            except Exception as e:
+                logging.error(f"Error checkpointing state: {e}")
 
     async def _monitor(self):
         """Monitors for inactivity and triggers shutdown if needed."""
         self._last_activity_time = time.monotonic()
         while not self._shutdown_event.is_set():
             await asyncio.sleep(MONITOR_INTERVAL)
+            ratio = self._patches_received / self._updates_published if self._updates_published else 1.0
+            logging.info(f"Queue depth: {self._message_queue.qsize()}, coalescing ratio: {ratio:.2f} patches per update.")
             if time.monotonic() - self._last_activity_time > INACTIVITY_TIMEOUT:
                 logging.warning("No meaningful activity for over a minute, shutting down.")
                 self.stop()
                 break
     
-    async def _clear_redis(self):
-        """Clears relevant keys in Redis."""
-        logging.info("Clearing Redis keys...")
-        keys_to_delete = [
-            "Heartbeat", "RaceControlMessages", "DriverList", "SessionInfo", "LapCount", 
-            "TrackStatus", "TimingData", "LapData", "WeatherData" "WeatherDataSeries", "TyreStintSeries"
-        ]
-        await self._redis_client.delete(*keys_to_delete)
+    async def _switch_session(self, session_info):
+        """
+        Makes the session described by session_info the current one, if it is not already.
+        The previous session is archived if it was not yet, and its live keys are deleted
+        along with switching the current session.
+        """
+        session = sessions.session_id(session_info) or self._session or sessions.UNKNOWN_SESSION
+        if session == self._session:
+            return
+
+        previous = self._session
+        if previous and previous != sessions.UNKNOWN_SESSION:
+            await self._checkpoint()
+            if not await self._redis_client.exists(sessions.archive_key(previous)):
+                await self._archive_session()
+
+        logging.info(f"Starting session {session}.")
+        async with self._redis_client.pipeline(transaction=True) as pipe:
+            if previous:
+                self._queue_clear_session(pipe)
+            pipe.set(sessions.CURRENT_SESSION_KEY, session)
+            if CHECKPOINT_INTERVAL > 0:
+                # Nothing is stored yet: readers replay the session's events from the start.
+                pipe.set(sessions.session_key(session, CHECKPOINT_ID_KEY), "0-0")
+            pipe.incr(VERSION_KEY)
+            await pipe.execute()
+        self._session = session
+        self._state, self._seq, self._lap_count = {}, {}, 0
+        self._strategy = strategy.StrategyModel()
+        self._dirty_topics = set()
+        self._store_commands, self._unsynced_topics = {}, set()
+
+    async def _archive_session(self):
+        """
+        Compacts the stored state and laps of the current session into its archive, unless
+        another feed has taken over, see _write_if_current.
+        """
+        async with self._redis_client.pipeline(transaction=True) as pipe:
+            storage.read_many(pipe, [self._key(topic) for topic in STORED_TOPICS])
+            pipe.lrange(self._key(LAP_DATA_KEY), 0, -1)
+            pipe.get(VERSION_KEY)
+            values, stored_laps, version = await pipe.execute()
+
+        state, seq = {}, {}
+        for topic, value in zip(STORED_TOPICS, values):
+            if value:
+                stored = storage.unpack(value)
+                state[topic] = stored.get("payload", {})
+                seq[topic] = stored.get("seq", 0)
+        laps = [codec.unpack(lap) for lap in stored_laps]
+        fields = await asyncio.to_thread(sessions.build_archive, self._session, state, seq, laps, int(version or 0))
+
+        def queue(pipe):
+            pipe.hset(sessions.archive_key(self._session), mapping=fields)
+            pipe.zadd(sessions.SESSIONS_KEY, {self._session: time.time()})
+
+        if await self._write_if_current(queue):
+            logging.info(f"Archived session {self._session}: {len(state)} topics, {len(laps)} laps.")
+        else:
+            logging.info(f"Session {self._session} was handed over, leaving its archive to the feed that took over.")
+
+    def _queue_clear_session(self, pipe):
+        """Queues deleting the live keys of the current session."""
+        logging.info(f"Clearing the live keys of session {self._session}...")
+        pipe.delete(*[self._key(name) for name in (*STORED_TOPICS, LAP_DATA_KEY, EVENT_STREAM_KEY, CHECKPOINT_ID_KEY)])
+
+    async def _clear_session(self):
+        """Deletes the live keys of the current session."""
+        async with self._redis_client.pipeline(transaction=True) as pipe:
+            self._queue_clear_session(pipe)
+            pipe.incr(VERSION_KEY)
+            await pipe.execute()
+
+    async def prepare(self):
+        """Connects to Redis and loads the state of the current session, ahead of running."""
+        if self._prepared:
+            return
+        await self._redis_client.ping()
+        current = await self._redis_client.get(sessions.CURRENT_SESSION_KEY)
+        if current:
+            self._session = current.decode('utf-8')
+            if SIMULATION:
+                # A simulation replays its session from the start.
+                await self._clear_session()
+                if CHECKPOINT_INTERVAL > 0:
+                    await self._redis_client.set(self._key(CHECKPOINT_ID_KEY), "0-0")
+            else:
+                await self._load_state()
+        self._prepared = True
+
+    async def run_at(self, timestamp: float | None = None):
+        """Prepares now and runs from the wall-clock `timestamp` on, unless stopped before."""
+        await self.prepare()
+        delay = timestamp - time.time() if timestamp else 0
+        if delay > 0:
+            logging.info(f"Prepared, connecting to the feed in {delay:.0f}s.")
+            try:
+                await asyncio.wait_for(self._shutdown_event.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+        if self._shutdown_event.is_set():
+            await self._redis_client.aclose()
+            logging.info("Stopped before connecting to the feed.")
+            return
+        await self.run()
 
     async def run(self):
         """Main entry point to start the service."""
-        await self._clear_redis()
-        
+        await self.prepare()
+        if RECORD_DIR:
+            self._recorder = recording.Recorder(Path(RECORD_DIR))
+            self._recorder.start()
+            logging.info(f"Recording the feed to {self._recorder.path}")
+
         self._tasks = [
             asyncio.create_task(self._connection_handler()),
             asyncio.create_task(self._processor()),
             asyncio.create_task(self._monitor())
         ]
+        if CHECKPOINT_INTERVAL > 0:
+            self._tasks.append(asyncio.create_task(self._checkpointer()))
+        QUEUE_DEPTH.callback = self._message_queue.qsize
+        if METRICS_PORT and self._serve_metrics:
+            self._tasks.append(asyncio.create_task(metrics.serve(METRICS_PORT)))
+            logging.info(f"Serving metrics on port {METRICS_PORT}.")
         
         logging.info("Live feed service started.")
         await self._shutdown_event.wait()
@@ -258,6 +622,15 @@ class LiveFeed:
 
         if self._websocket:
             await self._websocket.close()
+        try:
+            await self._checkpoint()
+            if self._session and self._session != sessions.UNKNOWN_SESSION:
+                await self._archive_session()
+        except Exception as e:
+            logging.error(f"Error writing final checkpoint or archive: {e}")
+        if self._recorder:
+            await asyncio.to_thread(self._recorder.stop)
+            logging.info(f"Recorded {self._recorder.messages} messages to {self._recorder.path}")
         await self._redis_client.aclose()
         logging.info("Live feed service stopped.")
 
@@ -272,8 +645,10 @@ async def main():
     loop = asyncio.get_running_loop()
     for sig in (signal.SIGINT, signal.SIGTERM):
         loop.add_signal_handler(sig, feed.stop)
-        
-    await feed.run()
+
+    # Set by the runner to start (and pre-warm) the feed ahead of the session.
+    start_at = float(os.getenv("LIVE_START_AT", "0"))
+    await feed.run_at(start_at or None)
 
 if __name__ == "__main__":
     asyncio.run(main())
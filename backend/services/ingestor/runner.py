@@ -1,22 +1,21 @@
+import asyncio
 import os
-import subprocess
+import signal
 import sys
-import time
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime
 from zoneinfo import ZoneInfo
-from apscheduler.schedulers.blocking import BlockingScheduler
-from apscheduler.triggers.date import DateTrigger
-import requests
-import re
-import requests
-from icalendar import Calendar
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+from schedule import UTC, load_schedule
+from supervisor import PREWARM, SESSION_LEAD, SUPERVISOR_MODE, Supervisor
 
 CALENDAR_URL = os.getenv("CALENDAR_URL", "https://ics.ecal.com/ecal-sub/6831cb8cdb165a00083b099f/Formula%201.ics")
-WEBSOCKET_PROGRAM_PATH = "ingestor/live.py"
-PYTHON_EXECUTABLE = sys.executable
 CHECK_CALENDAR_INTERVAL_HOURS = int(os.getenv("CHECK_CALENDAR_INTERVAL_HOURS", "6"))
 JOB_ID_PREFIX = "websocket_ingest_"
+# Comma separated session types to ingest, matched against the end of the event summaries
+# ("Race" also matches "Sprint Race"). All sessions are ingested when empty.
+SESSION_TYPES = [session_type.strip() for session_type in os.getenv("SESSION_TYPES", "").split(",") if session_type.strip()]
 
 logging.basicConfig(
     level=logging.INFO,
@@ -26,120 +25,83 @@ logging.basicConfig(
     ]
 )
 
-scheduler = BlockingScheduler(timezone=str(ZoneInfo("UTC")))
-
-def get_future_events(ics_url: str) -> list[tuple]:
-	"""
-	Fetches an ICS calendar and returns a list of future events with start and end time.
-	"""
-	event_times = []
-	try:
-		response = requests.get(ics_url, timeout=10)
-		response.raise_for_status()
-		cal_content = response.text
-	except requests.RequestException as e:
-		logging.error(f"Error fetching ICS URL: {e}")
-		return event_times
-
-	try:
-		cal = Calendar.from_ical(cal_content)
-		now = datetime.now(ZoneInfo("UTC"))
-
-		for component in cal.walk():
-			if component.name == "VEVENT":
-				dtstart = component.get('dtstart')
-				dtend = component.get("dtend")
-				summary = component.get('SUMMARY')
-				
-				if not dtstart or not dtend or not summary:
-					continue
-
-				event_start_time = dtstart.dt
-				event_end_time = dtend.dt
-
-				if event_start_time > now:
-					match = re.search(r"-\s*(.+)$", summary)
-					if match:
-						event_type = match.group(1).strip()
-						if event_type.__contains__("Race"):
-							event_times.append((event_start_time, event_end_time))
-	except Exception as e:
-		logging.error(f"Error parsing ICS data: {e}")
-
-	return sorted(event_times)
-
-def run_websocket_program():
-    """
-    Runs the target websocket client program.
-    """
-    logging.info(f"Starting websocket program: {WEBSOCKET_PROGRAM_PATH}")
-    try:
-        process = subprocess.run(
-            [PYTHON_EXECUTABLE, WEBSOCKET_PROGRAM_PATH],
-            capture_output=True,
-            text=True,
-            check=False # Don't raise exception for non-zero exit, log it instead
-        )
-        if process.returncode == 0:
-            logging.info(f"Websocket program finished successfully. Output:\n{process.stdout}")
-        else:
-            logging.error(
-                f"Websocket program exited with error code {process.returncode}.\n"
-                f"Stdout:\n{process.stdout}\n"
-                f"Stderr:\n{process.stderr}"
-            )
-    except Exception as e:
-        logging.error(f"Failed to run websocket program: {e}")
-
+scheduler = AsyncIOScheduler(timezone=str(ZoneInfo("UTC")))
+supervisor = Supervisor()
 
 def update_schedules():
     """
-    Fetches the calendar and updates the APScheduler jobs.
+    Loads the calendar and brings the APScheduler jobs in line with it: jobs of sessions
+    no longer in it are removed, and only the sessions that are new or were moved are
+    (re)scheduled. When the calendar cannot be loaded, the jobs are left as they are.
     """
     logging.info("Updating schedules from ICS calendar...")
     try:
-        # 1. Remove old jobs
-        jobs_to_remove = [job for job in scheduler.get_jobs() if job.id.startswith(JOB_ID_PREFIX)]
-        for job in jobs_to_remove:
-            logging.info(f"Removing old job: {job.id} scheduled for {job.trigger.run_date}")
-            job.remove()
-
-        # 2. Fetch new event times
-        future_event_times = get_future_events(CALENDAR_URL)
-
-        # 3. Add new jobs
-        now = datetime.now(ZoneInfo("UTC"))
-        for i, event in enumerate(future_event_times):
-            if event[0] > now:
-                job_id = f"{JOB_ID_PREFIX}{event[0].strftime('%Y%m%d%H%M%S')}_{i}"
-                if event[0].tzinfo is None:
-                    event_time_utc = event[0].replace(tzinfo=ZoneInfo("UTC"))
-                else:
-                    event_time_utc = event[0].astimezone(ZoneInfo("UTC"))
-
-                run_time = event_time_utc - timedelta(minutes=10)
-
-                logging.info(f"Scheduling job {job_id} for: {run_time} (event starts at {event_time_utc})")
+        sessions = load_schedule(CALENDAR_URL)
+        if sessions is None:
+            logging.warning("No calendar available, keeping the current schedule.")
+            return
+
+        now = datetime.now(UTC)
+        wanted = {}
+        for session in sessions:
+            if session["start"] <= now:
+                continue
+            if SESSION_TYPES and not any(session_type in session["type"] for session_type in SESSION_TYPES):
+                continue
+            wanted[f"{JOB_ID_PREFIX}{session['key']}"] = session
+
+        jobs = {job.id: job for job in scheduler.get_jobs() if job.id.startswith(JOB_ID_PREFIX)}
+        removed = 0
+        for job_id, job in jobs.items():
+            if job_id not in wanted:
+                logging.info(f"Removing job {job_id} scheduled for {job.trigger.run_date}")
+                job.remove()
+                removed += 1
+
+        added = rescheduled = 0
+        for job_id, session in wanted.items():
+            args = [job_id, session["start"], session["end"]]
+            job = jobs.get(job_id)
+            if job is not None and list(job.args) == args:
+                continue
+            # The feed is started and pre-warmed ahead of connecting, see supervisor.py. A
+            # session already inside that lead is started right away.
+            run_time = max(session["start"] - SESSION_LEAD - PREWARM, now)
+            logging.info(f"Scheduling job {job_id} ({session['summary']}) for: {run_time} (session starts at {session['start']})")
+            if job is None:
                 scheduler.add_job(
-                    run_websocket_program,
+                    supervisor.supervise,
                     trigger='date',
                     run_date=run_time,
+                    args=args,
                     id=job_id,
-                    replace_existing=True # In case of race condition or ID collision
+                    misfire_grace_time=int(PREWARM.total_seconds()) or 1
                 )
+                added += 1
             else:
-                logging.info(f"Skipping past event: {event[0]}")
-
-        logging.info(f"Schedule update complete. {len(scheduler.get_jobs())} jobs active.")
+                job.modify(args=args)
+                job.reschedule(trigger='date', run_date=run_time)
+                rescheduled += 1
+
+        unchanged = len(wanted) - added - rescheduled
+        logging.info(
+            f"Schedule update complete: {added} added, {rescheduled} rescheduled, {removed} removed, "
+            f"{unchanged} unchanged. {len(scheduler.get_jobs())} jobs active."
+        )
         for job in scheduler.get_jobs():
             logging.debug(f"Active job: {job.id} - Trigger: {job.trigger}")
 
     except Exception as e:
         logging.error(f"Error during schedule update: {e}", exc_info=True)
 
-if __name__ == "__main__":
-    logging.info("Scheduler starting. Performing initial schedule update.")
-    update_schedules()
+async def main():
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    logging.info(f"Scheduler starting ({SUPERVISOR_MODE} mode). Performing initial schedule update.")
+    await asyncio.to_thread(update_schedules)
 
     scheduler.add_job(
         update_schedules,
@@ -153,8 +115,14 @@ if __name__ == "__main__":
     )
     logging.info("Press Ctrl+C to exit.")
 
-    try:
-        scheduler.start()
-    except (KeyboardInterrupt, SystemExit):
-        logging.info("Scheduler stopped.")
-        scheduler.shutdown()
\ No newline at end of file
+    supervisor.start()
+    scheduler.start()
+    await stop.wait()
+
+    logging.info("Stopping scheduler and running sessions...")
+    scheduler.shutdown(wait=False)
+    await supervisor.shutdown()
+    logging.info("Scheduler stopped.")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,161 @@
+"""
+The schedule of every session, from the F1 ICS calendar.
+
+The calendar is fetched conditionally (If-None-Match / If-Modified-Since) and kept in
+CALENDAR_CACHE_DIR along with its validators, so an unchanged calendar is not downloaded
+again and an unreachable server falls back to the last copy. It is only parsed when its
+content changed: the schedule index parsed from it, every session of every weekend, is
+kept next to it with the hash of the calendar it was parsed from, so restarts and
+unchanged calendars reuse it.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+from datetime import datetime
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+import requests
+from icalendar import Calendar
+
+CALENDAR_CACHE_DIR = Path(os.getenv("CALENDAR_CACHE_DIR", "calendar-cache"))
+UTC = ZoneInfo("UTC")
+
+_CALENDAR_FILE = "calendar.ics"
+_CALENDAR_META_FILE = "calendar.json"
+_INDEX_FILE = "schedule.json"
+
+# The last index loaded, and the hash of the calendar it was parsed from.
+_index = None
+_index_hash = None
+
+
+def _write(path: Path, content: bytes):
+    """Replaces a file atomically, so that a crash never leaves a partial cache behind."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_suffix(path.suffix + ".tmp")
+    temporary.write_bytes(content)
+    temporary.replace(path)
+
+
+def _read_json(path: Path) -> dict | None:
+    try:
+        return json.loads(path.read_bytes())
+    except (OSError, ValueError):
+        return None
+
+
+def fetch_calendar(url: str) -> bytes | None:
+    """
+    Returns the calendar, downloading it only when the server has a newer one than the
+    cached copy. Returns the cached copy when the server cannot be reached, and None when
+    there is none.
+    """
+    calendar_path = CALENDAR_CACHE_DIR / _CALENDAR_FILE
+    meta_path = CALENDAR_CACHE_DIR / _CALENDAR_META_FILE
+    meta = _read_json(meta_path) or {}
+    cached = calendar_path.read_bytes() if calendar_path.exists() and meta.get("url") == url else None
+
+    headers = {}
+    if cached is not None:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+    try:
+        response = requests.get(url, headers=headers, timeout=10)
+        if response.status_code == 304 and cached is not None:
+            logging.info("Calendar not modified, using the cached copy.")
+            return cached
+        response.raise_for_status()
+    except requests.RequestException as e:
+        if cached is None:
+            logging.error(f"Error fetching ICS URL: {e}")
+        else:
+            logging.warning(f"Error fetching ICS URL: {e}. Using the cached copy.")
+        return cached
+
+    content = response.content
+    try:
+        _write(calendar_path, content)
+        _write(meta_path, json.dumps({
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }).encode('utf-8'))
+    except OSError as e:
+        logging.warning(f"Could not cache the calendar in {CALENDAR_CACHE_DIR}: {e}")
+    return content
+
+
+def _utc(value) -> datetime | None:
+    if not isinstance(value, datetime):
+        # An all-day event.
+        return None
+    return value.replace(tzinfo=UTC) if value.tzinfo is None else value.astimezone(UTC)
+
+
+def parse_sessions(content: bytes) -> list[dict]:
+    """
+    Parses every session of the calendar, sorted by start: a key stable across calendar
+    updates (the event's UID), the summary, the session type ("Race", "Sprint
+    Qualifying", "Practice 1", ...) and the start and end in UTC, as ISO 8601.
+    """
+    sessions = []
+    for component in Calendar.from_ical(content).walk("VEVENT"):
+        summary = component.get("SUMMARY")
+        start = _utc(component.get("DTSTART").dt) if component.get("DTSTART") else None
+        end = _utc(component.get("DTEND").dt) if component.get("DTEND") else None
+        if not summary or start is None or end is None:
+            continue
+        match = re.search(r"-\s*(.+)$", str(summary))
+        if not match:
+            continue
+        session_type = match.group(1).strip()
+        uid = component.get("UID")
+        key = str(uid) if uid else f"{start:%Y%m%d%H%M%S}-{session_type}"
+        sessions.append({
+            "key": re.sub(r"[^A-Za-z0-9_.-]+", "_", key),
+            "summary": str(summary),
+            "type": session_type,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+        })
+    return sorted(sessions, key=lambda session: session["start"])
+
+
+def load_schedule(url: str) -> list[dict] | None:
+    """
+    Returns every session of the calendar, with the start and end as datetimes, parsing the
+    calendar only when it changed. Returns None when there is no calendar to read.
+    """
+    global _index, _index_hash
+    content = fetch_calendar(url)
+    if content is None:
+        return None
+
+    content_hash = hashlib.sha256(content).hexdigest()
+    if _index_hash != content_hash:
+        index_path = CALENDAR_CACHE_DIR / _INDEX_FILE
+        stored = _read_json(index_path)
+        if stored and stored.get("hash") == content_hash:
+            sessions = stored["sessions"]
+        else:
+            logging.info("Calendar changed, parsing it.")
+            try:
+                sessions = parse_sessions(content)
+            except Exception as e:
+                logging.error(f"Error parsing ICS data: {e}")
+                return _index
+            try:
+                _write(index_path, json.dumps({"hash": content_hash, "sessions": sessions}).encode('utf-8'))
+            except OSError as e:
+                logging.warning(f"Could not cache the schedule in {CALENDAR_CACHE_DIR}: {e}")
+        _index = [
+            {**session, "start": datetime.fromisoformat(session["start"]), "end": datetime.fromisoformat(session["end"])}
+            for session in sessions
+        ]
+        _index_hash = content_hash
+    return _index
@@ -0,0 +1,177 @@
+"""
+Decoder for the messages of the F1 SignalR feed.
+
+Live messages are valid JSON, but recorded feeds (and some relayed ones) use Python
+literal syntax: single-quoted strings, True/False/None. Blindly rewriting quotes and
+words before handing the text to json.loads corrupts strings that contain apostrophes or
+the words True/False, so only what is outside of strings is rewritten, and json_loads
+still does the decoding:
+
+- Most literal messages have no double quote and no backslash: Python only double-quotes
+  strings that contain an apostrophe, and escapes quotes when a string has both. Every
+  single quote of those is then a string delimiter, so splitting on them separates the
+  strings from what is outside of them.
+- In the others, a regular expression matches the strings and the constants outside of
+  them, and each is rewritten as JSON. This takes a Python call per string.
+
+The few messages the rewrite does not turn into JSON (strings with raw control characters,
+...) go to a fallback decoder, which tokenizes the message and builds the Python objects
+directly, at a fraction of the speed.
+"""
+import json
+import re
+
+_WHITESPACE = re.compile(r'\s*')
+_STRINGS = {
+    '"': re.compile(r'"((?:[^"\\]|\\.)*)"', re.DOTALL),
+    "'": re.compile(r"'((?:[^'\\]|\\.)*)'", re.DOTALL),
+}
+_NUMBER = re.compile(r'-?(?:0|[1-9]\d*)(\.\d+)?([eE][-+]?\d+)?')
+_WORD = re.compile(r'[A-Za-z]+')
+_ESCAPE = re.compile(r'\\(x[0-9a-fA-F]{2}|u[0-9a-fA-F]{4}|U[0-9a-fA-F]{8}|.)', re.DOTALL)
+_SURROGATE = re.compile('[\ud800-\udfff]')
+# A string, or a constant outside of strings. Only single-quoted strings, double-quoted ones
+# with escapes and the Python constants need rewriting.
+_LITERAL_TOKEN = re.compile(r'''"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'|\b(?:True|False|None)\b''', re.DOTALL)
+_JSON_CONSTANTS = {"True": "true", "False": "false", "None": "null"}
+
+_CONSTANTS = {"true": True, "false": False, "null": None, "True": True, "False": False, "None": None}
+_SIMPLE_ESCAPES = {
+    'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f', '0': '\0',
+    '/': '/', '\\': '\\', '"': '"', "'": "'",
+}
+
+
+def loads(message: str, json_loads=json.loads):
+    """
+    Decodes a feed message into Python objects, trying json_loads first.
+    Raises json.JSONDecodeError if the message is neither JSON nor a Python literal.
+    """
+    try:
+        return json_loads(message)
+    except json.JSONDecodeError:
+        pass
+    try:
+        if '"' not in message and '\\' not in message:
+            return json_loads(_delimited_to_json(message))
+        return json_loads(_LITERAL_TOKEN.sub(_to_json, message))
+    except ValueError:
+        # Not a literal the rewrite handles, including a stray NUL outside of strings.
+        pass
+
+    value, pos = _parse_value(message, 0)
+    pos = _WHITESPACE.match(message, pos).end()
+    if pos != len(message):
+        raise json.JSONDecodeError("Extra data", message, pos)
+    return value
+
+
+def _delimited_to_json(message):
+    """Rewrites a literal whose single quotes all delimit strings as JSON."""
+    parts = message.split("'")
+    # Every other part is outside of strings; they are rewritten together.
+    outside = "\0".join(parts[::2])
+    outside = outside.replace("True", "true").replace("False", "false").replace("None", "null")
+    parts[::2] = outside.split("\0")
+    return '"'.join(parts)
+
+
+def _to_json(match):
+    token = match.group()
+    constant = _JSON_CONSTANTS.get(token)
+    if constant is not None:
+        return constant
+    raw = token[1:-1]
+    if '\\' in raw:
+        return json.dumps(_parse_string(token, 0)[0], ensure_ascii=False)
+    if token[0] == '"':
+        return token
+    return '"' + raw.replace('"', '\\"') + '"'
+
+
+def _unescape(match):
+    escape = match.group(1)
+    if len(escape) > 1:
+        return chr(int(escape[1:], 16))
+    return _SIMPLE_ESCAPES.get(escape, '\\' + escape)
+
+
+def _parse_string(s, pos):
+    match = _STRINGS[s[pos]].match(s, pos)
+    if not match:
+        raise json.JSONDecodeError("Unterminated string", s, pos)
+    raw = match.group(1)
+    if '\\' in raw:
+        raw = _ESCAPE.sub(_unescape, raw)
+        if _SURROGATE.search(raw):
+            # Joins \uXXXX surrogate pairs into a single character.
+            raw = raw.encode('utf-16', 'surrogatepass').decode('utf-16')
+    return raw, match.end()
+
+
+def _parse_value(s, pos):
+    pos = _WHITESPACE.match(s, pos).end()
+    char = s[pos:pos + 1]
+
+    if char == '{':
+        return _parse_object(s, pos + 1)
+    if char == '[':
+        return _parse_array(s, pos + 1)
+    if char in _STRINGS:
+        return _parse_string(s, pos)
+
+    match = _NUMBER.match(s, pos)
+    if match:
+        text = match.group()
+        if match.group(1) or match.group(2):
+            return float(text), match.end()
+        return int(text), match.end()
+
+    match = _WORD.match(s, pos)
+    if match and match.group() in _CONSTANTS:
+        return _CONSTANTS[match.group()], match.end()
+
+    raise json.JSONDecodeError("Expecting value", s, pos)
+
+
+def _parse_object(s, pos):
+    result = {}
+    pos = _WHITESPACE.match(s, pos).end()
+    if s[pos:pos + 1] == '}':
+        return result, pos + 1
+
+    while True:
+        if s[pos:pos + 1] not in _STRINGS:
+            raise json.JSONDecodeError("Expecting property name enclosed in quotes", s, pos)
+        key, pos = _parse_string(s, pos)
+        pos = _WHITESPACE.match(s, pos).end()
+        if s[pos:pos + 1] != ':':
+            raise json.JSONDecodeError("Expecting ':' delimiter", s, pos)
+        result[key], pos = _parse_value(s, pos + 1)
+
+        pos = _WHITESPACE.match(s, pos).end()
+        char = s[pos:pos + 1]
+        if char == '}':
+            return result, pos + 1
+        if char != ',':
+            raise json.JSONDecodeError("Expecting ',' delimiter", s, pos)
+        pos = _WHITESPACE.match(s, pos + 1).end()
+
+
+def _parse_array(s, pos):
+    result = []
+    pos = _WHITESPACE.match(s, pos).end()
+    if s[pos:pos + 1] == ']':
+        return result, pos + 1
+
+    while True:
+        value, pos = _parse_value(s, pos)
+        result.append(value)
+
+        pos = _WHITESPACE.match(s, pos).end()
+        char = s[pos:pos + 1]
+        if char == ']':
+            return result, pos + 1
+        if char != ',':
+            raise json.JSONDecodeError("Expecting ',' delimiter", s, pos)
+        pos += 1
@@ -0,0 +1,202 @@
+"""
+Runs the live feed for scheduled sessions.
+
+A session is supervised from PREWARM_MINUTES before it goes live, SESSION_LEAD_MINUTES
+ahead of its start: the feed starts early, connects to Redis and loads the stored state,
+and then waits to connect to the live timing feed. A feed that fails (exits with an
+error, or raises when in-process) is restarted with exponential backoff, and at the end
+of the session plus SESSION_GRACE_MINUTES it is stopped if still running.
+
+SUPERVISOR_MODE=process (the default) runs every feed in a child process of its own, its
+output streamed line by line prefixed with the session. SUPERVISOR_MODE=inprocess runs
+LiveFeed on the supervisor's event loop instead, which saves starting an interpreter.
+
+Sessions whose windows overlap run concurrently. Their state is namespaced by session
+(see common.sessions), but they all publish to the same channel, so a session going live
+stops the sessions already past their scheduled end rather than ingest the feed twice.
+"""
+import asyncio
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+WEBSOCKET_PROGRAM_PATH = "ingestor/live.py"
+PYTHON_EXECUTABLE = sys.executable
+SUPERVISOR_MODE = os.getenv("SUPERVISOR_MODE", "process")
+# Minutes before the session the feed connects, and before that it is started and pre-warmed.
+SESSION_LEAD = timedelta(minutes=float(os.getenv("SESSION_LEAD_MINUTES", "10")))
+PREWARM = timedelta(minutes=float(os.getenv("PREWARM_MINUTES", "5")))
+# Minutes after the scheduled end a feed is still restarted, and then stopped.
+SESSION_GRACE = timedelta(minutes=float(os.getenv("SESSION_GRACE_MINUTES", "60")))
+MAX_RESTART_DELAY = int(os.getenv("MAX_RESTART_DELAY", "60"))
+# A feed that ran for this long before failing restarts without backing off.
+HEALTHY_RUN_SECONDS = 300
+# Seconds a stopped feed gets to write its checkpoint and archive before it is killed.
+STOP_TIMEOUT = 120
+LOG_LINE_LIMIT = 1024 * 1024
+
+if SUPERVISOR_MODE not in ("process", "inprocess"):
+    raise ValueError(f"Unknown SUPERVISOR_MODE {SUPERVISOR_MODE!r}, expected process or inprocess.")
+
+
+class _Session:
+    def __init__(self, name: str, start: datetime, end: datetime):
+        self.name = name
+        self.start = start
+        self.end = end
+        self.stopping = asyncio.Event()
+        self.task = asyncio.current_task()
+        self.process = None
+        self.feed = None
+
+    def stop(self):
+        self.stopping.set()
+        if self.process and self.process.returncode is None:
+            self.process.terminate()
+        if self.feed:
+            self.feed.stop()
+
+
+class Supervisor:
+    def __init__(self, mode: str = SUPERVISOR_MODE):
+        self._mode = mode
+        self._sessions: dict[str, _Session] = {}
+        self._metrics = None
+
+    @property
+    def sessions(self) -> list[str]:
+        return list(self._sessions)
+
+    def start(self):
+        if self._mode == "inprocess":
+            import live
+
+            if live.METRICS_PORT:
+                # The feeds share this process, and so its metrics.
+                self._metrics = asyncio.create_task(live.metrics.serve(live.METRICS_PORT))
+                logging.info(f"Serving metrics on port {live.METRICS_PORT}.")
+
+    async def supervise(self, name: str, start: datetime, end: datetime):
+        """Runs the feed of a session, from pre-warming it until the session is over."""
+        if name in self._sessions:
+            logging.info(f"[{name}] Already supervised, ignoring.")
+            return
+        session = self._sessions[name] = _Session(name, start, end)
+        hand_over = asyncio.create_task(self._hand_over(session))
+        try:
+            await self._supervise(session)
+        finally:
+            hand_over.cancel()
+            del self._sessions[name]
+
+    async def shutdown(self):
+        """Stops every session and waits for their feeds to exit."""
+        tasks = [session.task for session in self._sessions.values()]
+        for session in list(self._sessions.values()):
+            session.stop()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._metrics:
+            self._metrics.cancel()
+
+    async def _supervise(self, session: _Session):
+        live_at = (session.start - SESSION_LEAD).timestamp()
+        deadline = (session.end + SESSION_GRACE).timestamp()
+        delay = 1
+        while not session.stopping.is_set() and time.time() < deadline:
+            started = time.monotonic()
+            if await self._run(session, live_at, deadline) or session.stopping.is_set():
+                break
+            if time.monotonic() - started > HEALTHY_RUN_SECONDS:
+                delay = 1
+            logging.warning(f"[{session.name}] Feed failed, restarting in {delay}s.")
+            try:
+                await asyncio.wait_for(session.stopping.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            delay = min(delay * 2, MAX_RESTART_DELAY)
+        logging.info(f"[{session.name}] Supervision finished.")
+
+    async def _hand_over(self, session: _Session):
+        await asyncio.sleep(max((session.start - SESSION_LEAD).timestamp() - time.time(), 0))
+        for other in list(self._sessions.values()):
+            if other is not session and other.end <= session.start:
+                logging.info(f"[{other.name}] Stopping, session {session.name} is going live.")
+                other.stop()
+
+    async def _run(self, session: _Session, live_at: float, deadline: float) -> bool:
+        """Runs the feed once, returning whether it finished without an error."""
+        if self._mode == "inprocess":
+            run = asyncio.create_task(self._run_inprocess(session, live_at))
+        else:
+            run = asyncio.create_task(self._run_process(session, live_at))
+        try:
+            return await asyncio.wait_for(asyncio.shield(run), max(deadline - time.time(), 0))
+        except asyncio.TimeoutError:
+            logging.info(f"[{session.name}] Past the end of the session, stopping the feed.")
+            session.stop()
+        try:
+            return await asyncio.wait_for(asyncio.shield(run), STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            logging.error(f"[{session.name}] Feed did not stop within {STOP_TIMEOUT}s, killing it.")
+            if session.process and session.process.returncode is None:
+                session.process.kill()
+            else:
+                run.cancel()
+            await asyncio.gather(run, return_exceptions=True)
+            return False
+
+    async def _run_process(self, session: _Session, live_at: float) -> bool:
+        env = {**os.environ, "LIVE_START_AT": str(live_at), "PYTHONUNBUFFERED": "1"}
+        if any(other.process for other in self._sessions.values()):
+            # Only one feed can listen on the metrics port.
+            env["METRICS_PORT"] = "0"
+        process = await asyncio.create_subprocess_exec(
+            PYTHON_EXECUTABLE, WEBSOCKET_PROGRAM_PATH,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT,
+            env=env, limit=LOG_LINE_LIMIT,
+        )
+        session.process = process
+        logging.info(f"[{session.name}] Started feed process {process.pid}.")
+        if session.stopping.is_set():
+            process.terminate()
+        try:
+            await self._stream_output(session.name, process.stdout)
+            returncode = await process.wait()
+        finally:
+            session.process = None
+        if returncode == 0:
+            logging.info(f"[{session.name}] Feed process finished.")
+        else:
+            logging.error(f"[{session.name}] Feed process exited with code {returncode}.")
+        return returncode == 0
+
+    async def _run_inprocess(self, session: _Session, live_at: float) -> bool:
+        # Only imported in this mode, as it configures logging and loads the feed's dependencies.
+        import live
+
+        feed = session.feed = live.LiveFeed(serve_metrics=False)
+        if session.stopping.is_set():
+            feed.stop()
+        try:
+            await feed.run_at(live_at)
+            return True
+        except Exception as e:
+            logging.error(f"[{session.name}] Feed failed: {e}", exc_info=True)
+            return False
+        finally:
+            session.feed = None
+
+    @staticmethod
+    async def _stream_output(name: str, stream: asyncio.StreamReader):
+        while True:
+            try:
+                line = await stream.readline()
+            except ValueError:
+                # Longer than LOG_LINE_LIMIT, the line is dropped.
+                continue
+            if not line:
+                break
+            sys.stdout.write(f"[{name}] {line.decode('utf-8', 'replace')}")
+            sys.stdout.flush()
@@ -1,20 +1,66 @@
-import asyncio
+import os
+import time
 import uvicorn
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
 from starlette.websockets import WebSocketState
 from pathlib import Path
 
+from replay import IndexCache, replay
+
 app = FastAPI(title="F1 Data Simulator")
 
-DATA_FILE = Path(__file__).parent / "output.log"
-MESSAGE_DELAY = 0.1 # Adjust as needed
+DATA_FILE = Path(os.getenv("SIMULATOR_DATA_FILE", Path(__file__).parent / "output.log"))
+# Replay speed for sessions that do not pass one: a multiplier of the recorded timing, or "max".
+DEFAULT_SPEED = os.getenv("SIMULATOR_SPEED", "1")
+
+index_cache = IndexCache(DATA_FILE)
+active_sessions = 0
+
+
+def parse_speed(speed: str) -> float | None:
+    """Returns the speed multiplier, or None to replay as fast as possible."""
+    if speed == "max":
+        return None
+    value = float(speed)
+    if value <= 0:
+        raise ValueError("speed must be positive or 'max'")
+    return value
+
+
+@app.get("/replay")
+async def replay_info():
+    """Describes the recorded session, for picking a lap or time to start a replay from."""
+    index = await index_cache.get()
+    if index is None:
+        raise HTTPException(status_code=404, detail="Data file not found on server")
+    return {
+        "messages": len(index),
+        "duration": index.duration,
+        "laps": {lap: index.times[position] for lap, position in sorted(index.lap_starts.items())},
+    }
+
 
 @app.websocket("/ws/f1-data")
-async def websocket_endpoint(websocket: WebSocket):
+async def websocket_endpoint(websocket: WebSocket, speed: str = DEFAULT_SPEED, lap: int | None = None, start: float | None = None):
+    """
+    Replays the recorded feed with its recorded timing, sped up by `speed` ("max" for as fast
+    as possible). With `lap` or `start` (seconds into the session), everything before that
+    point is sent at once and the timed replay begins there.
+    """
+    global active_sessions
     await websocket.accept()
-    print("Simulator: Client connected")
     try:
-        if not DATA_FILE.exists():
+        multiplier = parse_speed(speed)
+    except ValueError as e:
+        await websocket.send_text(f'{{"error": "{e}"}}')
+        await websocket.close(code=1008)
+        return
+
+    active_sessions += 1
+    print(f"Simulator: Client connected, speed {speed}, {active_sessions} sessions.")
+    try:
+        index = await index_cache.get()
+        if index is None:
             print(f"Simulator: Data file not found at {DATA_FILE}")
             await websocket.send_text('{"error": "Data file not found on server"}')
             if websocket.client_state == WebSocketState.CONNECTED:
@@ -22,26 +68,24 @@ async def websocket_endpoint(websocket: WebSocket):
             print("Simulator: Closed connection due to missing data file.")
             return
 
-        with open(DATA_FILE, "r") as f:
-            for line in f:
-                message = line.strip()
-                if message:
-                    if websocket.client_state != WebSocketState.CONNECTED:
-                        print("Simulator: Client disconnected before sending all data (checked before send).")
-                        break
-                    await websocket.send_text(message)
-                    print(f"Simulator: Sent: {message}")
-                    await asyncio.sleep(MESSAGE_DELAY)
-            
+        position = 0
+        if lap is not None:
+            position = index.position_at_lap(lap)
+        elif start is not None:
+            position = index.position_at_time(start)
+
+        started = time.monotonic()
+        sent = await replay(websocket.send_text, index, multiplier, position)
+
         if websocket.client_state == WebSocketState.CONNECTED:
             await websocket.send_text('{"status": "simulation_finished"}')
-            print("Simulator: Finished sending all data. Server will now close the connection.")
+            print(f"Simulator: Finished sending all data, {sent} messages in {time.monotonic() - started:.1f}s. "
+                  "Server will now close the connection.")
             await websocket.close(code=1000)
             print("Simulator: Server initiated graceful close.")
         else:
             print("Simulator: Client disconnected before simulation could finish completely.")
 
-
     except WebSocketDisconnect:
         print("Simulator: Client disconnected or connection lost (WebSocketDisconnect caught).")
     except Exception as e:
@@ -55,7 +99,8 @@ async def websocket_endpoint(websocket: WebSocket):
             except Exception as close_err:
                 print(f"Simulator: Exception while trying to close after an exception: {close_err}.")
     finally:
-        print(f"Simulator: WebSocket handler scope ending. Current client state: {websocket.client_state}")
+        active_sessions -= 1
+        print(f"Simulator: WebSocket handler scope ending, {active_sessions} sessions. Current client state: {websocket.client_state}")
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8001)
@@ -0,0 +1,128 @@
+import asyncio
+import bisect
+import mmap
+import re
+from array import array
+from datetime import datetime
+from pathlib import Path
+
+# The timestamp that ends every "A" triple of a stream message. Payloads can contain
+# timestamps too (e.g. Heartbeat's Utc), but they always come before it.
+_TIMESTAMP = re.compile(rb"""["'](\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d(?:\.\d+)?Z)["']""")
+_CURRENT_LAP = re.compile(rb"""["']CurrentLap["']\s*:\s*(\d+)""")
+# Sleeping for less than this is not worth the context switch, the message is sent right away.
+MIN_SLEEP = 0.002
+
+
+class ReplayIndex:
+    """
+    An offset index over a memory-mapped feed log: where every message starts and ends,
+    when it was recorded, and the first message of every lap.
+    Built once per version of the file and shared by every replay session.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        stat = path.stat()
+        self.signature = (stat.st_mtime_ns, stat.st_size)
+        self.starts = array("Q")
+        self.ends = array("Q")
+        # Seconds since the first timestamped message.
+        self.times = array("d")
+        self.lap_starts: dict[int, int] = {}
+
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b""
+        self._build()
+
+    def _build(self):
+        data = self._mmap
+        first = None
+        last = 0.0
+        pos = 0
+        size = len(data)
+        while pos < size:
+            end = data.find(b"\n", pos)
+            if end == -1:
+                end = size
+            raw = data[pos:end]
+            line = raw.strip()
+            if line:
+                start = pos + len(raw) - len(raw.lstrip())
+                timestamps = _TIMESTAMP.findall(line)
+                if timestamps:
+                    recorded = datetime.fromisoformat(timestamps[-1].decode())
+                    if first is None:
+                        first = recorded
+                    # Keeps time monotonic if the feed delivers messages out of order.
+                    last = max(last, (recorded - first).total_seconds())
+                lap = _CURRENT_LAP.search(line)
+                if lap:
+                    self.lap_starts.setdefault(int(lap.group(1)), len(self.starts))
+                self.starts.append(start)
+                self.ends.append(start + len(line))
+                self.times.append(last)
+            pos = end + 1
+
+    def __len__(self):
+        return len(self.starts)
+
+    @property
+    def duration(self) -> float:
+        return self.times[-1] if self.times else 0.0
+
+    def message(self, i: int) -> str:
+        return self._mmap[self.starts[i]:self.ends[i]].decode("utf-8")
+
+    def position_at_time(self, seconds: float) -> int:
+        """The index of the first message recorded at or after `seconds` into the session."""
+        return bisect.bisect_left(self.times, seconds)
+
+    def position_at_lap(self, lap: int) -> int:
+        """The index of the first message of the lap, or of the first later lap recorded."""
+        laps = [number for number in self.lap_starts if number >= lap]
+        return self.lap_starts[min(laps)] if laps else len(self)
+
+
+class IndexCache:
+    """Rebuilds the index when the log file changes, off the event loop."""
+
+    def __init__(self, path: Path):
+        self._path = path
+        self._index = None
+        self._lock = asyncio.Lock()
+
+    async def get(self) -> ReplayIndex | None:
+        async with self._lock:
+            if not self._path.exists():
+                return None
+            stat = self._path.stat()
+            if self._index is None or self._index.signature != (stat.st_mtime_ns, stat.st_size):
+                # Sessions still replaying the previous index keep its mapping alive.
+                self._index = await asyncio.to_thread(ReplayIndex, self._path)
+                print(f"Simulator: Indexed {len(self._index)} messages, {self._index.duration:.0f}s, "
+                      f"{len(self._index.lap_starts)} laps in {self._path}")
+            return self._index
+
+
+async def replay(send, index: ReplayIndex, speed: float | None, start: int = 0) -> int:
+    """
+    Sends the messages of the log with their recorded spacing divided by `speed`, or as fast
+    as possible if speed is None. Messages before `start` are fast-forwarded, so the receiver
+    still builds up the full state. Returns the number of messages sent.
+    """
+    loop = asyncio.get_running_loop()
+    for i in range(min(start, len(index))):
+        await send(index.message(i))
+
+    if start >= len(index):
+        return len(index)
+    origin = loop.time()
+    base = index.times[start]
+    for i in range(start, len(index)):
+        if speed is not None:
+            wait = origin + (index.times[i] - base) / speed - loop.time()
+            if wait > MIN_SLEEP:
+                await asyncio.sleep(wait)
+        await send(index.message(i))
+    return len(index)
@@ -0,0 +1,8 @@
+import sys
+from pathlib import Path
+
+SERVICES_DIR = Path(__file__).resolve().parent.parent / "services"
+
+# The services import their siblings as top-level modules, as they run from their own
+# directory in their containers.
+sys.path[:0] = [str(SERVICES_DIR), str(SERVICES_DIR / "api"), str(SERVICES_DIR / "ingestor")]
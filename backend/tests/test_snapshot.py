@@ -0,0 +1,92 @@
+"""
+The snapshot the API serves, built from what the ingestor writes to Redis.
+
+Requires fakeredis: uv run --with pytest --with fakeredis pytest tests
+"""
+import asyncio
+import json
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+import live
+from snapshot import SnapshotCache
+
+SESSION_INFO = {"Key": 9999, "Meeting": {"Name": "Test Grand Prix"}, "Name": "Race"}
+
+
+def initial_message():
+    return json.dumps({"R": {
+        "SessionInfo": SESSION_INFO,
+        "TimingData": {"Lines": {"1": {"Position": "1"}, "44": {"Position": "2"}}},
+    }})
+
+
+def timing_message(racing_number, position):
+    patch = {"Lines": {racing_number: {"Position": position}}}
+    return json.dumps({"M": [{"H": "Streaming", "M": "feed", "A": ["TimingData", patch, ""]}]})
+
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.aioredis.FakeRedis()
+
+
+@pytest.fixture
+def feed(redis_client, monkeypatch):
+    monkeypatch.setattr(live, "CHECKPOINT_INTERVAL", 30)
+    feed = live.LiveFeed(serve_metrics=False)
+    feed._redis_client = redis_client
+    return feed
+
+
+def timing_lines(snapshot):
+    """The TimingData lines a client ends up with, applying the snapshot's messages in order."""
+    lines = {}
+    for message in snapshot.messages:
+        message = json.loads(message)
+        if message["type"] == "TimingData":
+            for racing_number, line in message["payload"]["Lines"].items():
+                lines.setdefault(racing_number, {}).update(line)
+    return lines
+
+
+def test_snapshot_between_checkpoints_replays_events_and_changes_version(feed, redis_client):
+    async def run():
+        cache = SnapshotCache(redis_client, live.STORED_TOPICS)
+        await feed._on_messages([initial_message()])
+        first = await cache.get()
+
+        await feed._on_messages([timing_message("44", "1")])
+        cache.invalidate()
+        second = await cache.get()
+        return first, second
+
+    first, second = asyncio.run(run())
+
+    assert timing_lines(first)["44"]["Position"] == "2"
+    assert timing_lines(second)["44"]["Position"] == "1"
+    assert second.last_event_id != first.last_event_id
+    assert second.version != first.version
+    assert second.etag != first.etag
+
+
+def test_checkpoint_stores_state_and_keeps_version_moving(feed, redis_client):
+    async def run():
+        cache = SnapshotCache(redis_client, live.STORED_TOPICS)
+        await feed._on_messages([initial_message(), timing_message("44", "1")])
+        await feed._checkpoint()
+        checkpointed = await cache.get()
+
+        await feed._on_messages([timing_message("1", "2")])
+        cache.invalidate()
+        return checkpointed, await cache.get()
+
+    checkpointed, after = asyncio.run(run())
+
+    # Everything published before the checkpoint is in the stored state, nothing is replayed.
+    assert [json.loads(message)["type"] for message in checkpointed.messages].count("TimingData") == 1
+    assert timing_lines(checkpointed)["44"]["Position"] == "1"
+    assert timing_lines(after)["1"]["Position"] == "2"
+    assert after.version != checkpointed.version
@@ -1,31 +1,45 @@
 import React, { useMemo, useState, useEffect, useRef } from 'react';
 import { useStore } from '@tanstack/react-store';
 import { f1Store } from '~/store/f1-store';
+import { useElementWidth, useSeries } from '~/hooks/useSeries';
+import type { LapSeries } from '~/types';
 import { LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer } from 'recharts';
 
-function parseTimeToSeconds(timeStr: string): number {
-	const cleanStr = timeStr.trim().replace(/^[+-]/, '');
-
-	if (cleanStr.includes(':')) {
-		// Format is mm:ss.mmm or m:ss.mmm
-		const [minutes, rest] = cleanStr.split(':');
-		const [seconds, milliseconds = '0'] = rest.split('.');
-		return (
-			parseInt(minutes) * 60 +
-			parseInt(seconds) +
-			parseFloat('0.' + milliseconds)
-		);
-	} else {
-		// Format is just seconds.mmm
-		return parseFloat(cleanStr);
-	}
+// Horizontal pixels per lap shown for each driver.
+const PIXELS_PER_POINT = 4;
+
+interface LapPoint {
+	RacingNumber: string;
+	LapNumber: number;
+	seconds: number;
 }
 
 export const LapChart: React.FC = () => {
-	const { laps, drivers } = useStore(f1Store, (state) => ({
-		laps: state.lapData,
+	const { streamedLaps, drivers } = useStore(f1Store, (state) => ({
+		streamedLaps: state.lapData,
 		drivers: state.driverData,
 	}));
+	const [chartRef, chartWidth] = useElementWidth<HTMLDivElement>();
+
+	// The API serves the live laps: only ask for those the (possibly delayed) stream has
+	// reached, downsampled to what the chart's width can show.
+	const lastLap = useMemo(() => streamedLaps.reduce((last, lap) => Math.max(last, lap.LapNumber), 0), [streamedLaps]);
+	const lapSeries = useSeries<LapSeries>(
+		'series/laps',
+		{ to_lap: lastLap || undefined, points: chartWidth ? Math.max(2, Math.floor(chartWidth / PIXELS_PER_POINT)) : undefined },
+		streamedLaps.length,
+	);
+
+	const laps = useMemo(() => {
+		const points: LapPoint[] = [];
+		if (!lapSeries || !lastLap) return points;
+		for (const [racingNumber, series] of Object.entries(lapSeries)) {
+			series.LapNumber.forEach((lapNumber, i) => {
+				points.push({ RacingNumber: racingNumber, LapNumber: lapNumber, seconds: series.LapTime[i] });
+			});
+		}
+		return points;
+	}, [lapSeries, lastLap]);
 
 	const [showOutliers, setShowOutliers] = useState(false);
 	const [selectedDrivers, setSelectedDrivers] = useState<Set<string>>(new Set());
@@ -55,7 +69,7 @@ export const LapChart: React.FC = () => {
 	const allDriverNumbers = useMemo(() => Object.keys(drivers), [drivers]);
 
 	const processedData = useMemo(() => {
-		const lapsByDriver = new Map<string, any[]>();
+		const lapsByDriver = new Map<string, LapPoint[]>();
 
 		if (!laps.length) return lapsByDriver;
 
@@ -94,12 +108,9 @@ export const LapChart: React.FC = () => {
 
 		// Collect all valid durations
 		laps.forEach(lap => {
-			const lap_s = parseTimeToSeconds(lap.LapTime);
-			if (lap_s !== null) {
-				durations.push(lap_s);
-				minDuration = Math.min(minDuration, lap_s);
-				maxDuration = Math.max(maxDuration, lap_s);
-			}
+			durations.push(lap.seconds);
+			minDuration = Math.min(minDuration, lap.seconds);
+			maxDuration = Math.max(maxDuration, lap.seconds);
 		});
 
 		// Sort durations for percentile calculations
@@ -173,8 +184,8 @@ export const LapChart: React.FC = () => {
 			const { name } = getDriverInfo(driverRacingNumber);
 
 			driverLaps.forEach(lap => {
-				const lap_s = parseTimeToSeconds(lap.LapTime);
-				if (!showOutliers && lap_s !== null && isOutlier(lap_s)) {
+				const lap_s = lap.seconds;
+				if (!showOutliers && isOutlier(lap_s)) {
 					return;
 				}
 
@@ -361,7 +372,7 @@ export const LapChart: React.FC = () => {
 				)}
 			</div>
 			{/* Chart Area */}
-			<div className="flex-1 w-full bg-white dark:bg-black">
+			<div ref={chartRef} className="flex-1 w-full bg-white dark:bg-black">
 				<ResponsiveContainer width="100%" height="100%">
 					<LineChart
 						data={chartData}
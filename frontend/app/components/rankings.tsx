@@ -59,6 +59,14 @@ export const Rankings: React.FC<RankingsProps> = ({ drivers }) => {
 														<span className="font-normal text-zinc-500 dark:text-zinc-400">{stint.TotalLaps}</span>
 													</span>
 												))}
+												{driver.strategy?.PitWindow && (
+													<span
+														className="text-zinc-500 dark:text-zinc-400"
+														title={`Pit window: laps ${driver.strategy.PitWindow.Open}-${driver.strategy.PitWindow.Close}, best lap ${driver.strategy.PitWindow.Optimal} (${driver.strategy.Degradation?.toFixed(2)}s/lap degradation)`}
+													>
+														{`→${driver.strategy.PitWindow.Optimal}`}
+													</span>
+												)}
 											</div>
 										</td>
 										<td className="py-1 px-2 border-zinc-200 dark:border-zinc-700 text-left">
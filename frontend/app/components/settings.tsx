@@ -3,7 +3,6 @@ import { NumberInput } from "./number-input";
 import { useStore } from '@tanstack/react-store';
 import { f1Store } from '~/store/f1-store';
 import { useSettings } from "~/context/settings-context";
-import { circuitAvgPitTimeLostData } from "~/data/circuit-data";
 
 export const Settings: React.FC = () => {
 	const [isOpen, setIsOpen] = useState(false);
@@ -14,34 +13,24 @@ export const Settings: React.FC = () => {
 		scVsc: circuitAvgPitTimeLost.sc_vsc.toString(),
 	});
 
-	const { session } = useStore(f1Store, (state) => ({
-		session: state.sessionInfo,
+	// The defaults are the circuit's pit losses, from the backend's Rankings topic, which
+	// also projects pit stops with them (see /pit-simulation).
+	const { greenFlag, neutralized } = useStore(f1Store, (state) => ({
+		greenFlag: state.rankings?.PitLoss.GreenFlag,
+		neutralized: state.rankings?.PitLoss.Neutralized,
 	}));
 
 	useEffect(() => {
-		if (session) {
-			const circuitName = session.Meeting.Circuit.ShortName || '';
-			const pitTimeData = circuitAvgPitTimeLostData.find(c => c.circuit_short_name === circuitName);
-			if (pitTimeData) {
-				const newPitTimes = { green_flag: pitTimeData.green_flag, sc_vsc: pitTimeData.sc_vsc };
-				setCircuitAvgPitTimeLost(newPitTimes);
-				setInputValues(prev => ({
-					...prev,
-					greenFlag: newPitTimes.green_flag.toString(),
-					scVsc: newPitTimes.sc_vsc.toString()
-				}));
-			} else {
-				// fallback to default
-				const defaultPitTimes = { green_flag: 20, sc_vsc: 12 };
-				setCircuitAvgPitTimeLost(defaultPitTimes);
-				setInputValues(prev => ({
-					...prev,
-					greenFlag: defaultPitTimes.green_flag.toString(),
-					scVsc: defaultPitTimes.sc_vsc.toString()
-				}));
-			}
+		if (greenFlag !== undefined && neutralized !== undefined) {
+			const newPitTimes = { green_flag: greenFlag, sc_vsc: neutralized };
+			setCircuitAvgPitTimeLost(newPitTimes);
+			setInputValues(prev => ({
+				...prev,
+				greenFlag: newPitTimes.green_flag.toString(),
+				scVsc: newPitTimes.sc_vsc.toString()
+			}));
 		}
-	}, [session, setCircuitAvgPitTimeLost]);
+	}, [greenFlag, neutralized, setCircuitAvgPitTimeLost]);
 
 	useEffect(() => {
 		const handleClickOutside = (event: MouseEvent) => {
@@ -1,7 +1,12 @@
-import React from 'react';
+import React, { useMemo } from 'react';
 import { LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer } from 'recharts';
 import { useStore } from '@tanstack/react-store';
 import { f1Store } from '~/store/f1-store';
+import { useElementWidth, useSeries } from '~/hooks/useSeries';
+import type { WeatherSeries } from '~/types';
+
+// Horizontal pixels per weather sample shown.
+const PIXELS_PER_POINT = 8;
 
 const formatXAxis = (time: string) => {
     const date = new Date(time);
@@ -29,21 +34,37 @@ const WindDirectionArrow = (props: any) => {
 
 export const WeatherCharts: React.FC = () => {
     const weatherDataSeries = useStore(f1Store, (state) => state.weatherDataSeries);
+    const [chartRef, chartWidth] = useElementWidth<HTMLDivElement>();
+
+    // The API serves the live series: only ask for the samples the (possibly delayed)
+    // stream has reached, averaged down to what the charts' width can show.
+    const samples = weatherDataSeries?.Series ?? [];
+    const lastSample = samples.length ? samples[samples.length - 1].Timestamp : undefined;
+    const weatherSeries = useSeries<WeatherSeries>(
+        'series/weather',
+        { end: lastSample, points: chartWidth ? Math.max(1, Math.floor(chartWidth / PIXELS_PER_POINT)) : undefined },
+        samples.length,
+    );
+
+    const chartData = useMemo(() => {
+        if (!weatherSeries || !lastSample) {
+            return [];
+        }
+        return weatherSeries.Timestamp.map((time, i) => ({
+            time,
+            AirTemp: weatherSeries.AirTemp[i],
+            TrackTemp: weatherSeries.TrackTemp[i],
+            WindSpeed: weatherSeries.WindSpeed[i],
+            WindDirection: weatherSeries.WindDirection[i] ?? undefined,
+        }));
+    }, [weatherSeries, lastSample]);
 
     if (!weatherDataSeries) {
         return null;
     }
 
-    const chartData = weatherDataSeries.Series.map(entry => ({
-        time: entry.Timestamp,
-        AirTemp: parseFloat(entry.Weather.AirTemp),
-        TrackTemp: parseFloat(entry.Weather.TrackTemp),
-        WindSpeed: parseFloat(entry.Weather.WindSpeed),
-        WindDirection: parseInt(entry.Weather.WindDirection, 10),
-    }));
-
     return (
-        <div className="w-full h-full flex flex-col bg-white dark:bg-black">
+        <div ref={chartRef} className="w-full h-full flex flex-col bg-white dark:bg-black">
             {/* Temperature Chart */}
             <div className="flex-1">
                 <ResponsiveContainer width="100%" height="100%">
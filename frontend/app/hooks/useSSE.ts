@@ -1,49 +1,173 @@
 import { useState, useEffect, useRef } from 'react';
-import type { F1Message, SessionInfo, DriverData, TimingData, Lap, WeatherData, LapCount, TrackStatus, Heartbeat, RaceControlMessages, WeatherDataSeries, TyreStintSeries } from '~/types';
-import { f1Store } from '~/store/f1-store';
-import { merge } from 'lodash';
+import type { F1Message, Lap } from '~/types';
+import { f1Store, type F1State } from '~/store/f1-store';
 import { logger } from '~/utils/logger';
+import { mergePatch } from '~/utils/merge-patch';
+import { apiUrl } from '~/utils/api';
 
-const processF1Message = (message: F1Message) => {
-	const messagePayload = message.payload;
-
-	if (message.type === 'DriverList') {
-		f1Store.setState(state => ({ ...state, driverData: merge({}, state.driverData, messagePayload as DriverData) }));
-		logger.log('SSE LEVEL DRIVER DATA PARSED:', message);
-	} else if (message.type === 'TimingData') {
-		f1Store.setState(state => ({ ...state, timingData: merge({}, state.timingData, messagePayload as TimingData) }));
-		logger.log('SSE LEVEL TIMING DATA PARSED:', message);
-	} else if (message.type === 'LapCount') {
-		f1Store.setState(state => ({ ...state, lapCount: merge({}, state.timingData, messagePayload as LapCount) }));
-		logger.log('SSE LEVEL LAP COUNT PARSED:', message);
-	} else if (message.type === 'TrackStatus') {
-		f1Store.setState(state => ({ ...state, trackStatus: merge({}, state.timingData, messagePayload as TrackStatus) }));
-		logger.log('SSE LEVEL TRACK STATUS PARSED:', message);
-	} else if (message.type === 'SessionInfo') {
-		f1Store.setState(state => ({ ...state, sessionInfo: messagePayload as SessionInfo }));
-		logger.log('SSE LEVEL SESSION INFO PARSED:', message);
+const TOPIC_STATE_KEYS: Record<string, keyof F1State> = {
+	DriverList: 'driverData',
+	TimingData: 'timingData',
+	LapCount: 'lapCount',
+	TrackStatus: 'trackStatus',
+	SessionInfo: 'sessionInfo',
+	WeatherData: 'weatherData',
+	Heartbeat: 'heartbeat',
+	RaceControlMessages: 'raceControlMessages',
+	WeatherDataSeries: 'weatherDataSeries',
+	TyreStintSeries: 'tyreStintSeries',
+	Rankings: 'rankings',
+	StrategyModel: 'strategyModel',
+};
+
+const MAX_PENDING_DELTAS = 500;
+
+// The sequence number a delta applies to. A delta combining several updates (sent to a client
+// that fell behind) carries it as `base`, and can be applied to any state from there on.
+const deltaBase = (message: F1Message) => message.base ?? message.seq! - 1;
+
+// The state with every message received since the last flush applied, and the objects created
+// for it, which later messages can modify in place. Flushed to the store once per animation frame.
+let draft: F1State | null = null;
+let owned = new WeakSet<object>();
+let flushScheduled = false;
+
+const flushState = () => {
+	flushScheduled = false;
+	if (draft) {
+		const state = draft;
+		draft = null;
+		f1Store.setState(() => state);
+	}
+};
+
+// Applies a change to the draft state, the store being updated on the next animation frame.
+const updateState = (update: (state: F1State) => void) => {
+	if (!draft) {
+		draft = { ...f1Store.state };
+		owned = new WeakSet<object>([draft]);
+	}
+	update(draft);
+	if (!flushScheduled) {
+		flushScheduled = true;
+		if (typeof requestAnimationFrame === 'function') {
+			requestAnimationFrame(flushState);
+		} else {
+			setTimeout(flushState, 0);
+		}
+	}
+};
+
+// The state including the changes not flushed yet.
+const currentState = () => draft ?? f1Store.state;
+
+// Last applied sequence number per topic.
+const topicSeq: Record<string, number> = {};
+// Deltas received while a topic waits for a keyframe after a sequence gap.
+const pendingDeltas: Record<string, F1Message[]> = {};
+
+const applyTopicMessage = (message: F1Message) => {
+	const stateKey = TOPIC_STATE_KEYS[message.type];
+	updateState(state => {
+		const value = message.delta ? mergePatch(state[stateKey], message.payload, owned) : message.payload;
+		Object.assign(state, { [stateKey]: value });
+	});
+	if (message.seq !== undefined) {
+		topicSeq[message.type] = message.seq;
+	}
+	logger.log(`SSE LEVEL ${message.type} ${message.delta ? 'DELTA' : 'KEYFRAME'} PARSED:`, message);
+};
+
+const processTopicMessage = (message: F1Message, requestKeyframe: (topic: string) => void) => {
+	const { type, seq } = message;
+
+	if (!message.delta) {
+		applyTopicMessage(message);
+		const pending = pendingDeltas[type];
+		if (!pending) {
+			return;
+		}
+		delete pendingDeltas[type];
+		for (const [index, delta] of pending.entries()) {
+			if (delta.seq! <= topicSeq[type]) {
+				continue;
+			}
+			if (deltaBase(delta) > topicSeq[type]) {
+				// Still missing updates, wait for the next published keyframe.
+				pendingDeltas[type] = pending.slice(index);
+				return;
+			}
+			applyTopicMessage(delta);
+		}
+		return;
+	}
+
+	if (pendingDeltas[type]) {
+		if (pendingDeltas[type].length < MAX_PENDING_DELTAS) {
+			pendingDeltas[type].push(message);
+		}
+		return;
+	}
+
+	if (topicSeq[type] !== undefined && seq! <= topicSeq[type]) {
+		// Already contained in the initial data or a keyframe.
+		return;
+	}
+
+	if (topicSeq[type] === undefined || deltaBase(message) > topicSeq[type]) {
+		logger.warn(`Sequence gap for ${type}: have ${topicSeq[type] ?? 0}, got a delta from ${deltaBase(message)}. Requesting keyframe.`);
+		pendingDeltas[type] = [message];
+		requestKeyframe(type);
+		return;
+	}
+
+	applyTopicMessage(message);
+};
+
+// The lap list is copied once per flush, later laps being appended to the copy.
+const appendLaps = (laps: Lap[]) => {
+	updateState(state => {
+		if (!owned.has(state.lapData)) {
+			state.lapData = [...state.lapData];
+			owned.add(state.lapData);
+		}
+		state.lapData.push(...laps);
+	});
+};
+
+// LapData messages carry the laps ending at position `seq` of the session's lap list.
+const processLapMessage = (message: F1Message, requestKeyframe: (topic: string) => void) => {
+	const laps = message.payload as Lap[];
+	if (message.seq === undefined) {
+		appendLaps(laps);
+		return;
+	}
+
+	const start = message.seq - laps.length;
+	const have = currentState().lapData.length;
+	if (start === 0) {
+		updateState(state => {
+			state.lapData = laps;
+		});
+	} else if (start > have) {
+		logger.warn(`Lap gap: have ${have} laps, got laps from ${start}. Requesting keyframe.`);
+		requestKeyframe('LapData');
+		return;
+	} else if (message.seq > have) {
+		appendLaps(laps.slice(have - start));
+	}
+	logger.log('SSE LEVEL LAP DATA PARSED:', message);
+};
+
+const processF1Message = (message: F1Message, requestKeyframe: (topic: string) => void) => {
+	if (message.type in TOPIC_STATE_KEYS) {
+		processTopicMessage(message, requestKeyframe);
 	} else if (message.type === 'LapData') {
-		f1Store.setState(state => ({ ...state, lapData: [...state.lapData, ...(messagePayload as Lap[])] }));
-		logger.log('SSE LEVEL LAP DATA PARSED:', message);
-	} else if (message.type === 'WeatherData') {
-		f1Store.setState(state => ({ ...state, weatherData: messagePayload as WeatherData }));
-		logger.log('SSE LEVEL WEATHER DATA PARSED:', message);
-	} else if (message.type === 'Heartbeat') {
-		f1Store.setState(state => ({ ...state, heartbeat: messagePayload as Heartbeat }));
-		logger.log('SSE LEVEL HEARTBEAT PARSED:', message);
-	} else if (message.type === 'RaceControlMessages') {
-		f1Store.setState(state => ({ ...state, raceControlMessages: messagePayload as RaceControlMessages }));
-		logger.log('SSE LEVEL RACE CONTROL MESSAGES PARSED:', message);
-	} else if (message.type === 'WeatherDataSeries') {
-		f1Store.setState(state => ({ ...state, weatherDataSeries: messagePayload as WeatherDataSeries }));
-		logger.log('SSE LEVEL WEATHER DATA SERIES PARSED:', message);
-	} else if (message.type === 'TyreStintSeries') {
-		f1Store.setState(state => ({ ...state, tyreStintSeries: messagePayload as TyreStintSeries }));
-		logger.log('SSE LEVEL TYRE STINT SERIES PARSED:', message);
+		processLapMessage(message, requestKeyframe);
 	} else {
 		logger.warn(
 			`Received SSE message with unhandled data structure. Type: ${message.type}`,
-			messagePayload
+			message.payload
 		);
 	}
 };
@@ -58,68 +182,44 @@ const useSSE = ({ url, delay }: UseSSEProps) => {
 	const [isConnected, setIsConnected] = useState<boolean>(false);
 	const disconnectTimer = useRef<NodeJS.Timeout | null>(null);
 
-	const delayRef = useRef(delay);
-	const queueRef = useRef<{
-		messages: Array<{ message: F1Message, receivedAt: number }>;
-		timerId: NodeJS.Timeout | null;
-	}>({ messages: [], timerId: null });
+	const urlRef = useRef(url);
+	urlRef.current = url;
 
-	const scheduleProcessing = () => {
-		if (queueRef.current.timerId || queueRef.current.messages.length === 0) {
+	const requestKeyframe = (topic: string) => {
+		if (delay > 0) {
+			// The keyframe endpoint serves the live state, wait for the next published keyframe instead.
 			return;
 		}
-
-		const nextMessage = queueRef.current.messages[0];
-		const delayInMs = delayRef.current * 1000;
-		const timeToWait = (nextMessage.receivedAt + delayInMs) - Date.now();
-
-		queueRef.current.timerId = setTimeout(processQueue, Math.max(0, timeToWait));
-	};
-
-	const processQueue = () => {
-		const now = Date.now();
-		const delayInMs = delayRef.current * 1000;
-		let processCount = 0;
-
-		for (const item of queueRef.current.messages) {
-			if (now >= item.receivedAt + delayInMs) {
-				processF1Message(item.message);
-				processCount++;
-			} else {
-				break;
-			}
-		}
-
-		if (processCount > 0) {
-			queueRef.current.messages.splice(0, processCount);
-		}
-
-		queueRef.current.timerId = null;
-		scheduleProcessing();
+		fetch(apiUrl(urlRef.current, `keyframe/${topic}`))
+			.then(response => {
+				if (!response.ok) {
+					throw new Error(`HTTP ${response.status}`);
+				}
+				return response.json() as Promise<F1Message>;
+			})
+			.then(keyframe => {
+				// A published keyframe may already have resynced the topic.
+				if (topic === 'LapData' || pendingDeltas[topic]) {
+					processF1Message(keyframe, requestKeyframe);
+				}
+			})
+			.catch(e => logger.error(`Failed to fetch keyframe for ${topic}:`, e));
 	};
 
-	useEffect(() => {
-		delayRef.current = delay;
-		if (queueRef.current.timerId) {
-			clearTimeout(queueRef.current.timerId);
-			queueRef.current.timerId = null;
-		}
-		if (delay === 0) {
-			if (queueRef.current.messages.length > 0) {
-				queueRef.current.messages.forEach(item => processF1Message(item.message));
-				queueRef.current.messages = [];
-			}
-		} else {
-			scheduleProcessing();
-		}
-	}, [delay]);
-
 	useEffect(() => {
 		if (typeof window === 'undefined' || !url) {
 			return;
 		}
 
-		const eventSource = new EventSource(url);
+		let eventSource: EventSource | null = null;
+		let closed = false;
+
+		const handleMessage = (message: F1Message) => processF1Message(message, requestKeyframe);
+
+		// The new stream starts from its own initial state.
+		for (const topic of Object.keys(pendingDeltas)) {
+			delete pendingDeltas[topic];
+		}
 
 		const resetDisconnectTimer = () => {
 			if (disconnectTimer.current) {
@@ -127,58 +227,88 @@ const useSSE = ({ url, delay }: UseSSEProps) => {
 			}
 			disconnectTimer.current = setTimeout(() => {
 				logger.log('SSE inactivity timeout after 30 seconds. Closing connection.');
-				eventSource.close();
+				eventSource?.close();
 			}, 30000);
 		};
 
-		setError(null);
-		setIsConnected(false);
+		const connect = (version: number | null) => {
+			const streamUrl = new URL(url, window.location.href);
+			if (version !== null) {
+				streamUrl.searchParams.set('version', String(version));
+			}
+			if (delay > 0) {
+				streamUrl.searchParams.set('delay', String(delay));
+			}
+			eventSource = new EventSource(streamUrl);
 
-		eventSource.onopen = () => {
-			logger.log(`SSE connection opened to ${url}`);
-			setIsConnected(true);
-			setError(null);
-			resetDisconnectTimer();
-		};
+			eventSource.onopen = () => {
+				logger.log(`SSE connection opened to ${url}`);
+				setIsConnected(true);
+				setError(null);
+				resetDisconnectTimer();
+			};
+
+			eventSource.onmessage = (event) => {
+				resetDisconnectTimer();
+				try {
+					handleMessage(JSON.parse(event.data) as F1Message);
+				} catch (e) {
+					logger.error('Failed to parse SSE message data:', e, event.data);
+					setError('Failed to parse message data.');
+				}
+			};
 
-		eventSource.onmessage = (event) => {
-			resetDisconnectTimer();
-			try {
-				const parsedMessage = JSON.parse(event.data) as F1Message;
-				if (delayRef.current === 0) {
-					processF1Message(parsedMessage);
+			eventSource.onerror = (errEvent) => {
+				logger.error(`SSE connection error for ${url}:`, errEvent);
+				if (eventSource?.readyState === EventSource.CLOSED) {
+					setError('SSE connection closed by server or due to an irrecoverable error.');
 				} else {
-					queueRef.current.messages.push({ message: parsedMessage, receivedAt: Date.now() });
-					scheduleProcessing();
+					setError('SSE connection error. Browser will attempt to reconnect.');
 				}
-			} catch (e) {
-				logger.error('Failed to parse SSE message data:', e, event.data);
-				setError('Failed to parse message data.');
-			}
+				setIsConnected(false);
+			};
 		};
 
-		eventSource.onerror = (errEvent) => {
-			logger.error(`SSE connection error for ${url}:`, errEvent);
-			if (eventSource.readyState === EventSource.CLOSED) {
-				setError('SSE connection closed by server or due to an irrecoverable error.');
-			} else {
-				setError('SSE connection error. Browser will attempt to reconnect.');
-			}
-			setIsConnected(false);
-		};
+		setError(null);
+		setIsConnected(false);
+
+		if (delay > 0) {
+			// The server holds the stream back, starting from the state as it was `delay` seconds ago.
+			connect(null);
+		} else {
+			// Start from the cached snapshot, so the stream only needs to send what changed since.
+			fetch(apiUrl(url, 'snapshot'), { cache: 'no-cache' })
+				.then(response => {
+					if (!response.ok) {
+						throw new Error(`HTTP ${response.status}`);
+					}
+					return response.json() as Promise<{ version: number; messages: F1Message[] }>;
+				})
+				.then(snapshot => {
+					if (closed) {
+						return;
+					}
+					snapshot.messages.forEach(handleMessage);
+					connect(snapshot.version);
+				})
+				.catch(e => {
+					logger.error('Failed to fetch snapshot, falling back to the stream initial data:', e);
+					if (!closed) {
+						connect(null);
+					}
+				});
+		}
 
 		return () => {
 			logger.log(`Closing SSE connection to ${url}`);
+			closed = true;
 			if (disconnectTimer.current) {
 				clearTimeout(disconnectTimer.current);
 			}
-			if (queueRef.current.timerId) {
-				clearTimeout(queueRef.current.timerId);
-			}
-			eventSource.close();
+			eventSource?.close();
 			setIsConnected(false);
 		};
-	}, [url]);
+	}, [url, delay]);
 
 	return { error, isConnected };
 };
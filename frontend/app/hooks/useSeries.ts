@@ -0,0 +1,90 @@
+import { useEffect, useRef, useState } from 'react';
+import { apiUrl } from '~/utils/api';
+import { logger } from '~/utils/logger';
+
+// Delay before refetching a series after the data it depends on changed, so that a burst
+// of updates (every driver completing a lap) causes a single request.
+const SERIES_REFRESH_DELAY_MS = 1000;
+// Longest a series is left stale while the data it depends on keeps changing.
+const SERIES_MAX_STALENESS_MS = 3000;
+
+/**
+ * Fetches a downsampled series from the API (e.g. `series/laps`), and refetches it
+ * whenever `params` or `refreshKey` change. Undefined params are left out.
+ */
+export function useSeries<T>(path: string, params: Record<string, string | number | undefined>, refreshKey: unknown): T | null {
+	const [data, setData] = useState<T | null>(null);
+	const lastFetch = useRef(0);
+	// Requests are numbered so that a response never replaces that of a later request.
+	const requests = useRef({ sent: 0, applied: 0 });
+	const controller = useRef<AbortController | null>(null);
+	const query = new URLSearchParams(
+		Object.entries(params).filter((entry): entry is [string, string | number] => entry[1] !== undefined).map(([key, value]) => [key, String(value)])
+	).toString();
+
+	// Requests are aborted when the component unmounts.
+	useEffect(() => {
+		const current = controller.current = new AbortController();
+		return () => current.abort();
+	}, []);
+
+	useEffect(() => {
+		const sseUrl = import.meta.env.VITE_SSE_URL;
+		if (typeof window === 'undefined' || !sseUrl) {
+			return;
+		}
+		// Debounced, but refetched at least every SERIES_MAX_STALENESS_MS.
+		const wait = data === null ? 0 : Math.min(SERIES_REFRESH_DELAY_MS, Math.max(0, lastFetch.current + SERIES_MAX_STALENESS_MS - Date.now()));
+		const timer = setTimeout(() => {
+			lastFetch.current = Date.now();
+			const request = ++requests.current.sent;
+			const signal = controller.current?.signal;
+			fetch(`${apiUrl(sseUrl, path)}?${query}`, { signal })
+				.then(response => {
+					if (!response.ok) {
+						throw new Error(`HTTP ${response.status}`);
+					}
+					return response.json() as Promise<T>;
+				})
+				.then(result => {
+					if (request > requests.current.applied) {
+						requests.current.applied = request;
+						setData(result);
+					}
+				})
+				.catch(e => {
+					if (!signal?.aborted) {
+						logger.error(`Failed to fetch ${path}:`, e);
+					}
+				});
+		}, wait);
+
+		// A request in flight is not aborted by the next change: with data changing faster
+		// than requests complete, none would.
+		return () => clearTimeout(timer);
+	}, [path, query, refreshKey]);
+
+	return data;
+}
+
+/**
+ * The width of an element in pixels, kept up to date as it is resized. Returns a callback
+ * ref to attach to the element, and its width (0 until it is rendered).
+ */
+export function useElementWidth<T extends HTMLElement>(): [(element: T | null) => void, number] {
+	const [element, setElement] = useState<T | null>(null);
+	const [width, setWidth] = useState(0);
+
+	useEffect(() => {
+		if (!element || typeof ResizeObserver === 'undefined') {
+			return;
+		}
+		const observer = new ResizeObserver(entries => {
+			setWidth(Math.round(entries[0].contentRect.width));
+		});
+		observer.observe(element);
+		return () => observer.disconnect();
+	}, [element]);
+
+	return [setElement, width];
+}
@@ -21,33 +21,16 @@ export function meta({ }: Route.MetaArgs) {
   ];
 }
 
-function parseTimeToSeconds(timeStr: string): number {
-  // Remove leading '+' or '-' if present
-  const cleanStr = timeStr.trim().replace(/^[+-]/, '');
-
-  if (cleanStr.includes(':')) {
-    // Format is mm:ss.mmm or m:ss.mmm
-    const [minutes, rest] = cleanStr.split(':');
-    const [seconds, milliseconds = '0'] = rest.split('.');
-    return (
-      parseInt(minutes) * 60 +
-      parseInt(seconds) +
-      parseFloat('0.' + milliseconds)
-    );
-  } else {
-    // Format is just seconds.mmm
-    return parseFloat(cleanStr);
-  }
-}
-
 export default function Home() {
-  const { sessionInfo, driverData, lapCount, trackStatus, timingData, tyreStintSeries } = useStore(f1Store, (state) => ({
+  const { sessionInfo, driverData, lapCount, trackStatus, timingData, tyreStintSeries, rankings, strategyModel } = useStore(f1Store, (state) => ({
     sessionInfo: state.sessionInfo,
     driverData: state.driverData,
     lapCount: state.lapCount,
     trackStatus: state.trackStatus,
     timingData: state.timingData,
     tyreStintSeries: state.tyreStintSeries,
+    rankings: state.rankings,
+    strategyModel: state.strategyModel,
   }));
   const [selectedDriver, setSelectedDriver] = useState<string | null>(null);
   const [selectedPenalty, setSelectedPenalty] = useState<number>(0);
@@ -62,6 +45,11 @@ export default function Home() {
 
   const loading = !sessionInfo || !driverData;
 
+  // The pit loss set in the settings, which default to the backend's for the circuit.
+  const pitLoss = trackStatus?.Status === "6" || trackStatus?.Status === "4"
+    ? circuitAvgPitTimeLost.sc_vsc
+    : circuitAvgPitTimeLost.green_flag;
+
   const mappedDrivers = useMemo(() => {
     if (!sessionInfo || !driverData || !timingData || !timingData.Lines) {
       return [];
@@ -87,36 +75,19 @@ export default function Home() {
       const isStopped = driverTimingInfo.Stopped;
       const isSpecialStatus = isRetired || isStopped;
 
+      // Numeric gaps come from the Rankings topic, derived by the backend.
+      const ranking = rankings?.Lines[racingNumber];
+      const gapInSeconds = ranking?.Gap ?? Infinity;
       let gapDisplay: string;
-      let gapInSeconds: number = -1;
 
       if (driverTimingInfo.Position === "1") {
         gapDisplay = "Leader";
-        gapInSeconds = 0;
       } else if (driverTimingInfo.GapToLeader) {
         gapDisplay = driverTimingInfo.GapToLeader;
-        if (driverTimingInfo.GapToLeader.includes('L')) {
-          gapInSeconds = Infinity;
-        } else {
-          try {
-            gapInSeconds = parseTimeToSeconds(driverTimingInfo.GapToLeader);
-          } catch (e) {
-            logger.warn(`Could not parse GapToLeader for driver ${racingNumber}: ${driverTimingInfo.GapToLeader}`, e);
-            gapInSeconds = Infinity;
-          }
-        }
+      } else if (ranking && (ranking.Retired || ranking.Stopped) && lapCount) {
+        gapDisplay = `${ranking.LapsBehind}L`;
       } else {
-        if (lapCount && (driverTimingInfo.Retired || driverTimingInfo.Stopped)) {
-          if (driverTimingInfo.NumberOfLaps) {
-            gapDisplay = `${lapCount.CurrentLap - driverTimingInfo.NumberOfLaps}L`
-          } else {
-            gapDisplay = `${lapCount.CurrentLap}L`
-          }
-        } else {
-          gapDisplay = "-";
-        }
-        gapInSeconds = Infinity;
-        logger.warn(`GapToLeader is missing for driver ${racingNumber} (Position: ${driverTimingInfo.Position})`);
+        gapDisplay = "-";
       }
 
       return {
@@ -130,6 +101,7 @@ export default function Home() {
         gapInSeconds: gapInSeconds,
         isSpecialStatus: isSpecialStatus,
         stints: driverStints,
+        strategy: strategyModel?.Lines[racingNumber],
       };
     }).sort((a, b) => a.position - b.position);
 
@@ -138,12 +110,16 @@ export default function Home() {
 
     if (selectedDriver) {
       const driverToPit = currentDrivers.find(d => d.name === selectedDriver);
-      if (driverToPit) {
-        const pitTimeLost = (trackStatus?.Status === "6" || trackStatus?.Status === "4"
-          ? circuitAvgPitTimeLost.sc_vsc
-          : circuitAvgPitTimeLost.green_flag
-        ) + selectedPenalty;
-        const gapInSecondsAfterPit = driverToPit.gapInSeconds + pitTimeLost;
+      // Projected from the streamed Rankings as the backend's /pit-simulation does, which
+      // would otherwise be requested by every viewer on nearly every update. A lapped
+      // driver (without a gap) stays behind every driver on the lead lap.
+      const gap = driverToPit ? rankings?.Lines[driverToPit.racingNumber]?.Gap ?? null : null;
+      if (driverToPit && gap !== null) {
+        const gapInSecondsAfterPit = gap + pitLoss + selectedPenalty;
+        const gapsAhead = Object.entries(rankings?.Lines ?? {})
+          .filter(([racingNumber, line]) => racingNumber !== driverToPit.racingNumber && line.Gap !== null && line.Gap <= gapInSecondsAfterPit && !line.Retired && !line.Stopped)
+          .map(([, line]) => line.Gap as number);
+        const interval = gapsAhead.length > 0 ? gapInSecondsAfterPit - Math.max(...gapsAhead) : null;
 
         const simulatedDriver: DriverInterval = {
           ...driverToPit,
@@ -153,25 +129,16 @@ export default function Home() {
           gapInSeconds: gapInSecondsAfterPit,
           gapDisplay: `+${gapInSecondsAfterPit.toFixed(1)}s`,
           isSpecialStatus: true,
-          intervalToPositionAhead: '',
+          intervalToPositionAhead: interval !== null ? `+${interval.toFixed(1)}` : '',
         };
         currentDrivers.push(simulatedDriver);
         currentDrivers.sort((a, b) => a.gapInSeconds - b.gapInSeconds);
-
-        const simulatedDriverIndex = currentDrivers.findIndex(d => d.name === simulatedDriver.name);
-        if (simulatedDriverIndex > 0) {
-          const driverAhead = currentDrivers[simulatedDriverIndex - 1];
-          const interval = currentDrivers[simulatedDriverIndex].gapInSeconds - driverAhead.gapInSeconds;
-          if (interval >= 0 && isFinite(interval)) {
-            currentDrivers[simulatedDriverIndex].intervalToPositionAhead = `+${interval.toFixed(1)}`;
-          }
-        }
       }
     }
 
     logger.log("Final computed drivers in useMemo", currentDrivers);
     return currentDrivers;
-  }, [sessionInfo, timingData, driverData, selectedDriver, selectedPenalty, tyreStintSeries, circuitAvgPitTimeLost, trackStatus]);
+  }, [sessionInfo, timingData, driverData, selectedDriver, selectedPenalty, tyreStintSeries, pitLoss, rankings, strategyModel]);
 
 
   function handleDriverChange(event: React.ChangeEvent<HTMLSelectElement>) {
@@ -1,7 +1,7 @@
 import { Store } from '@tanstack/store'
-import type { SessionInfo, DriverData, LapCount, TrackStatus, TimingData, Lap, WeatherData, Heartbeat, RaceControlMessages, WeatherDataSeries, TyreStintSeries } from '~/types';
+import type { SessionInfo, DriverData, LapCount, TrackStatus, TimingData, Lap, WeatherData, Heartbeat, RaceControlMessages, WeatherDataSeries, TyreStintSeries, Rankings, StrategyModel } from '~/types';
 
-interface F1State {
+export interface F1State {
     sessionInfo: SessionInfo | null;
     driverData: DriverData;
     lapCount: LapCount | null;
@@ -13,6 +13,8 @@ interface F1State {
     raceControlMessages: RaceControlMessages | null;
     weatherDataSeries: WeatherDataSeries | null;
     tyreStintSeries: TyreStintSeries | null;
+    rankings: Rankings | null;
+    strategyModel: StrategyModel | null;
 }
 
 export const f1Store = new Store<F1State>({
@@ -27,4 +29,6 @@ export const f1Store = new Store<F1State>({
     raceControlMessages: null,
     weatherDataSeries: null,
     tyreStintSeries: null,
+    rankings: null,
+    strategyModel: null,
 });
@@ -27,6 +27,7 @@ export interface DriverInterval {
 	gapInSeconds: number;
 	isSpecialStatus: boolean;
 	stints?: TyreStint[];
+	strategy?: StrategyDriver;
 }
 
 export interface TimingData {
@@ -101,7 +102,10 @@ export interface PersonalBestLapTime {
 
 export interface F1Message {
 	type: string; // e.g., "DriverTracker", "LapData"
-	payload: DriverData | TimingData | SessionInfo | LapCount | TrackStatus | Lap[] | WeatherData | Heartbeat | RaceControlMessages | WeatherDataSeries | TyreStintSeries;
+	payload: DriverData | TimingData | SessionInfo | LapCount | TrackStatus | Lap[] | WeatherData | Heartbeat | RaceControlMessages | WeatherDataSeries | TyreStintSeries | Rankings | StrategyModel;
+	seq?: number; // Per-topic sequence number
+	delta?: boolean; // True when payload is a patch to the previous state rather than the full state
+	base?: number; // Sequence number a delta applies to, when it combines several updates
 }
 
 export interface Heartbeat {
@@ -229,3 +233,68 @@ export interface TyreStint {
 	TotalLaps: number;
 	StartLaps: number;
 }
+
+// Derived by the backend from TimingData, LapCount, TrackStatus and SessionInfo.
+export interface Rankings {
+	PitLoss: {
+		GreenFlag: number;
+		Neutralized: number;
+		TrackStatus: string;
+		Current: number;
+	};
+	Lines: {
+		[driverNumber: string]: RankingsDriver;
+	};
+}
+
+export interface RankingsDriver {
+	Position: number | null;
+	Gap: number | null; // Seconds to the leader, null when lapped or unknown
+	LapsBehind: number;
+	Interval: number | null;
+	Retired: boolean;
+	Stopped: boolean;
+	InPit: boolean;
+}
+
+// Derived by the backend from the laps, TyreStintSeries, LapCount and Rankings.
+export interface StrategyModel {
+	Lines: {
+		[driverNumber: string]: StrategyDriver;
+	};
+}
+
+export interface StrategyDriver {
+	Stint: number;
+	Compound: string;
+	TyreAge: number;
+	FittedLaps: number;
+	Degradation: number | null; // Seconds lost per lap of tyre age
+	ProjectedLapTime: number | null;
+	PitWindow: {
+		Open: number;
+		Optimal: number;
+		Close: number;
+		Gain: number; // Seconds a stop at the optimal lap gains over not stopping, net of the pit loss
+	} | null;
+}
+
+// GET /series/laps: lap times in seconds per racing number, downsampled.
+export interface LapSeries {
+	[driverNumber: string]: {
+		LapNumber: number[];
+		LapTime: number[];
+	};
+}
+
+// GET /series/weather: weather samples as columns, averaged into buckets.
+export interface WeatherSeries {
+	Timestamp: string[];
+	AirTemp: (number | null)[];
+	TrackTemp: (number | null)[];
+	Humidity: (number | null)[];
+	Pressure: (number | null)[];
+	Rainfall: (number | null)[];
+	WindSpeed: (number | null)[];
+	WindDirection: (number | null)[];
+}
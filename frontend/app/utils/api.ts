@@ -0,0 +1,7 @@
+/**
+ * Resolves a path on the API relative to the SSE stream URL (e.g. `.../f1-stream/` -> `.../keyframe/TimingData`).
+ */
+export function apiUrl(sseUrl: string, path: string): string {
+	const base = sseUrl.endsWith('/') ? sseUrl : `${sseUrl}/`;
+	return new URL(`../${path}`, new URL(base, window.location.href)).toString();
+}
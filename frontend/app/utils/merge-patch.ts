@@ -0,0 +1,41 @@
+const isPlainObject = (value: unknown): value is Record<string, unknown> =>
+	typeof value === 'object' && value !== null && !Array.isArray(value);
+
+/**
+ * Merges an F1 feed patch into a target object, mirroring the ingestor's `merge`.
+ * Objects are merged recursively, arrays patched with index-keyed objects are
+ * updated (or appended to when the index is out of range), and any other value
+ * replaces the target.
+ *
+ * The target is not mutated: only the objects and arrays along the patched paths
+ * are copied, and everything else is shared with it, so a patch to one driver's
+ * timing leaves every other driver's object as it was. Copies are added to `owned`,
+ * and owned objects are patched in place, so a batch of patches applied with the
+ * same set copies each changed object at most once.
+ */
+export function mergePatch<T>(target: T, source: unknown, owned: WeakSet<object>): T {
+	if (isPlainObject(target) && isPlainObject(source)) {
+		const object: Record<string, unknown> = owned.has(target) ? target : { ...target };
+		owned.add(object);
+		for (const [key, value] of Object.entries(source)) {
+			object[key] = key in object ? mergePatch(object[key], value, owned) : value;
+		}
+		return object as T;
+	}
+
+	if (Array.isArray(target) && isPlainObject(source)) {
+		const list: unknown[] = owned.has(target) ? target : [...target];
+		owned.add(list);
+		for (const [key, value] of Object.entries(source)) {
+			const index = Number(key);
+			if (Number.isInteger(index) && index >= 0 && index < list.length) {
+				list[index] = mergePatch(list[index], value, owned);
+			} else {
+				list.push(value);
+			}
+		}
+		return list as T;
+	}
+
+	return source as T;
+}